@@ -0,0 +1,188 @@
+"""
+Поколенческое кэширование страниц.
+
+Каждой области данных (scope) — например, всей ленте или одной группе —
+соответствует счётчик поколения в кэше. Ключ закэшированной страницы
+включает поколения её областей, поэтому bump() мгновенно делает старые
+копии недостижимыми, а TTL можно держать большим. Для нескольких процессов
+нужен общий кэш-бэкенд: счётчики должны быть видны всем воркерам.
+"""
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from core import metrics, personal, replicas
+
+GENERATION_KEY = 'generation:{}'
+PAGE_KEY = 'page:{}:{}'
+STATS_KEY = 'cache-stats:{}:{}'
+
+
+def _initial_generation():
+    # Счётчик, вытесненный из кэша, должен начаться с нового значения,
+    # иначе станут достижимыми копии страниц со старым номером.
+    return int(time.time() * 1000)
+
+
+def get_generations(scopes):
+    """Текущие поколения областей одним обращением к кэшу."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bump_now(scopes):
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), None)
+
+
+def bump(*scopes):
+    """
+    Сдвигает поколения областей. Повторный сдвиг после коммита не даёт
+    запросу, прочитавшему данные до коммита, закэшировать устаревшую копию.
+    """
+    _bump_now(scopes)
+    transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def _record(scopes, hit):
+    outcome = 'hit' if hit else 'miss'
+    for kind in {scope.partition(':')[0] for scope in scopes}:
+        key = STATS_KEY.format(kind, outcome)
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, None)
+
+
+def get_stats(kinds):
+    """Попадания и промахи по видам областей: {'group': {'hit': 3, ...}}."""
+    keys = {
+        (kind, outcome): STATS_KEY.format(kind, outcome)
+        for kind in kinds
+        for outcome in ('hit', 'miss')
+    }
+    values = cache.get_many(keys.values())
+    stats = {kind: {} for kind in kinds}
+    for (kind, outcome), key in keys.items():
+        stats[kind][outcome] = values.get(key, 0)
+    return stats
+
+
+def is_anonymous(request):
+    """Запрос без cookie сессии: пользователь точно не вошёл."""
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def _cacheable(request, response):
+    # Страница с токеном CSRF или cookie — только для своего клиента.
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def cache_per_generation(get_scopes, timeout=None, personalized=False):
+    """
+    Кэш страниц. Ключ — поколения областей, которые
+    get_scopes(*args, **kwargs) вычисляет по аргументам вью, и полный URL
+    (с ?page= и курсорами), но не cookie: страница общая для всех
+    анонимов. Попадание не загружает ни сессию, ни пользователя; ответы
+    с токеном CSRF или cookie не кэшируются.
+
+    Запросы с cookie сессии идут мимо кэша, а с personalized — получают
+    свою общую копию, собранную без персональных фрагментов: их
+    core.personal подставляет при каждом ответе.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            anonymous = is_anonymous(request)
+            if request.method not in ('GET', 'HEAD') or not (
+                anonymous or personalized
+            ):
+                return view_func(request, *args, **kwargs)
+            scopes = get_scopes(*args, **kwargs)
+            prefix = '.'.join(
+                f'{scope}:{generation}' for scope, generation
+                in zip(scopes, get_generations(scopes))
+            )
+            # Страница, собранная с реплики, годится только до её
+            # следующего обновления (см. core.replicas).
+            if replicas.snapshot():
+                prefix += f'.{replicas.snapshot()}'
+            if not anonymous:
+                prefix += '.personal'
+            url = md5(request.build_absolute_uri().encode()).hexdigest()
+            key = PAGE_KEY.format(prefix, url)
+            cached = cache.get(key)
+            hit = cached is not None
+            if hit:
+                response, holes = cached
+            else:
+                if not anonymous:
+                    personal.start(request)
+                try:
+                    response = view_func(request, *args, **kwargs)
+                finally:
+                    holes = [] if anonymous else personal.stop(request)
+                if _cacheable(request, response):
+                    cache.set(
+                        key, (response, holes),
+                        timeout or settings.FEED_CACHE_TIMEOUT_SEC
+                    )
+            personal.fill(request, response, holes)
+            # Прокси не должен отдавать анонимную копию вошедшим.
+            patch_vary_headers(response, ('Cookie',))
+            _record(scopes, hit=hit)
+            metrics.note('cache:page:hit' if hit else 'cache:page:miss')
+            return response
+        return wrapper
+    return decorator
+
+
+def etag_per_generation(get_scopes):
+    """
+    Условный GET по поколениям: ETag страницы — хэш поколений областей
+    get_scopes(*args, **kwargs) и cookie сессии и CSRF, от которых зависят
+    шапка и формы. Если он совпал с If-None-Match, ответ — 304 после одного
+    обращения к кэшу, без базы и шаблонов.
+    """
+    def etag(request, *args, **kwargs):
+        scopes = get_scopes(*args, **kwargs)
+        parts = [
+            f'{scope}:{generation}' for scope, generation
+            in zip(scopes, get_generations(scopes))
+        ]
+        parts.append(replicas.snapshot())
+        for name in (settings.SESSION_COOKIE_NAME, settings.CSRF_COOKIE_NAME):
+            parts.append(request.COOKIES.get(name, ''))
+        return md5('|'.join(parts).encode()).hexdigest()
+
+    def decorator(view_func):
+        conditional = condition(etag_func=etag)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if response.status_code == 304:
+                metrics.note('cache:page:not_modified')
+            return response
+        return wrapper
+    return decorator
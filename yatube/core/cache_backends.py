@@ -0,0 +1,49 @@
+"""
+Бэкенды кэша Django, которые засекают время обращений для core.metrics.
+"""
+from django.core.cache.backends import locmem
+
+from core import metrics
+
+
+class TimedCacheMixin:
+    def _timed(self, method, *args, **kwargs):
+        with metrics.timer('cache_seconds'):
+            return getattr(super(), method)(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self._timed('add', *args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self._timed('get', *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._timed('set', *args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self._timed('touch', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._timed('delete', *args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self._timed('get_many', *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._timed('set_many', *args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self._timed('delete_many', *args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self._timed('has_key', *args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._timed('incr', *args, **kwargs)
+
+    def clear(self):
+        return self._timed('clear')
+
+
+class LocMemCache(TimedCacheMixin, locmem.LocMemCache):
+    pass
@@ -0,0 +1,99 @@
+"""
+SQLite с настройками для веб-нагрузки.
+
+Отличия от django.db.backends.sqlite3:
+- при подключении выполняются PRAGMA из OPTIONS['pragmas'] (по умолчанию
+  WAL, synchronous=NORMAL, mmap, кэш страниц, busy_timeout, temp_store);
+- транзакции начинаются с BEGIN IMMEDIATE (OPTIONS['transaction_mode']):
+  транзакция, которая сначала читает, а потом пишет, берёт блокировку
+  записи сразу и ждёт её по busy_timeout, а не падает с
+  «database is locked» при попытке записи;
+- запрос вне транзакции, упавший с «database is locked», повторяется до
+  OPTIONS['lock_retries'] раз с растущей паузой.
+
+Постоянные соединения включаются обычным CONN_MAX_AGE.
+"""
+import random
+import re
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+Database = base.Database
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 2**20,
+    # Отрицательное значение — размер в КиБ.
+    'cache_size': -20000,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+PRAGMA_RE = re.compile(r'^\w+$')
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    """Повторяет запросы вне транзакции, упавшие на блокировке базы."""
+    retries = 0
+    delay = 0.0
+
+    def _retry(self, method, *args):
+        attempt = 0
+        while True:
+            try:
+                return method(*args)
+            except Database.OperationalError as error:
+                # Внутри транзакции повтор одного запроса небезопасен:
+                # откатывать и повторять её целиком должен вызывающий.
+                if (
+                    attempt >= self.retries
+                    or 'database is locked' not in str(error)
+                    or self.connection.in_transaction
+                ):
+                    raise
+            time.sleep(self.delay * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # Свои ключи OPTIONS не должны дойти до sqlite3.connect().
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        self.transaction_mode = kwargs.pop(
+            'transaction_mode', 'IMMEDIATE'
+        ).upper()
+        self.lock_retries = kwargs.pop('lock_retries', 5)
+        self.lock_retry_delay = kwargs.pop('lock_retry_delay', 0.05)
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        for name in self.pragmas:
+            if not PRAGMA_RE.match(name):
+                raise ImproperlyConfigured(f'Неверное имя PRAGMA: {name!r}')
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.retries = self.lock_retries
+        cursor.delay = self.lock_retry_delay
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
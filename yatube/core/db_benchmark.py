@@ -0,0 +1,145 @@
+"""
+Пропускная способность SQLite при параллельных чтениях и записях.
+
+Несколько потоков в течение заданного времени выполняют смесь чтений
+(страница ленты) и записей (транзакция «прочитать пост, добавить
+комментарий, обновить счётчик», как в add_comment) на отдельной файловой
+базе. Каждая операция — как отдельный запрос к сайту: после неё
+соединение закрывается, если того требует CONN_MAX_AGE. Прогон
+повторяется для стокового бэкенда и для core.db_backends.sqlite3 с
+настройками из DATABASES['default'].
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+STOCK_ENGINE = 'django.db.backends.sqlite3'
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, pub_date TEXT NOT NULL, '
+    'text TEXT NOT NULL, comments_count INTEGER NOT NULL DEFAULT 0)',
+    'CREATE INDEX post_pub_date ON post (pub_date)',
+    'CREATE TABLE comment (id INTEGER PRIMARY KEY, '
+    'post_id INTEGER NOT NULL REFERENCES post (id), text TEXT NOT NULL)',
+)
+PAGE_SIZE = 10
+
+
+def backends():
+    """Настройки баз для сравнения: {название: DATABASES-словарь}."""
+    tuned = settings.DATABASES['default']
+    return {
+        'stock': {'ENGINE': STOCK_ENGINE},
+        'tuned': {
+            'ENGINE': tuned['ENGINE'],
+            'CONN_MAX_AGE': tuned.get('CONN_MAX_AGE', 0),
+            'OPTIONS': tuned.get('OPTIONS', {}),
+        },
+    }
+
+
+def _populate(connection, posts):
+    with connection.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.executemany(
+            'INSERT INTO post (pub_date, text) VALUES (%s, %s)',
+            [
+                (f'2022-01-01 00:00:{number:09d}', 'Текст публикации. ' * 20)
+                for number in range(posts)
+            ]
+        )
+
+
+def _read(connection, rng, posts):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, pub_date, text, comments_count FROM post '
+            'ORDER BY pub_date DESC LIMIT %s OFFSET %s',
+            [PAGE_SIZE, rng.randrange(max(posts - PAGE_SIZE, 1))]
+        )
+        cursor.fetchall()
+
+
+def _write(connection, rng, posts):
+    post_id = rng.randrange(posts) + 1
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM post WHERE id = %s', [post_id])
+            cursor.fetchone()
+            cursor.execute(
+                'INSERT INTO comment (post_id, text) VALUES (%s, %s)',
+                [post_id, 'Комментарий']
+            )
+            cursor.execute(
+                'UPDATE post SET comments_count = comments_count + 1 '
+                'WHERE id = %s', [post_id]
+            )
+
+
+def _worker(alias, seed, deadline, write_share, posts):
+    rng = random.Random(seed)
+    counts = Counter()
+    connection = connections[alias]
+    try:
+        while time.perf_counter() < deadline:
+            write = rng.random() < write_share
+            try:
+                (_write if write else _read)(connection, rng, posts)
+            except OperationalError:
+                counts['errors'] += 1
+            else:
+                counts['writes' if write else 'reads'] += 1
+            # Как обработчик request_finished после каждого запроса.
+            connection.close_if_unusable_or_obsolete()
+    finally:
+        connection.close()
+    return counts
+
+
+def measure(alias, threads, seconds, write_share, posts):
+    deadline = time.perf_counter() + seconds
+    total = Counter()
+    with ThreadPoolExecutor(threads) as executor:
+        for counts in executor.map(
+            lambda seed: _worker(alias, seed, deadline, write_share, posts),
+            range(threads)
+        ):
+            total.update(counts)
+    return {
+        'reads_per_sec': round(total['reads'] / seconds, 1),
+        'writes_per_sec': round(total['writes'] / seconds, 1),
+        'errors': total['errors'],
+    }
+
+
+def run(threads=8, seconds=5.0, write_share=0.2, posts=2000):
+    """Результаты для каждого из backends() на собственной свежей базе."""
+    directory = tempfile.mkdtemp()
+    results = {}
+    try:
+        for name, database in backends().items():
+            alias = f'db_benchmark_{name}'
+            connections.databases[alias] = {
+                **database,
+                'NAME': os.path.join(directory, f'{name}.sqlite3'),
+            }
+            try:
+                _populate(connections[alias], posts)
+                connections[alias].close()
+                results[name] = measure(
+                    alias, threads, seconds, write_share, posts
+                )
+            finally:
+                connections[alias].close()
+                del connections[alias]
+                del connections.databases[alias]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
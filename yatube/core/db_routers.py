@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from core import replicas
+
+# Сессии всегда читаются с основной базы: иначе сразу после входа
+# пользователь на отстающей реплике оказался бы разлогинен.
+PRIMARY_APPS = ('sessions',)
+
+
+class ReplicaRouter:
+    """Чтения безопасных GET-вью — с реплики, всё остальное — с основной."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return replicas.current()
+
+    def db_for_write(self, model, **hints):
+        replicas.note_write()
+        # Явно: иначе объект, прочитанный с реплики, сохранился бы туда же.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики вместе с копией файла.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
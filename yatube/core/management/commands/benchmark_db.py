@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import db_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность параллельных чтений и '
+            'записей SQLite со стоковым бэкендом и с настроенным '
+            'core.db_backends.sqlite3.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--seconds', type=float, default=5.0,
+            help='Длительность прогона каждого бэкенда.'
+        )
+        parser.add_argument(
+            '--write-share', type=float, default=0.2,
+            help='Доля операций записи.'
+        )
+        parser.add_argument(
+            '--posts', type=int, default=2000,
+            help='Сколько публикаций в базе перед прогоном.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def handle(self, *args, **options):
+        results = db_benchmark.run(
+            options['threads'], options['seconds'], options['write_share'],
+            options['posts']
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:6} чтений/с {result["reads_per_sec"]:9.1f}  '
+                f'записей/с {result["writes_per_sec"]:8.1f}  '
+                f'ошибок {result["errors"]}'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(results, stream, ensure_ascii=False, indent=2)
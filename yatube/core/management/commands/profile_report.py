@@ -0,0 +1,32 @@
+import io
+
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = ('Сводит профили выборочного профилировщика и выводит самые '
+            'тяжёлые функции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Только профили этой вью.')
+        parser.add_argument(
+            '--sort', default='cumulative',
+            help='Ключ сортировки pstats: cumulative, tottime, calls...'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=30, help='Сколько функций вывести.'
+        )
+
+    def handle(self, *args, **options):
+        paths = profiling.find(options['view'])
+        stats = profiling.aggregate(paths)
+        if stats is None:
+            self.stdout.write('Профилей нет')
+            return
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(f'Профилей: {len(paths)}')
+        self.stdout.write(output.getvalue())
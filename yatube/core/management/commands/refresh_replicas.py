@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу в файлы реплик DATABASE_REPLICAS '
+            'через backup API SQLite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Обновлять раз в столько секунд, пока не остановят.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                started = time.perf_counter()
+                replicas.refresh(alias)
+                self.stdout.write(
+                    f'{alias}: {time.perf_counter() - started:.2f} с'
+                )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,356 @@
+"""
+Метрики производительности по вью в формате Prometheus.
+
+MetricsMiddleware собирает для каждого ответа время, число и время
+SQL-запросов, время рендера шаблонов (см. core.template_backends),
+обращений к кэшу (core.cache_backends) и поиска миниатюр, попадания и
+промахи кэшей и размер ответа. Сборщик текущего запроса хранится в
+threading.local, так что код в глубине (кэш, теги) просто вызывает note()
+или timer(). Каждый процесс копит метрики у себя и раз в
+METRICS_FLUSH_INTERVAL_SEC сбрасывает их в свой файл в METRICS_DIR;
+экспорт складывает файлы всех процессов, а файлы завершившихся сливает в
+один, чтобы суммы не уменьшались.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+HELP = {
+    'yatube_request_duration_seconds': ('histogram', 'Время ответа вью.'),
+    'yatube_response_size_bytes': ('histogram', 'Размер ответа.'),
+    'yatube_requests_total': ('counter', 'Ответы по кодам статуса.'),
+    'yatube_db_queries_total': ('counter', 'SQL-запросы.'),
+    'yatube_db_query_seconds_total': ('counter', 'Время SQL-запросов.'),
+    'yatube_template_render_seconds_total': (
+        'counter', 'Время рендера шаблонов.'
+    ),
+    'yatube_cache_seconds_total': ('counter', 'Время обращений к кэшу.'),
+    'yatube_thumbnail_seconds_total': (
+        'counter', 'Время поиска миниатюр.'
+    ),
+    'yatube_cache_requests_total': (
+        'counter', 'Обращения к кэшам страниц и карточек.'
+    ),
+    'yatube_image_stage_seconds': (
+        'histogram', 'Этапы обработки загруженных картинок.'
+    ),
+}
+
+_local = threading.local()
+
+
+def start_request():
+    """Начинает сбор для текущего запроса."""
+    _local.current = Counter()
+    _local.running = set()
+    return _local.current
+
+
+def finish_request():
+    current = getattr(_local, 'current', None)
+    _local.current = None
+    _local.running = set()
+    return current
+
+
+def note(name, amount=1):
+    """Добавляет amount к величине name текущего запроса, если он идёт."""
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current[name] += amount
+
+
+@contextmanager
+def timer(name):
+    """
+    Добавляет к name время выполнения блока. Вложенные замеры того же
+    name не считаются (get_many кэша сам зовёт get).
+    """
+    current = getattr(_local, 'current', None)
+    if current is None or name in _local.running:
+        yield
+        return
+    _local.running.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.running.discard(name)
+        current[name] += time.perf_counter() - started
+
+
+class Registry:
+    """Счётчики и гистограммы одного процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[self._key(name, labels)] += value
+
+    def observe(self, name, labels, value, buckets):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(key, {
+                'buckets': list(buckets),
+                'counts': [0] * len(buckets),
+                'sum': 0.0,
+                'count': 0,
+            })
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, dict(labels), histogram]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def load(self, data):
+        """Прибавляет данные другого процесса (формат dump())."""
+        for name, labels, value in data['counters']:
+            self.inc(name, labels, value)
+        for name, labels, histogram in data['histograms']:
+            key = self._key(name, labels)
+            with self.lock:
+                mine = self.histograms.setdefault(key, {
+                    'buckets': histogram['buckets'],
+                    'counts': [0] * len(histogram['buckets']),
+                    'sum': 0.0,
+                    'count': 0,
+                })
+                mine['counts'] = [
+                    a + b for a, b in zip(mine['counts'], histogram['counts'])
+                ]
+                mine['sum'] += histogram['sum']
+                mine['count'] += histogram['count']
+
+
+registry = Registry()
+_last_flush = 0.0
+
+
+def record(view, method, status, seconds, size, values):
+    """Учитывает законченный запрос; values — собранное через note()."""
+    labels = {'view': view}
+    registry.observe(
+        'yatube_request_duration_seconds', labels, seconds, LATENCY_BUCKETS
+    )
+    registry.observe(
+        'yatube_response_size_bytes', labels, size, SIZE_BUCKETS
+    )
+    registry.inc(
+        'yatube_requests_total',
+        {'view': view, 'method': method, 'status': str(status)}
+    )
+    registry.inc('yatube_db_queries_total', labels, values['db_queries'])
+    registry.inc(
+        'yatube_db_query_seconds_total', labels, values['db_seconds']
+    )
+    registry.inc(
+        'yatube_template_render_seconds_total', labels,
+        values['template_seconds']
+    )
+    registry.inc('yatube_cache_seconds_total', labels, values['cache_seconds'])
+    registry.inc(
+        'yatube_thumbnail_seconds_total', labels, values['thumbnail_seconds']
+    )
+    for name, amount in values.items():
+        # Имена вида cache:page:hit -> cache="page", result="hit".
+        if name.startswith('cache:'):
+            _, cache, result = name.split(':')
+            registry.inc(
+                'yatube_cache_requests_total',
+                {'view': view, 'cache': cache, 'result': result}, amount
+            )
+    maybe_flush()
+
+
+DEAD_PREFIX = 'dead-'
+_process = {'pid': None, 'name': None}
+
+
+def _name():
+    """
+    Имя файла этого процесса: pid и случайный суффикс, так что процесс,
+    получивший pid завершившегося, не перепишет его данные.
+    """
+    pid = os.getpid()
+    if _process['pid'] != pid:
+        _process.update(pid=pid, name=f'{pid}-{uuid.uuid4().hex}')
+    return _process['name']
+
+
+def observe(name, labels, seconds):
+    """Длительность вне разбивки по вью (например, этап обработки)."""
+    registry.observe(name, labels, seconds, LATENCY_BUCKETS)
+
+
+def _path(name):
+    return os.path.join(settings.METRICS_DIR, f'{name}.json')
+
+
+def _write(data, path):
+    handle, temp = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+    with os.fdopen(handle, 'w') as stream:
+        json.dump(data, stream)
+    os.replace(temp, path)
+
+
+def flush():
+    """Атомарно переписывает файл метрик этого процесса."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write(registry.dump(), _path(_name()))
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL_SEC:
+        flush()
+
+
+def _alive(pid):
+    if os.name != 'posix':
+        # Без kill(pid, 0) живость не проверить: файлы просто остаются.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _is_dead(name):
+    pid = name[:-len('.json')].partition('-')[0]
+    return pid.isdigit() and not _alive(int(pid))
+
+
+def _load(total, path):
+    try:
+        with open(path) as stream:
+            total.load(json.load(stream))
+    except (OSError, ValueError):
+        # Файл мог исчезнуть или быть недописан другим процессом.
+        pass
+
+
+def merge_dead():
+    """
+    Сливает файлы завершившихся процессов и прежние сводки в одну сводку
+    dead-*.json. Файл сначала забирается переименованием, так что
+    параллельный экспорт не сольёт его второй раз.
+    """
+    names = [
+        name for name in os.listdir(settings.METRICS_DIR)
+        if name.endswith('.json')
+    ]
+    dead = [name for name in names if _is_dead(name)]
+    if not dead:
+        return
+    claimed = []
+    for name in dead + [n for n in names if n.startswith(DEAD_PREFIX)]:
+        path = os.path.join(settings.METRICS_DIR, name)
+        claim = f'{path}.{_name()}.merging'
+        try:
+            os.rename(path, claim)
+        except OSError:
+            continue
+        claimed.append(claim)
+    merged = Registry()
+    for path in claimed:
+        _load(merged, path)
+    _write(merged.dump(), _path(DEAD_PREFIX + uuid.uuid4().hex))
+    for path in claimed:
+        os.remove(path)
+
+
+def collect():
+    """Сумма метрик всех процессов, включая свежие данные этого."""
+    flush()
+    merge_dead()
+    total = Registry()
+    for name in os.listdir(settings.METRICS_DIR):
+        if name.endswith('.json'):
+            _load(total, os.path.join(settings.METRICS_DIR, name))
+    return total
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())
+    ) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(source):
+    """Текстовый формат экспорта Prometheus."""
+    series = defaultdict(list)
+    for (name, labels), value in sorted(source.counters.items()):
+        series[name].append(f'{name}{_labels(dict(labels))} {_number(value)}')
+    for (name, labels), histogram in sorted(source.histograms.items()):
+        labels = dict(labels)
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            series[name].append(
+                f'{name}_bucket{_labels(labels, le=_number(bound))} {count}'
+            )
+        series[name].append(
+            f'{name}_bucket{_labels(labels, le="+Inf")} {histogram["count"]}'
+        )
+        series[name].append(
+            f'{name}_sum{_labels(labels)} {_number(histogram["sum"])}'
+        )
+        series[name].append(
+            f'{name}_count{_labels(labels)} {histogram["count"]}'
+        )
+    lines = []
+    for name in sorted(series):
+        kind, text = HELP.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(series[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,95 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger('core.access')
+
+# Имя в Server-Timing и в журнале -> величина сборщика.
+TIMINGS = (
+    ('db', 'db_seconds'),
+    ('template', 'template_seconds'),
+    ('cache', 'cache_seconds'),
+    ('thumbnail', 'thumbnail_seconds'),
+)
+
+
+def _timed_query(execute, sql, params, many, context):
+    metrics.note('db_queries')
+    with metrics.timer('db_seconds'):
+        return execute(sql, params, many, context)
+
+
+def server_timing(values, total):
+    """
+    Значение заголовка Server-Timing. Отрезки пересекаются: поиск
+    миниатюр включает кэш и SQL, шаблоны — всё, что вызвано из них.
+    """
+    entries = [
+        f'{name};dur={values[key] * 1000:.1f}' for name, key in TIMINGS
+    ]
+    entries[0] += f';desc="{values["db_queries"]} queries"'
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики каждого запроса (см. core.metrics), отдаёт разбивку
+    времени в заголовке Server-Timing и пишет строку JSON в журнал
+    core.access.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_timed_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            values = metrics.finish_request()
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        metrics.record(
+            view=view,
+            method=request.method,
+            status=response.status_code,
+            seconds=total,
+            size=size,
+            values=values
+        )
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(values, total)
+        self.log(request, response, view, values, total, size)
+        return response
+
+    @staticmethod
+    def log(request, response, view, values, total, size):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        entry = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'bytes': size,
+            'queries': values['db_queries'],
+            'total_ms': round(total * 1000, 1),
+        }
+        for name, key in TIMINGS:
+            entry[f'{name}_ms'] = round(values[key] * 1000, 1)
+        logger.info(json.dumps(entry, ensure_ascii=False))
@@ -0,0 +1,39 @@
+import cProfile
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+
+from core import profiling
+
+
+class SamplingProfilerMiddleware:
+    """
+    Профилирует выбранные запросы от вызова вью до готового ответа.
+    Если профилирование не настроено, middleware не подключается вовсе.
+    """
+
+    def __init__(self, get_response):
+        if not profiling.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profiler = getattr(request, '_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            profiling.save(
+                profiler,
+                request.resolver_match.view_name,
+                time.perf_counter() - request._profile_started
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not profiling.should_profile(
+            request, request.resolver_match.view_name
+        ):
+            return
+        request._profile_started = time.perf_counter()
+        request._profiler = cProfile.Profile()
+        request._profiler.enable()
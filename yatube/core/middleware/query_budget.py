@@ -0,0 +1,56 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core.queries import QueryBudgetExceeded, QueryRecorder, get_budget
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryBudgetMiddleware:
+    """Проверяет бюджет запросов и повторы запросов каждого ответа."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match.namespace in settings.QUERY_BUDGET_IGNORE_NAMESPACES:
+            return
+        request.query_budget = get_budget(view_func, match.view_name)
+
+    def check(self, request, recorder):
+        if not hasattr(request, 'query_budget'):
+            return
+        view_name = request.resolver_match.view_name
+        problems = []
+        budget = request.query_budget
+        if budget is not None and recorder.total > budget:
+            problems.append(
+                f'запросов {recorder.total} при бюджете {budget}'
+            )
+        repeated = recorder.repeated(settings.QUERY_BUDGET_MAX_REPEATS)
+        if repeated:
+            problems.append(
+                f'запрос повторяется {repeated[0][1]} раз (N+1?)'
+            )
+        if not problems:
+            return
+        message = (
+            f'{view_name} {request.path}: {"; ".join(problems)}\n'
+            f'{recorder.report()}'
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
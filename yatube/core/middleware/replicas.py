@@ -0,0 +1,36 @@
+from django.conf import settings
+
+from core import replicas
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтения вью из REPLICA_VIEWS на реплику (см. core.replicas)
+    и ставит куку «читать с основной» после записи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = replicas.finish_request()
+        if wrote:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in SAFE_METHODS
+            and request.resolver_match.view_name in settings.REPLICA_VIEWS
+            and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+        ):
+            replicas.choose()
@@ -0,0 +1,93 @@
+"""
+Персональные фрагменты страниц («дырки» в общем кэше).
+
+Шапка, кнопка подписки и другие куски, которые зависят от пользователя,
+вставляются тегом {% personal 'имя' ключ=значение %}. Обычно он просто
+рендерит шаблон фрагмента. Когда страница собирается для общего кэша
+вошедших пользователей (core.cache.cache_per_generation), тег оставляет
+метку, а фрагменты подставляются в готовую страницу при каждом ответе
+(fill) — из маленького кэша на пользователя или рендером шаблона
+фрагмента с контекстом из его функции.
+"""
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from core import metrics
+
+MARKER = '<!--personal:{}-->'
+FRAGMENT_KEY = 'personal:{}:{}:{}:{}'
+
+_fragments = {}
+
+
+def fragment(name, template_name, scopes=None):
+    """
+    Регистрирует фрагмент name: декорируемая функция (request, **kwargs)
+    возвращает контекст шаблона template_name. Готовый фрагмент кэшируется
+    на пользователя, пока не сдвинутся поколения областей
+    scopes(request, **kwargs) (core.cache).
+    """
+    def decorator(get_context):
+        _fragments[name] = (template_name, get_context, scopes)
+        return get_context
+    return decorator
+
+
+def _cache_key(request, name, kwargs, scopes):
+    # core.cache сам импортирует этот модуль.
+    from core.cache import get_generations
+
+    generations = (
+        get_generations(scopes(request, **kwargs)) if scopes else []
+    )
+    arguments = md5(repr(sorted(kwargs.items())).encode()).hexdigest()
+    return FRAGMENT_KEY.format(
+        name, request.user.pk, arguments,
+        '.'.join(map(str, generations))
+    )
+
+
+def render(request, name, kwargs):
+    """Фрагмент name для пользователя запроса."""
+    template_name, get_context, scopes = _fragments[name]
+    if request is None or not hasattr(request, 'user'):
+        return render_to_string(template_name, get_context(request, **kwargs))
+    key = _cache_key(request, name, kwargs, scopes)
+    content = cache.get(key)
+    if content is None:
+        metrics.note('cache:fragment:miss')
+        content = render_to_string(
+            template_name, get_context(request, **kwargs), request
+        )
+        cache.set(key, content, settings.FEED_CACHE_TIMEOUT_SEC)
+    else:
+        metrics.note('cache:fragment:hit')
+    return content
+
+
+def start(request):
+    """Дальше тег personal в этом запросе оставляет метки."""
+    request.personal_holes = []
+
+
+def stop(request):
+    """Метки страницы: [(имя фрагмента, kwargs)] по порядку номеров."""
+    holes = request.personal_holes
+    del request.personal_holes
+    return holes
+
+
+def fill(request, response, holes):
+    """Подставляет в страницу фрагменты пользователя запроса."""
+    if not holes:
+        return response
+    content = response.content.decode(response.charset)
+    for number, (name, kwargs) in enumerate(holes):
+        content = content.replace(
+            MARKER.format(number), render(request, name, kwargs)
+        )
+    response.content = content
+    return response
@@ -0,0 +1,99 @@
+"""
+Выборочное профилирование запросов в продакшене.
+
+SamplingProfilerMiddleware профилирует cProfile'ом долю
+PROFILER_SAMPLE_RATE запросов, все запросы к вью из PROFILER_VIEWS и
+запросы с заголовком PROFILER_HEADER, равным PROFILER_TOKEN. Профиль
+пишется в PROFILER_DIR сжатым файлом, в имени которого — время, вью и
+длительность; команда profile_report сводит профили вместе.
+"""
+import gzip
+import itertools
+import marshal
+import os
+import pstats
+import random
+import time
+
+from django.conf import settings
+
+SUFFIX = '.prof.gz'
+# Номер профиля в процессе: быстрые запросы к одной вью в одну секунду
+# иначе получили бы одно имя файла.
+_sequence = itertools.count()
+
+
+def enabled():
+    """Есть ли хоть один способ включить профилирование."""
+    return bool(
+        settings.PROFILER_SAMPLE_RATE
+        or settings.PROFILER_VIEWS
+        or settings.PROFILER_TOKEN
+    )
+
+
+def should_profile(request, view_name):
+    if view_name in settings.PROFILER_VIEWS:
+        return True
+    token = settings.PROFILER_TOKEN
+    header = 'HTTP_' + settings.PROFILER_HEADER.upper().replace('-', '_')
+    if token and request.META.get(header) == token:
+        return True
+    rate = settings.PROFILER_SAMPLE_RATE
+    return bool(rate) and random.random() < rate
+
+
+def save(profiler, view_name, elapsed):
+    """Сохраняет профиль; возвращает путь к файлу."""
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    profiler.create_stats()
+    name = '{}-{}-{}-{:.0f}ms-{}{}'.format(
+        time.strftime('%Y%m%d%H%M%S'),
+        os.getpid(),
+        view_name.replace(':', '.'),
+        elapsed * 1000,
+        next(_sequence),
+        SUFFIX
+    )
+    path = os.path.join(settings.PROFILER_DIR, name)
+    with gzip.open(path, 'wb') as stream:
+        marshal.dump(profiler.stats, stream)
+    return path
+
+
+def view_of(path):
+    """Имя вью из имени файла профиля."""
+    return os.path.basename(path).split('-')[2].replace('.', ':')
+
+
+class _Loaded:
+    # pstats.Stats принимает объект с create_stats() и stats.
+    def __init__(self, path):
+        with gzip.open(path, 'rb') as stream:
+            self.stats = marshal.load(stream)
+
+    def create_stats(self):
+        pass
+
+
+def aggregate(paths):
+    """Один pstats.Stats по всем профилям; None, если профилей нет."""
+    stats = None
+    for path in paths:
+        if stats is None:
+            stats = pstats.Stats(_Loaded(path))
+        else:
+            stats.add(_Loaded(path))
+    return stats
+
+
+def find(view_name=None):
+    """Файлы профилей, при желании — только одной вью."""
+    if not os.path.isdir(settings.PROFILER_DIR):
+        return []
+    return sorted(
+        os.path.join(settings.PROFILER_DIR, name)
+        for name in os.listdir(settings.PROFILER_DIR)
+        if name.endswith(SUFFIX)
+        and (view_name is None or view_of(name) == view_name)
+    )
@@ -0,0 +1,118 @@
+"""
+Бюджет SQL-запросов на вью.
+
+Бюджет задаётся декоратором query_budget или настройкой QUERY_BUDGETS
+({'posts:index': 8}); вью без бюджета получают QUERY_BUDGET_DEFAULT.
+QueryBudgetMiddleware считает запросы каждого ответа и ищет повторы одного
+и того же запроса (признак N+1). При нарушении в строгом режиме
+(QUERY_BUDGET_STRICT — в разработке и тестах) бросается
+QueryBudgetExceeded, иначе пишется предупреждение в лог.
+"""
+import os
+import re
+import sys
+from collections import Counter
+
+import django
+from django.conf import settings
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+SPACES_RE = re.compile(r'\s+')
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Кадры, которые не бывают источником запроса.
+IGNORED_PATHS = (
+    os.path.join(os.path.dirname(django.__file__), 'db'),
+    os.path.join(CORE_DIR, 'middleware'),
+    os.path.join(CORE_DIR, 'queries.py'),
+)
+# Управление транзакцией — цена atomic(), а не запросы вью.
+TRANSACTION_RE = re.compile(r'(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO) ')
+
+
+class QueryBudgetExceeded(Exception):
+    """Вью сделала больше запросов, чем разрешено, или повторяет запрос."""
+
+
+def query_budget(limit):
+    """Декоратор: вью разрешено не больше limit запросов на ответ."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def fingerprint(sql):
+    """Форма запроса: без лишних пробелов и с IN (...) любой длины."""
+    return SPACES_RE.sub(' ', IN_LIST_RE.sub('IN (...)', sql)).strip()
+
+
+def _origin():
+    # Первый кадр стека из кода проекта (не из Django и не из middleware);
+    # если такого нет — первый кадр вне django.db.
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(IGNORED_PATHS):
+            if fallback is None:
+                fallback = frame
+            if (
+                filename.startswith(settings.BASE_DIR)
+                and 'site-packages' not in filename
+            ):
+                fallback = frame
+                break
+        frame = frame.f_back
+    if fallback is None:
+        return 'неизвестно'
+    return (
+        f'{os.path.relpath(fallback.f_code.co_filename, settings.BASE_DIR)}:'
+        f'{fallback.f_lineno} in {fallback.f_code.co_name}'
+    )
+
+
+class QueryRecorder:
+    """
+    Обёртка для connection.execute_wrapper: считает запросы по формам
+    и запоминает, откуда каждая форма была вызвана впервые.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if TRANSACTION_RE.match(sql):
+            return execute(sql, params, many, context)
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        if shape not in self.origins:
+            self.origins[shape] = _origin()
+        return execute(sql, params, many, context)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def repeated(self, limit):
+        """Формы, выполненные больше limit раз, от самых частых."""
+        return [
+            (shape, count) for shape, count in self.counts.most_common()
+            if count > limit
+        ]
+
+    def report(self, top=5):
+        return '\n'.join(
+            f'  {count}× {shape[:200]} ({self.origins[shape]})'
+            for shape, count in self.counts.most_common(top)
+        )
+
+
+def get_budget(view_func, view_name):
+    """Бюджет вью: из декоратора, из QUERY_BUDGETS или по умолчанию."""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        budget = settings.QUERY_BUDGETS.get(
+            view_name, settings.QUERY_BUDGET_DEFAULT
+        )
+    return budget
@@ -0,0 +1,95 @@
+"""
+Реплики базы только для чтения.
+
+Безопасные GET-вью из REPLICA_VIEWS читают с одной из реплик
+DATABASE_REPLICAS (см. core.db_routers.ReplicaRouter и
+ReplicaMiddleware). Реплика — копия файла основной базы, снятая
+backup API SQLite командой refresh_replicas; пока файла нет, реплика не
+используется. Пользователь, который только что писал в базу, получает
+куку REPLICA_STICKY_COOKIE и REPLICA_STICKY_SECONDS читает с основной
+базы: отставание реплики его не касается. Окно должно быть больше
+интервала обновления реплик.
+"""
+import os
+import random
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_local = threading.local()
+
+
+def start_request():
+    _local.alias = None
+    _local.used = None
+    _local.snapshot = None
+    _local.wrote = False
+
+
+def finish_request():
+    """Сбрасывает выбор реплики; возвращает, писал ли запрос в базу."""
+    wrote = getattr(_local, 'wrote', False)
+    used = getattr(_local, 'used', None)
+    if used is not None:
+        # Соединение держит открытым файл, который refresh() подменит.
+        connections[used].close()
+    start_request()
+    return wrote
+
+
+def available():
+    """{реплика: время изменения файла} для реплик, файл которых есть."""
+    found = {}
+    for alias in settings.DATABASE_REPLICAS:
+        try:
+            found[alias] = os.stat(
+                connections[alias].settings_dict['NAME']
+            ).st_mtime_ns
+        except OSError:
+            continue
+    return found
+
+
+def choose():
+    """Переключает текущий запрос на случайную доступную реплику."""
+    found = available()
+    if found:
+        _local.alias = _local.used = random.choice(list(found))
+        _local.snapshot = found[_local.alias]
+    return _local.alias
+
+
+def current():
+    """Реплика для чтений текущего запроса или None."""
+    return getattr(_local, 'alias', None)
+
+
+def snapshot():
+    """Метка копии, с которой читает запрос: для ключей кэша страниц."""
+    alias = current()
+    return f'{alias}@{_local.snapshot}' if alias else ''
+
+
+def note_write():
+    _local.wrote = True
+    # Дальше в этом запросе читаем свои же записи.
+    _local.alias = None
+
+
+def refresh(alias):
+    """Атомарно заменяет файл реплики свежей копией основной базы."""
+    target = connections[alias].settings_dict['NAME']
+    temp = f'{target}.tmp'
+    source = connections[DEFAULT_DB_ALIAS]
+    source.ensure_connection()
+    destination = sqlite3.connect(temp)
+    try:
+        source.connection.backup(destination)
+        # Копия WAL-базы тоже в WAL; реплике, которую подменяют целиком,
+        # нужен обычный журнал без файлов -wal и -shm рядом.
+        destination.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        destination.close()
+    os.replace(temp, target)
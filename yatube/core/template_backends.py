@@ -0,0 +1,29 @@
+"""
+Шаблонный бэкенд Django, который засекает время рендера для core.metrics.
+
+Замеряется только рендер верхнего уровня (render() или TemplateResponse);
+include и extends внутри него в это время уже входят.
+"""
+from django.template.backends import django as django_backend
+
+from core import metrics
+
+
+class Template:
+    def __init__(self, template):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        with metrics.timer('template_seconds'):
+            return self._wrapped.render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name))
@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core import personal as fragments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def personal(context, name, **kwargs):
+    """
+    Персональный фрагмент name (core.personal) или, если страница
+    собирается для общего кэша, метка на его месте.
+    """
+    request = context.get('request')
+    holes = getattr(request, 'personal_holes', None)
+    if holes is None:
+        return mark_safe(fragments.render(request, name, kwargs))
+    holes.append((name, kwargs))
+    return mark_safe(fragments.MARKER.format(len(holes) - 1))
@@ -1,7 +1,35 @@
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import resolve, reverse
+
+from posts.models import Post
+
+from . import db_benchmark, metrics, profiling, replicas
+from .db_routers import ReplicaRouter
+from .middleware.query_budget import QueryBudgetMiddleware
+from .queries import QueryBudgetExceeded, fingerprint
 
 User = get_user_model()
+TEMP_PROFILER_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_METRICS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class CoreViewsTests(TestCase):
@@ -17,3 +45,349 @@ class CoreViewsTests(TestCase):
             with self.subTest(url=url):
                 response = client.get(url, follow=True)
                 self.assertTemplateUsed(response, template)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self) -> None:
+        self.guest_client = Client()
+        self.author = User.objects.create(username='Im_author')
+
+    def test_fingerprint(self):
+        """Списки IN (...) разной длины дают одну форму запроса."""
+        self.assertEqual(
+            fingerprint('SELECT *  FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)')
+        )
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:search': 1}, QUERY_BUDGET_STRICT=True
+    )
+    def test_budget_decorator_wins_over_settings(self):
+        """Бюджет из декоратора вью важнее QUERY_BUDGETS."""
+        response = self.guest_client.get(reverse('posts:search'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(
+        QUERY_BUDGETS={'about:author': 0}, QUERY_BUDGET_STRICT=True
+    )
+    def test_strict_mode_raises(self):
+        """В строгом режиме превышение бюджета роняет запрос."""
+        self.guest_client.force_login(self.author)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'бюджете 0'):
+            self.guest_client.get(reverse('about:author'))
+
+    @override_settings(QUERY_BUDGET_STRICT=False, QUERY_BUDGET_MAX_REPEATS=2)
+    def test_repeats_are_logged_with_origin(self):
+        """Повтор одного запроса попадает в лог вместе с местом вызова."""
+        def get_response(request):
+            for _ in range(3):
+                User.objects.filter(pk=self.author.pk).exists()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.resolver_match = resolve(reverse('posts:index'))
+        middleware = QueryBudgetMiddleware(get_response)
+        middleware.process_view(request, get_response, (), {})
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            middleware(request)
+        self.assertIn('повторяется 3 раз', logs.output[0])
+        self.assertIn('core/tests.py', logs.output[0])
+
+
+@override_settings(
+    PROFILER_DIR=TEMP_PROFILER_DIR,
+    PROFILER_SAMPLE_RATE=0.0,
+    PROFILER_VIEWS=('posts:index',),
+    PROFILER_TOKEN='secret'
+)
+class ProfilerTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILER_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        shutil.rmtree(TEMP_PROFILER_DIR, ignore_errors=True)
+        self.guest_client = Client()
+
+    def test_selected_requests_are_profiled(self):
+        """Профилируются вью из PROFILER_VIEWS и запросы с токеном."""
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('about:author'))
+        self.guest_client.get(reverse('about:tech'), HTTP_X_PROFILE='secret')
+        self.guest_client.get(reverse('about:tech'), HTTP_X_PROFILE='wrong')
+        self.assertEqual(
+            sorted(map(profiling.view_of, profiling.find())),
+            ['about:tech', 'posts:index']
+        )
+
+    def test_report(self):
+        for _ in range(2):
+            self.guest_client.get(reverse('posts:index'))
+        out = StringIO()
+        call_command('profile_report', '--view=posts:index', stdout=out)
+        self.assertIn('Профилей: 2', out.getvalue())
+        self.assertIn('function calls', out.getvalue())
+
+    @override_settings(PROFILER_VIEWS=(), PROFILER_TOKEN='')
+    def test_disabled_middleware_is_not_loaded(self):
+        response = Client().get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(profiling.find(), [])
+
+
+@override_settings(METRICS_DIR=TEMP_METRICS_DIR)
+class MetricsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+        cache.clear()
+        metrics.registry = metrics.Registry()
+        self.guest_client = Client()
+        self.staff_client = Client()
+        self.staff_client.force_login(
+            User.objects.create(username='staff', is_staff=True)
+        )
+
+    def scrape(self):
+        response = self.staff_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_staff_only(self):
+        response = self.guest_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_view_breakdown(self):
+        """Для вью есть гистограмма, SQL, шаблоны и кэш страницы."""
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('posts:index'))
+        text = self.scrape()
+        for line in (
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            'yatube_request_duration_seconds_bucket'
+            '{le="+Inf",view="posts:index"} 2',
+            'yatube_requests_total'
+            '{method="GET",status="200",view="posts:index"} 2.0',
+            'yatube_cache_requests_total'
+            '{cache="page",result="hit",view="posts:index"} 1',
+            'yatube_cache_requests_total'
+            '{cache="page",result="miss",view="posts:index"} 1',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', text)
+        self.assertIn(
+            'yatube_template_render_seconds_total{view="posts:index"}', text
+        )
+        self.assertIn('# TYPE yatube_response_size_bytes histogram', text)
+
+    def test_processes_are_summed(self):
+        """Файлы других процессов складываются с данными этого."""
+        self.guest_client.get(reverse('about:tech'))
+        metrics.flush()
+        with open(metrics._path(metrics._name())) as stream:
+            data = json.load(stream)
+        with open(metrics._path('other'), 'w') as stream:
+            json.dump(data, stream)
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="about:tech"} 2',
+            self.scrape()
+        )
+
+    def test_dead_processes_are_merged(self):
+        """Файлы завершившихся процессов сливаются, суммы не уменьшаются."""
+        self.guest_client.get(reverse('about:tech'))
+        metrics.flush()
+        with open(metrics._path(metrics._name())) as stream:
+            data = json.load(stream)
+        finished = subprocess.Popen([sys.executable, '-c', ''])
+        finished.wait()
+        for suffix in ('a', 'b'):
+            with open(metrics._path(f'{finished.pid}-{suffix}'), 'w') as out:
+                json.dump(data, out)
+        line = 'yatube_request_duration_seconds_count{view="about:tech"} 3'
+        self.assertIn(line, self.scrape())
+        self.assertIn(line, self.scrape())
+        names = os.listdir(TEMP_METRICS_DIR)
+        self.assertFalse([
+            name for name in names if name.startswith(f'{finished.pid}-')
+        ])
+        self.assertEqual(
+            len([name for name in names if name.startswith('dead-')]), 1
+        )
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_header(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        names = [
+            entry.split(';')[0]
+            for entry in response['Server-Timing'].split(', ')
+        ]
+        self.assertEqual(
+            names, ['db', 'template', 'cache', 'thumbnail', 'total']
+        )
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="')
+
+    def test_access_log(self):
+        with self.assertLogs('core.access', 'INFO') as logs:
+            self.guest_client.get(reverse('posts:index'))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['view'], 'posts:index')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['cache_ms'] + entry['template_ms'], 0)
+
+    def test_nested_timers_are_not_summed(self):
+        values = metrics.start_request()
+        try:
+            with metrics.timer('cache_seconds'):
+                with metrics.timer('cache_seconds'):
+                    pass
+        finally:
+            metrics.finish_request()
+        self.assertEqual(list(values), ['cache_seconds'])
+        self.assertGreater(values['cache_seconds'], 0)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.alias = 'backend_test'
+        connections.databases[self.alias] = {
+            'ENGINE': 'core.db_backends.sqlite3',
+            'NAME': self.path,
+            'OPTIONS': {
+                'pragmas': {'busy_timeout': 0},
+                'lock_retries': 10,
+                'lock_retry_delay': 0.02,
+            },
+        }
+
+    def tearDown(self) -> None:
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.databases[self.alias]
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def pragma(self, name):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 0)
+
+    def test_retries_while_locked(self):
+        """Запись ждёт, пока другой процесс держит блокировку."""
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        other = sqlite3.connect(self.path, check_same_thread=False)
+        other.isolation_level = None
+        other.execute('BEGIN IMMEDIATE')
+
+        def release():
+            time.sleep(0.1)
+            other.execute('COMMIT')
+
+        thread = threading.Thread(target=release)
+        thread.start()
+        try:
+            with connections[self.alias].cursor() as cursor:
+                cursor.execute('INSERT INTO item DEFAULT VALUES')
+        finally:
+            thread.join()
+            other.close()
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM item')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_benchmark(self):
+        results = db_benchmark.run(threads=2, seconds=0.2, posts=50)
+        self.assertEqual(set(results), {'stock', 'tuned'})
+        self.assertGreater(results['tuned']['reads_per_sec'], 0)
+        self.assertEqual(results['tuned']['errors'], 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaTests(TransactionTestCase):
+    # backup API не копирует базу с открытой транзакцией записи.
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        connections.databases['replica_test'] = {
+            'ENGINE': 'core.db_backends.sqlite3',
+            'NAME': os.path.join(self.directory, 'replica.sqlite3'),
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {'pragmas': {'journal_mode': 'DELETE'}},
+        }
+        self.author = User.objects.create(username='Im_author')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def tearDown(self) -> None:
+        # Через ORM, чтобы сигналы убрали посты и из поискового индекса.
+        Post.objects.all().delete()
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.databases['replica_test']
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def index_posts(self, client):
+        response = client.get(reverse('posts:index'))
+        return list(response.context['page_obj'])
+
+    def test_reads_from_replica_until_refresh(self):
+        Post.objects.create(author=self.author, text='В реплике')
+        replicas.refresh('replica_test')
+        post = Post.objects.create(author=self.author, text='Только в базе')
+        self.assertNotIn(post, self.index_posts(Client()))
+        replicas.refresh('replica_test')
+        self.assertIn(post, self.index_posts(Client()))
+
+    def test_without_replica_file_reads_primary(self):
+        post = Post.objects.create(author=self.author, text='Текст')
+        self.assertIn(post, self.index_posts(Client()))
+
+    def test_writer_sticks_to_primary(self):
+        """После записи автор видит свой пост, хотя реплика отстала."""
+        replicas.refresh('replica_test')
+        response = self.author_client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}, follow=True
+        )
+        self.assertIn(
+            settings.REPLICA_STICKY_COOKIE, self.author_client.cookies
+        )
+        self.assertEqual(
+            response.context['page_obj'][0].text, 'Новый пост'
+        )
+        self.assertEqual(self.index_posts(Client()), [])
+
+    def test_router(self):
+        router = ReplicaRouter()
+        replicas.start_request()
+        replicas.choose()
+        try:
+            self.assertEqual(router.db_for_read(Post), None)
+            replicas.refresh('replica_test')
+            self.assertEqual(router.db_for_read(Post), None)
+            replicas.choose()
+            self.assertEqual(router.db_for_read(Post), 'replica_test')
+            self.assertEqual(router.db_for_read(Session), 'default')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), None)
+        finally:
+            self.assertTrue(replicas.finish_request())
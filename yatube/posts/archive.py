@@ -0,0 +1,184 @@
+"""
+Архив старых публикаций.
+
+Публикации старше POST_ARCHIVE_AFTER_DAYS дней вместе с комментариями
+переезжают из Post и Comment в таблицы ArchivedPost и ArchivedComment
+той же базы (в каждом шарде — свои, см. posts.sharding). Пачка переносится
+одной транзакцией INSERT ... SELECT и DELETE, так что архивирование можно
+прервать и продолжить в любой момент; между пачками — пауза. Id не
+меняются, архив только читается.
+
+Горячие таблицы и их индексы остаются маленькими. Главная и группы
+читают архив, только когда листают дальше самой новой архивной
+публикации (posts.paginators.TieredCursorPaginator); граница
+кэшируется до следующей пачки. Профиль, страница поста, лента подписок
+и поиск находят архивные публикации сами.
+"""
+import time
+from datetime import timedelta
+from functools import partial
+from hashlib import md5
+
+from core.cache import bump, get_generations
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import Http404
+from django.utils import timezone
+
+from . import scopes, sharding
+from .models import (ArchivedComment, ArchivedPost, Comment, Post,
+                     ThumbnailTask)
+
+BATCH_SIZE = 500
+SCOPE = scopes.ARCHIVE
+BOUNDARY_KEY = 'archive-boundary:{}:{}'
+
+
+def cutoff():
+    """Публикации старше этого момента уходят в архив."""
+    return timezone.now() - timedelta(days=settings.POST_ARCHIVE_AFTER_DAYS)
+
+
+def _move(alias, source, target, column, values):
+    # Колонки архивных таблиц совпадают с колонками горячих.
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(field.column) for field in target._meta.concrete_fields
+    )
+    placeholders = ', '.join(['%s'] * len(values))
+    where = f'{quote(column)} IN ({placeholders})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(target._meta.db_table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(source._meta.db_table)} '
+            f'WHERE {where}',
+            values
+        )
+        cursor.execute(
+            f'DELETE FROM {quote(source._meta.db_table)} WHERE {where}',
+            values
+        )
+
+
+def archive_batch(alias, before, batch_size=BATCH_SIZE):
+    """
+    Переносит в архив базы alias до batch_size самых старых публикаций
+    старше before. Возвращает их число.
+    """
+    post_ids = list(
+        Post.objects.using(alias)
+        .filter(pub_date__lt=before)
+        .order_by('pub_date', 'pk')
+        .values_list('pk', flat=True)[:batch_size]
+    )
+    if not post_ids:
+        return 0
+    # Миниатюры старых картинок давно готовы.
+    ThumbnailTask.objects.using(DEFAULT_DB_ALIAS).filter(
+        post_id__in=post_ids
+    ).delete()
+    with transaction.atomic(using=alias):
+        _move(alias, Post, ArchivedPost, 'id', post_ids)
+        _move(alias, Comment, ArchivedComment, 'post_id', post_ids)
+    # На страницах перенесённых публикаций пропадают формы.
+    bump(SCOPE, *map(scopes.post, post_ids))
+    return len(post_ids)
+
+
+def run(before=None, batch_size=BATCH_SIZE, pause=0.0, limit=None):
+    """
+    Архивирует публикации старше before (по умолчанию cutoff()) во всех
+    базах, не больше limit штук. Возвращает число перенесённых.
+    """
+    if before is None:
+        before = cutoff()
+    total = 0
+    for alias in sharding.aliases():
+        while limit is None or total < limit:
+            size = batch_size if limit is None else min(
+                batch_size, limit - total
+            )
+            moved = archive_batch(alias, before, size)
+            total += moved
+            if moved < size:
+                break
+            if pause:
+                time.sleep(pause)
+    return total
+
+
+def boundary(querysets):
+    """
+    Ключ (pub_date, pk) самой новой публикации архивной ленты из querysets
+    по шардам или None, если она пуста. По запросу на шард, и тот по
+    индексу; архив меняется только пачками, так что ответ кэшируется до
+    следующей.
+    """
+    generation, = get_generations([SCOPE])
+    digest = md5('|'.join(
+        f'{queryset.db}:{queryset.query}' for queryset in querysets
+    ).encode()).hexdigest()
+    key = BOUNDARY_KEY.format(generation, digest)
+    found = cache.get(key)
+    if found is None:
+        newest = [
+            queryset.order_by('-pub_date', '-pk')
+            .values_list('pub_date', 'pk').first()
+            for queryset in querysets
+        ]
+        # В кэше None не отличить от промаха.
+        found = [max(filter(None, newest), default=None)]
+        cache.set(key, found, None)
+    return found[0]
+
+
+def tier(querysets):
+    """
+    Архивный ярус ленты из querysets — аргумент archive для
+    posts.paginators.paginate. Граница ищется, только когда лента дошла
+    до архива.
+    """
+    return querysets, partial(boundary, querysets)
+
+
+def get_post_or_404(post_id, *related):
+    """Публикация по id: из горячей таблицы или, если её там нет, из архива."""
+    for model in (Post, ArchivedPost):
+        post = sharding.for_post(
+            model.objects.filter(pk=post_id).select_related(*related),
+            post_id
+        ).first()
+        if post is not None:
+            return post
+    raise Http404('Публикация не найдена')
+
+
+def related_scopes(post_id):
+    """
+    Области автора и группы публикации (posts.scopes.for_detail) или None,
+    если её нет ни в горячей таблице, ни в архиве.
+    """
+    for model in (Post, ArchivedPost):
+        found = sharding.for_post(
+            model.objects.filter(pk=post_id), post_id
+        ).values_list('author__username', 'group__slug').first()
+        if found is not None:
+            username, slug = found
+            related = [scopes.author(username)]
+            if slug:
+                related.append(scopes.group(slug))
+            return related
+    return None
+
+
+def in_bulk(post_ids, related=('author', 'group')):
+    """{id: публикация} из горячих таблиц и архива по всем шардам."""
+    found = sharding.in_bulk(Post.objects.select_related(*related), post_ids)
+    missing = [pk for pk in post_ids if pk not in found]
+    if missing:
+        found.update(sharding.in_bulk(
+            ArchivedPost.objects.select_related(*related), missing
+        ))
+    return found
@@ -0,0 +1,119 @@
+"""
+Аудит планов SQL-запросов основных вью.
+
+Запросы снимаются с тех же сценариев, что и в posts.benchmarks. Для
+каждого SELECT выполняется EXPLAIN QUERY PLAN (SQLite) и ищутся полные
+просмотры таблиц и временные B-деревья для сортировки и группировки.
+Время запроса замеряется дважды: с индексами миграции 0018_indexes и без
+них — индексы удаляются внутри транзакции, которая затем откатывается.
+"""
+import re
+import statistics
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from core.queries import fingerprint
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from . import benchmarks
+
+# Индексы, добавленные по итогам аудита (posts/migrations/0018_indexes).
+AUDITED_INDEXES = (
+    'post_pub_date_idx',
+    'post_author_pub_date_idx',
+    'post_group_pub_date_idx',
+    'comment_post_created_idx',
+)
+# Полный просмотр таблицы: SCAN без индекса (виртуальные таблицы FTS5
+# и подзапросы-константы — не проблема).
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+TEMP_BTREE_RE = re.compile(r'^USE TEMP B-TREE FOR (.+)$')
+
+Finding = namedtuple(
+    'Finding', ('scenario', 'sql', 'problems', 'ms', 'problems_before',
+                'ms_before')
+)
+
+
+def problems(plan):
+    """Подозрительные строки плана."""
+    return [
+        detail for detail in plan
+        if FULL_SCAN_RE.match(detail) or TEMP_BTREE_RE.match(detail)
+    ]
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def timing(sql, repeat):
+    """Медиана времени запроса в миллисекундах."""
+    durations = []
+    with connection.cursor() as cursor:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(sql)
+            cursor.fetchall()
+            durations.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(durations), 3)
+
+
+def capture(client, scenario):
+    """Разные по форме SELECT-запросы сценария в порядке выполнения."""
+    with CaptureQueriesContext(connection) as context:
+        getattr(client, scenario.method)(scenario.url, scenario.data)
+    queries = {}
+    for query in context.captured_queries:
+        sql = query['sql']
+        if sql.lstrip().upper().startswith('SELECT'):
+            queries.setdefault(fingerprint(sql), sql)
+    return list(queries.values())
+
+
+@contextmanager
+def without_indexes(names=AUDITED_INDEXES):
+    """Временно, до отката транзакции, удаляет индексы names."""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(
+                    f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}'
+                )
+        yield
+        transaction.set_rollback(True)
+
+
+def audit(repeat=5, compare=True):
+    """
+    Находки по всем сценариям. Без compare поля *_before равны None.
+    """
+    client, selected = benchmarks.prepare()
+    queries = [
+        (scenario.name, sql)
+        for scenario in selected
+        for sql in capture(client, scenario)
+    ]
+    current = [
+        (problems(explain(sql)), timing(sql, repeat)) for _, sql in queries
+    ]
+    before = [(None, None)] * len(queries)
+    if compare:
+        with without_indexes():
+            # sqlite3 кэширует подготовленные запросы по тексту, и план
+            # у них остался бы прежним: меняем текст комментарием.
+            before = [
+                (
+                    problems(explain(sql + ' /* без индексов */')),
+                    timing(sql + ' /* без индексов */', repeat)
+                )
+                for _, sql in queries
+            ]
+    return [
+        Finding(name, sql, *now, *then)
+        for (name, sql), now, then in zip(queries, current, before)
+    ]
@@ -0,0 +1,172 @@
+"""
+Замеры задержки, числа запросов и объёма ответа для основных вью.
+
+Каждый сценарий — запрос тестового клиента к вью на наборе данных из
+posts.dataset. Для сценария копятся p50/p95 задержки, медианы числа SQL-
+запросов и байт ответа. Результаты сравниваются с сохранённым baseline:
+регрессия — это рост p95 больше чем на порог или рост числа запросов.
+"""
+import math
+import statistics
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from . import dataset, transfer
+from .models import Follow, Group, Post
+
+User = get_user_model()
+
+# Параметры posts.dataset.generate для наборов разного размера.
+SIZES = {
+    'small': {'users': 200, 'groups': 10, 'posts': 2000,
+              'comments': 4000, 'follows_per_user': 10},
+    'medium': {'users': 2000, 'groups': 20, 'posts': 20000,
+               'comments': 40000, 'follows_per_user': 10},
+    'large': {'users': 10000, 'groups': 50, 'posts': 200000,
+              'comments': 400000, 'follows_per_user': 20},
+}
+Scenario = namedtuple('Scenario', ('name', 'method', 'url', 'data'))
+
+
+@contextmanager
+def test_database(size, seed=0):
+    """
+    Отдельная тестовая база с набором данных size; отдаёт время его
+    генерации в секундах.
+    """
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        started = time.perf_counter()
+        dataset.generate(seed=seed, **SIZES[size])
+        transfer.rebuild_derived()
+        # Реплики смотрят на рабочую базу, а не на тестовую.
+        with override_settings(DATABASE_REPLICAS=[]):
+            yield time.perf_counter() - started
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(values, share):
+    """Значение, ниже которого лежит доля share замеров (ближайший ранг)."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def scenarios(group, author, post):
+    """Сценарии для самой большой группы, самого активного автора и поста."""
+    return [
+        Scenario('index', 'get', reverse('posts:index'), None),
+        Scenario(
+            'group_posts', 'get',
+            reverse('posts:group_list', kwargs={'slug': group.slug}), None
+        ),
+        Scenario(
+            'profile', 'get',
+            reverse('posts:profile', kwargs={'username': author.username}),
+            None
+        ),
+        Scenario(
+            'post_detail', 'get',
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}), None
+        ),
+        Scenario('follow_index', 'get', reverse('posts:follow_index'), None),
+        Scenario(
+            'post_create', 'post', reverse('posts:post_create'),
+            {'text': 'Публикация из замера'}
+        ),
+        Scenario(
+            'add_comment', 'post',
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий из замера'}
+        ),
+    ]
+
+
+def _measure(client, scenario, iterations, warm):
+    latencies, queries, sizes = [], [], []
+    for _ in range(iterations):
+        if not warm:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(
+                scenario.url, scenario.data
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(len(context.captured_queries))
+        sizes.append(len(response.content))
+    return {
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'queries': statistics.median(queries),
+        'bytes': statistics.median(sizes),
+    }
+
+
+def prepare():
+    """
+    Клиент и сценарии для данных, уже лежащих в базе.
+
+    Читатель ленты подписок — пользователь с наибольшим числом подписок;
+    он же пишет публикации и комментарии.
+    """
+    group = (
+        Group.objects.annotate(total=Count('posts')).order_by('-total').first()
+    )
+    author = (
+        User.objects.annotate(total=Count('posts')).order_by('-total').first()
+    )
+    reader = User.objects.get(pk=(
+        Follow.objects.values('user').annotate(total=Count('pk'))
+        .order_by('-total').values_list('user', flat=True)[0]
+    ))
+    post = Post.objects.order_by('-pub_date').first()
+    client = Client()
+    client.force_login(reader)
+    return client, scenarios(group, author, post)
+
+
+def run(iterations=20, warm=False):
+    """Прогоняет все сценарии на данных, уже лежащих в базе."""
+    client, selected = prepare()
+    return {
+        scenario.name: _measure(client, scenario, iterations, warm)
+        for scenario in selected
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Список регрессий относительно baseline: (набор, сценарий, метрика,
+    было, стало). Наборы и сценарии, которых нет в baseline, пропускаются.
+    """
+    regressions = []
+    for size, views in results.items():
+        for view, metrics in views.items():
+            before = baseline.get(size, {}).get(view)
+            if before is None:
+                continue
+            if metrics['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                regressions.append(
+                    (size, view, 'p95_ms', before['p95_ms'],
+                     metrics['p95_ms'])
+                )
+            if metrics['queries'] > before['queries']:
+                regressions.append(
+                    (size, view, 'queries', before['queries'],
+                     metrics['queries'])
+                )
+    return regressions
@@ -0,0 +1,125 @@
+"""
+Денормализованные счётчики: публикации, подписчики и подписки автора,
+комментарии к посту. Меняются F-выражениями из сигналов, так что
+конкурентные запросы не теряют инкременты.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import sharding
+from .models import ArchivedPost, AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+def _shift(user_id, field, delta):
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        # Строки может не быть (или счётчик уже 0) — тогда уменьшать
+        # нечего, расхождение поправит rebuild_counters.
+        stats.filter(**{f'{field}__gte': -delta}).update(
+            **{field: F(field) + delta}
+        )
+        return
+    with transaction.atomic():
+        if not stats.update(**{field: F(field) + delta}):
+            AuthorStats.objects.get_or_create(user_id=user_id)
+            stats.update(**{field: F(field) + delta})
+
+
+def post_added(post):
+    _shift(post.author_id, 'posts_count', 1)
+
+
+def post_removed(post):
+    _shift(post.author_id, 'posts_count', -1)
+
+
+def comment_added(comment):
+    # Публикация лежит в той же базе, что и комментарий.
+    Post.objects.using(comment._state.db).filter(pk=comment.post_id).update(
+        comments_count=F('comments_count') + 1
+    )
+
+
+def comment_removed(comment):
+    Post.objects.using(comment._state.db).filter(
+        pk=comment.post_id, comments_count__gt=0
+    ).update(comments_count=F('comments_count') - 1)
+
+
+def follow_added(follow):
+    with transaction.atomic():
+        _shift(follow.author_id, 'followers_count', 1)
+        _shift(follow.user_id, 'following_count', 1)
+
+
+def follow_removed(follow):
+    with transaction.atomic():
+        _shift(follow.author_id, 'followers_count', -1)
+        _shift(follow.user_id, 'following_count', -1)
+
+
+def author_stats(user):
+    """Счётчики автора; для автора без активности — нулевые."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        if sharding.is_shard(user._state.db):
+            # Автор прочитан из шарда вместе с публикацией, а счётчики
+            # есть только в основной базе.
+            stats = AuthorStats.objects.filter(user_id=user.pk).first()
+            if stats is not None:
+                return stats
+        return AuthorStats(user=user)
+
+
+def _counts(queryset, field):
+    return dict(
+        queryset
+        .values_list(field)
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+
+
+@transaction.atomic
+def rebuild():
+    """Пересчитывает все счётчики по исходным таблицам."""
+    comments = (
+        Comment.objects
+        .filter(post=OuterRef('pk'))
+        .values('post')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    posts = Counter()
+    for queryset in sharding.fan_out(Post.objects.all()):
+        queryset.update(comments_count=Coalesce(
+            Subquery(comments, output_field=IntegerField()), 0
+        ))
+        posts.update(_counts(queryset, 'author_id'))
+    # Архивные публикации по-прежнему числятся за автором.
+    for queryset in sharding.fan_out(ArchivedPost.objects.all()):
+        posts.update(_counts(queryset, 'author_id'))
+    followers = _counts(Follow.objects, 'author_id')
+    following = _counts(Follow.objects, 'user_id')
+    AuthorStats.objects.all().delete()
+    AuthorStats.objects.bulk_create(
+        (
+            AuthorStats(
+                user_id=user_id,
+                posts_count=posts.get(user_id, 0),
+                followers_count=followers.get(user_id, 0),
+                following_count=following.get(user_id, 0)
+            )
+            for user_id in User.objects.values_list('pk', flat=True)
+        ),
+        batch_size=BATCH_SIZE
+    )
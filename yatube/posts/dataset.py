@@ -0,0 +1,246 @@
+"""
+Синтетический набор данных для замеров производительности.
+
+Всё определяется seed: одинаковые параметры дают одинаковые данные.
+Публикации распределены по авторам по закону Ципфа (немного очень активных
+авторов и длинный хвост), подписки так же тянутся к немногим
+«знаменитостям». Тексты собираются из заранее сгенерированного Faker
+набора фраз, строки вставляются через bulk_create с явными id, поэтому
+миллион публикаций создаётся за минуты.
+"""
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from .models import Comment, Follow, Group, Post, ThumbnailTask
+from .transfer import batched, explicit_dates, reset_sequences
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+PHRASES = 2000
+IMAGES = 20
+ZIPF_EXPONENT = 1.1
+PASSWORD = 'yatube-dataset'
+# Фиксированный конец периода публикаций: даты тоже зависят только от seed.
+END_DATE = datetime(2022, 7, 1, tzinfo=timezone.utc)
+
+
+def zipf_weights(size, exponent=ZIPF_EXPONENT):
+    """Накопленные веса рангов 1..size по закону Ципфа."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Generator:
+    """
+    Создаёт пользователей, группы, публикации, комментарии и подписки.
+
+    on_batch(model, created) вызывается после каждой пачки — для вывода
+    прогресса.
+    """
+
+    def __init__(self, seed=0, batch_size=BATCH_SIZE, on_batch=None):
+        self.random = random.Random(seed)
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(seed)
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.phrases = [self.faker.sentence() for _ in range(PHRASES)]
+
+    def _next_id(self, model):
+        return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+    def _insert(self, model, objects, **kwargs):
+        total = 0
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            total += len(batch)
+            if self.on_batch:
+                self.on_batch(model._meta.model_name, total)
+        return total
+
+    def _text(self, low, high):
+        return ' '.join(self.random.choices(
+            self.phrases, k=self.random.randint(low, high)
+        ))
+
+    def users(self, count):
+        """Создаёт пользователей; возвращает их id по убыванию активности."""
+        first = self._next_id(User)
+        # Хэш пароля считается один раз: make_password намеренно медленный.
+        password = make_password(PASSWORD)
+        joined = END_DATE - timedelta(days=365)
+        self._insert(User, (
+            User(
+                id=first + i,
+                username=f'{self.faker.user_name()}_{first + i}',
+                first_name=self.faker.first_name(),
+                last_name=self.faker.last_name(),
+                email=f'user{first + i}@example.com',
+                password=password,
+                date_joined=joined
+            )
+            for i in range(count)
+        ))
+        user_ids = list(range(first, first + count))
+        # Ранг активности не совпадает с порядком регистрации.
+        self.random.shuffle(user_ids)
+        return user_ids
+
+    def groups(self, count):
+        first = self._next_id(Group)
+        self._insert(Group, (
+            Group(
+                id=first + i,
+                title=self.faker.catch_phrase()[:200],
+                slug=f'group-{first + i}',
+                description=self._text(1, 3)
+            )
+            for i in range(count)
+        ))
+        return list(range(first, first + count))
+
+    def images(self, count):
+        """Сохраняет count картинок-заглушек и возвращает их имена."""
+        names = []
+        for i in range(count):
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            output = BytesIO()
+            Image.new('RGB', (960, 540), color).save(output, 'JPEG')
+            names.append(default_storage.save(
+                f'posts/dataset_{i}.jpg', ContentFile(output.getvalue())
+            ))
+        return names
+
+    def posts(self, count, author_ids, group_ids, images=(), image_share=0,
+              days=365):
+        """
+        Создаёт публикации; pub_date растёт вместе с id, как у настоящей
+        ленты. Возвращает диапазон id.
+        """
+        first = self._next_id(Post)
+        weights = zipf_weights(len(author_ids))
+        step = timedelta(days=days) / max(count, 1)
+        start = END_DATE - timedelta(days=days)
+
+        def build():
+            for i in range(count):
+                author = author_ids[
+                    bisect(weights, self.random.random() * weights[-1])
+                ]
+                image = ''
+                if images and self.random.random() < image_share:
+                    image = self.random.choice(images)
+                yield Post(
+                    id=first + i,
+                    text=self._text(1, 6),
+                    pub_date=start + step * i,
+                    author_id=author,
+                    group_id=(
+                        self.random.choice(group_ids)
+                        if group_ids and self.random.random() < 0.6
+                        else None
+                    ),
+                    image=image
+                )
+
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            self._insert(Post, build())
+        if images:
+            self._insert(ThumbnailTask, (
+                ThumbnailTask(post_id=pk)
+                for pk in Post.objects
+                .filter(pk__gte=first)
+                .exclude(image='')
+                .values_list('pk', flat=True)
+                .iterator()
+            ))
+        return range(first, first + count)
+
+    def comments(self, count, post_ids, user_ids):
+        """Комментарии чаще достаются свежим постам."""
+        if not post_ids:
+            return 0
+        created = END_DATE - timedelta(minutes=1)
+
+        def build():
+            for _ in range(count):
+                # Квадрат равномерной величины смещает выбор к концу
+                # диапазона — к новым публикациям.
+                offset = int((1 - self.random.random() ** 2) * len(post_ids))
+                yield Comment(
+                    post_id=post_ids[min(offset, len(post_ids) - 1)],
+                    author_id=self.random.choice(user_ids),
+                    text=self._text(1, 2),
+                    created=created
+                )
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            return self._insert(Comment, build())
+
+    def follows(self, per_user, user_ids):
+        """
+        Каждый пользователь подписывается в среднем на per_user авторов,
+        выбранных по закону Ципфа: у первых по рангу — огромная аудитория.
+        """
+        weights = zipf_weights(len(user_ids))
+
+        def build():
+            for user in user_ids:
+                wanted = min(
+                    int(self.random.expovariate(1 / per_user)) if per_user
+                    else 0,
+                    len(user_ids) - 1
+                )
+                authors = set()
+                for _ in range(wanted * 3):
+                    if len(authors) >= wanted:
+                        break
+                    author = user_ids[
+                        bisect(weights, self.random.random() * weights[-1])
+                    ]
+                    if author != user:
+                        authors.add(author)
+                for author in sorted(authors):
+                    yield Follow(user_id=user, author_id=author)
+
+        return self._insert(Follow, build())
+
+
+def generate(users, groups, posts, comments, follows_per_user, seed=0,
+             image_share=0.0, batch_size=BATCH_SIZE, on_batch=None):
+    """
+    Создаёт полный набор данных и возвращает число строк по моделям.
+    Доля image_share публикаций получает одну из IMAGES картинок.
+    """
+    generator = Generator(seed, batch_size, on_batch)
+    user_ids = generator.users(users)
+    group_ids = generator.groups(groups)
+    image_names = generator.images(IMAGES) if image_share else []
+    post_ids = generator.posts(
+        posts, user_ids, group_ids, image_names, image_share
+    )
+    created = {
+        'user': len(user_ids),
+        'group': len(group_ids),
+        'post': len(post_ids),
+        'comment': generator.comments(comments, post_ids, user_ids),
+        'follow': generator.follows(follows_per_user, user_ids),
+    }
+    reset_sequences(User, Group, Post, Comment, Follow)
+    return created
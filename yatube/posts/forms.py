@@ -1,5 +1,6 @@
 from django import forms
 
+from . import images
 from .models import Comment, Post
 
 
@@ -8,6 +9,25 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image', )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Размер проверяется раньше, чем ImageField откроет файл Pillow.
+        to_python = self.fields['image'].to_python
+
+        def checked(data):
+            if data is not None:
+                images.check_size(data)
+            return to_python(data)
+
+        self.fields['image'].to_python = checked
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Новая загрузка, а не уже сохранённый файл редактируемого поста.
+        if image and hasattr(image, 'content_type'):
+            return images.normalize(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
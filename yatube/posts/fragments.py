@@ -0,0 +1,39 @@
+"""Персональные фрагменты страниц публикаций (core.personal)."""
+from core.personal import fragment
+
+from . import scopes
+from .models import Follow
+
+
+@fragment(
+    'header', 'includes/header.html',
+    scopes=lambda request, **kwargs: [scopes.author(request.user.username)]
+)
+def header(request, view_name):
+    """Шапка с именем пользователя сбрасывается вместе с его профилем."""
+    return {'view_name': view_name}
+
+
+@fragment('switcher', 'posts/includes/switcher.html')
+def switcher(request):
+    return {}
+
+
+@fragment(
+    'profile_header', 'posts/includes/profile_header.html',
+    scopes=lambda request, username, **kwargs: [scopes.author(username)]
+)
+def profile_header(request, author_id, username, full_name, posts_count):
+    """Заголовок профиля и кнопка подписки: подписки сдвигают область."""
+    user = request.user
+    is_self = user.pk == author_id
+    return {
+        'username': username,
+        'full_name': full_name,
+        'posts_count': posts_count,
+        'is_self': is_self,
+        'following': (
+            user.is_authenticated and not is_self
+            and Follow.objects.filter(user=user, author_id=author_id).exists()
+        ),
+    }
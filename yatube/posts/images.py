@@ -0,0 +1,185 @@
+"""
+Нормализация загружаемых картинок постов.
+
+Картинка приводится к разумному размеру один раз при загрузке: учитывается
+EXIF-ориентация, метаданные отбрасываются, результат перекодируется в
+settings.POST_IMAGE_FORMAT. JPEG декодируется сразу в уменьшенном масштабе
+(draft), поэтому память ограничена итоговым размером, а не исходным.
+GIF не перекодируется, чтобы не потерять анимацию, поэтому слишком большой
+GIF (по стороне или по пикселям всех кадров) отклоняется, а не ужимается.
+Длительности этапов попадают в метрики (core.metrics), а файл больше
+POST_IMAGE_MAX_UPLOAD_BYTES не дочитывается в память (UploadLimitHandler)
+и отклоняется формой до того, как его откроет Pillow.
+"""
+import logging
+import os
+import time
+from io import BytesIO
+
+from core import metrics
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Форматы, которые не перекодируются: GIF потерял бы анимацию.
+PASSTHROUGH_FORMATS = ('GIF',)
+
+if settings.POST_IMAGE_FORMAT not in EXTENSIONS:
+    raise ImproperlyConfigured(
+        'POST_IMAGE_FORMAT должен быть одним из: {}.'.format(
+            ', '.join(EXTENSIONS)
+        )
+    )
+
+
+class Timer:
+    """Копит длительности этапов обработки в миллисекундах."""
+
+    def __init__(self):
+        self.stages = {}
+        self._started = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = round((now - self._started) * 1000, 2)
+        self._started = now
+
+
+class UploadLimitHandler(FileUploadHandler):
+    """
+    Первый из FILE_UPLOAD_HANDLERS: как только файл перерос
+    POST_IMAGE_MAX_UPLOAD_BYTES, его данные больше не передаются ни в
+    память, ни во временный файл. Вместо файла форма получает пустую
+    заглушку с настоящим размером и отклоняет её (check_size).
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_BYTES:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received <= settings.POST_IMAGE_MAX_UPLOAD_BYTES:
+            return None
+        return UploadedFile(
+            BytesIO(), self.file_name, self.content_type, self.received
+        )
+
+
+def check_size(upload):
+    """Бросает ValidationError, если файл больше допустимого."""
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_BYTES:
+        raise ValidationError(
+            'Файл слишком большой: не более %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': settings.POST_IMAGE_MAX_UPLOAD_BYTES // 2 ** 20}
+        )
+
+
+def _flatten(image):
+    if image.mode in ('RGB', 'L'):
+        return image
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _check_passthrough(image):
+    """
+    Бросает ValidationError для картинки, которая не будет ужата: сторона
+    больше POST_IMAGE_MAX_SIDE или все кадры вместе больше
+    POST_IMAGE_MAX_PIXELS пикселей.
+    """
+    width, height = image.size
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    if max(width, height) > max_side:
+        raise ValidationError(
+            'GIF не ужимается: не более %(limit)d пикселей по стороне.',
+            code='too_large_side',
+            params={'limit': max_side}
+        )
+    # Кадры считаются по заголовкам, без декодирования.
+    frames = getattr(image, 'n_frames', 1)
+    if width * height * frames > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком много кадров для такого разрешения.',
+            code='too_many_pixels'
+        )
+
+
+def normalize(upload):
+    """
+    Возвращает нормализованный файл вместо загруженного.
+
+    Бросает ValidationError для слишком больших файлов и картинок; размеры
+    проверяются по заголовку, до декодирования.
+    """
+    check_size(upload)
+    timer = Timer()
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большое разрешение картинки.', code='too_many_pixels'
+        )
+    timer.lap('open')
+    if image.format in PASSTHROUGH_FORMATS:
+        _check_passthrough(image)
+        upload.seek(0)
+        return upload
+
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    image.draft('RGB', (max_side, max_side))
+    image.load()
+    timer.lap('decode')
+    image = ImageOps.exif_transpose(image)
+    timer.lap('orient')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    timer.lap('resize')
+
+    image_format = settings.POST_IMAGE_FORMAT
+    if image_format == 'JPEG':
+        image = _flatten(image)
+    output = BytesIO()
+    # Без exif=...: метаданные в новый файл не попадают.
+    image.save(
+        output,
+        image_format,
+        quality=settings.POST_IMAGE_QUALITY,
+        optimize=True
+    )
+    timer.lap('encode')
+
+    name = '{}.{}'.format(
+        os.path.splitext(os.path.basename(upload.name))[0],
+        EXTENSIONS[image_format]
+    )
+    logger.info(
+        'Картинка %s: %d -> %d байт, %dx%d -> %dx%d, этапы (мс): %s',
+        upload.name, upload.size, output.tell(), width, height,
+        image.width, image.height, timer.stages,
+        extra={'image_stages': timer.stages}
+    )
+    for stage, milliseconds in timer.stages.items():
+        metrics.observe(
+            'yatube_image_stage_seconds', {'stage': stage},
+            milliseconds / 1000
+        )
+    return InMemoryUploadedFile(
+        output, 'image', name, f'image/{EXTENSIONS[image_format]}',
+        output.tell(), None
+    )
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = ('Переносит старые публикации с комментариями в архив пачками. '
+            'Прерванный запуск можно просто повторить.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.POST_ARCHIVE_AFTER_DAYS,
+            help='Архивировать публикации старше стольких дней '
+                 '(по умолчанию POST_ARCHIVE_AFTER_DAYS).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=archive.BATCH_SIZE,
+            help='Сколько публикаций переносить за раз.'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Пауза между пачками в секундах, чтобы не мешать сайту.'
+        )
+        parser.add_argument(
+            '--limit', type=int,
+            help='Перенести не больше стольких публикаций.'
+        )
+
+    def handle(self, *args, **options):
+        moved = archive.run(
+            timezone.now() - timedelta(days=options['days']),
+            options['batch_size'], options['pause'], options['limit']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Публикаций перенесено в архив: {moved}'
+        ))
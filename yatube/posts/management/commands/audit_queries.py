@@ -0,0 +1,71 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import audit, benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Снимает SQL-запросы основных вью на сгенерированном наборе '
+            'данных, показывает для них EXPLAIN QUERY PLAN с полными '
+            'просмотрами и временными B-деревьями и время с индексами '
+            'posts/migrations/0018_indexes и без них.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', default='small', choices=list(benchmarks.SIZES),
+            help='Размер набора данных.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз выполнять запрос для замера.'
+        )
+        parser.add_argument(
+            '--no-compare', action='store_false', dest='compare',
+            help='Не замерять запросы без индексов аудита.'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Показывать и запросы без замечаний.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN есть только у SQLite')
+        with benchmarks.test_database(options['size'], options['seed']):
+            findings = audit.audit(options['repeat'], options['compare'])
+        for finding in findings:
+            self.report(finding, options['all'])
+        flagged = sum(bool(finding.problems) for finding in findings)
+        self.stdout.write(
+            f'Запросов: {len(findings)}, с замечаниями: {flagged}'
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(
+                    [finding._asdict() for finding in findings], stream,
+                    ensure_ascii=False, indent=2
+                )
+
+    def report(self, finding, show_all):
+        improved = (
+            finding.ms_before is not None
+            and finding.problems != finding.problems_before
+        )
+        if not (show_all or finding.problems or improved):
+            return
+        timing = f'{finding.ms:.3f} мс'
+        if finding.ms_before is not None:
+            timing = f'{finding.ms_before:.3f} -> {timing}'
+        self.stdout.write(
+            f'{finding.scenario:13} {timing:24} {finding.sql[:150]}'
+        )
+        for detail in finding.problems:
+            self.stdout.write(self.style.WARNING(f'    ! {detail}'))
+        if improved:
+            for detail in finding.problems_before:
+                if detail not in finding.problems:
+                    self.stdout.write(f'    без индексов: {detail}')
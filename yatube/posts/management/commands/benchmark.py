@@ -0,0 +1,79 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p95 задержки, число запросов и объём ответа '
+            'основных вью на сгенерированных наборах данных в отдельной '
+            'тестовой базе и сравнивает результат с baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', default=['small'],
+            choices=list(benchmarks.SIZES),
+            help='Размеры наборов данных.'
+        )
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не сбрасывать кэш перед запросами.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95 относительно baseline (доля).'
+        )
+
+    def measure(self, size, options):
+        with benchmarks.test_database(size, options['seed']) as elapsed:
+            self.stdout.write(f'{size}: данные за {elapsed:.1f} с')
+            return benchmarks.run(options['iterations'], options['warm'])
+
+    def handle(self, *args, **options):
+        results = {
+            size: self.measure(size, options) for size in options['sizes']
+        }
+        for size, views in results.items():
+            for view, metrics in views.items():
+                self.stdout.write(
+                    f'{size:7} {view:13} p50 {metrics["p50_ms"]:8.2f} мс  '
+                    f'p95 {metrics["p95_ms"]:8.2f} мс  '
+                    f'запросов {metrics["queries"]:4}  '
+                    f'байт {metrics["bytes"]}'
+                )
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+                'warm': options['warm'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, ensure_ascii=False, indent=2)
+        if not options['baseline']:
+            return
+        with open(options['baseline'], encoding='utf-8') as stream:
+            baseline = json.load(stream)['results']
+        regressions = benchmarks.compare(
+            results, baseline, options['threshold']
+        )
+        for size, view, metric, before, after in regressions:
+            self.stderr.write(f'{size} {view} {metric}: {before} -> {after}')
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
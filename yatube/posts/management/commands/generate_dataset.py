@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import dataset, transfer
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетический набор данных для замеров '
+            'производительности; одинаковый --seed даёт одинаковые данные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows-per-user', type=float, default=10,
+            help='Среднее число подписок одного пользователя.'
+        )
+        parser.add_argument(
+            '--image-share', type=float, default=0.0,
+            help='Доля публикаций с картинкой (0 — без картинок).'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=dataset.BATCH_SIZE,
+            help='Сколько строк вставлять одной транзакцией.'
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересобирать счётчики, ленты и поисковый индекс.'
+        )
+
+    def report(self, model, created):
+        if self.verbosity > 1:
+            self.stdout.write(f'{model}: {created}')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        created = dataset.generate(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows_per_user=options['follows_per_user'],
+            seed=options['seed'],
+            image_share=options['image_share'],
+            batch_size=options['batch_size'],
+            on_batch=self.report
+        )
+        elapsed = time.perf_counter() - started
+        total = sum(created.values())
+        self.stdout.write(
+            ', '.join(f'{model}: {count}' for model, count in created.items())
+            + f' — {elapsed:.1f} с, {total / max(elapsed, 1e-9):.0f} строк/с'
+        )
+        if options['no_rebuild']:
+            return
+        started = time.perf_counter()
+        transfer.rebuild_derived()
+        self.stdout.write(self.style.SUCCESS(
+            f'Производные данные пересобраны за '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,54 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает JSONL-выгрузку export_posts пачками через '
+            'bulk_create и пересобирает счётчики, ленты и поисковый индекс.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл выгрузки (.jsonl или .jsonl.gz); «-» — stdin.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE,
+            help='Сколько строк вставлять одной транзакцией.'
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересобирать счётчики, ленты и поисковый индекс.'
+        )
+
+    def report(self, model, stats):
+        if self.verbosity > 1:
+            self.stdout.write(f'{model}: {stats["rows"]}')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        importer = transfer.Importer(options['batch_size'], self.report)
+        if path == '-':
+            stats = importer.run(transfer.load(sys.stdin))
+        else:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as stream:
+                stats = importer.run(transfer.load(stream))
+        for model, model_stats in stats.items():
+            rate = model_stats['rows'] / max(model_stats['seconds'], 1e-9)
+            self.stdout.write(
+                f'{model}: загружено {model_stats["rows"]}, '
+                f'пропущено {model_stats["skipped"]}, {rate:.0f} строк/с'
+            )
+        if options['no_rebuild']:
+            return
+        started = time.perf_counter()
+        transfer.rebuild_derived()
+        self.stdout.write(self.style.SUCCESS(
+            f'Производные данные пересобраны за '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
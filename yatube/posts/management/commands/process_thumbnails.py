@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Генерирует миниатюры картинок постов из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Сколько задач брать из очереди за раз.'
+        )
+        parser.add_argument(
+            '--forever', action='store_true',
+            help='Не выходить, когда очередь пуста, а ждать новых задач.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Пауза в секундах при пустой очереди (с --forever).'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = thumbnails.drain(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if not options['forever']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано задач: {total}'))
@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Чьи ленты пересобрать (по умолчанию — всех).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько лент пересобирать в одной транзакции.'
+        )
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Только разобрать очередь отложенных дозаполнений лент.'
+        )
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            self.drain(options['batch_size'])
+            return
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        user_ids = list(users.values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        total = 0
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                total += timeline.rebuild(user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент пересобрано: {len(user_ids)}, записей: {total}'
+        ))
+
+    def drain(self, batch_size):
+        tasks = total = 0
+        while True:
+            processed, written = timeline.drain(batch_size)
+            if not processed:
+                break
+            tasks += processed
+            total += written
+        self.stdout.write(self.style.SUCCESS(
+            f'Задач обработано: {tasks}, записей: {total}'
+        ))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import sharding
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает корзины авторов поровну по шардам публикаций, '
+            'перенося публикации и комментарии пачками без остановки '
+            'сайта. Прерванный запуск можно просто повторить.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards', nargs='+',
+            help='Шарды из POST_SHARDS, по которым разложить корзины '
+                 '(по умолчанию — все).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=sharding.BATCH_SIZE,
+            help='Сколько публикаций копировать за раз.'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Пауза между пачками в секундах, чтобы не мешать сайту.'
+        )
+        parser.add_argument(
+            '--wait', type=float,
+            help='Сколько ждать после переключения корзины '
+                 '(по умолчанию POST_SHARD_MAP_TTL_SEC).'
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError(
+                'Шардов нет: задайте YATUBE_POST_SHARDS (см. POST_SHARDS).'
+            )
+        targets = options['shards'] or sharding.aliases()
+        unknown = set(targets) - set(sharding.aliases())
+        if unknown:
+            raise CommandError(
+                f'Нет в POST_SHARDS: {", ".join(sorted(unknown))}'
+            )
+        batch_size = options['batch_size']
+        for alias in sharding.aliases():
+            sharding.prepare(alias, batch_size)
+            indexed = sharding.index_directory(alias, batch_size)
+            swept = sharding.sweep(alias, batch_size)
+            self.stdout.write(
+                f'{alias}: в каталог внесено {indexed}, '
+                f'удалено остатков {swept}'
+            )
+        total = 0
+        for number, target in sharding.plan(targets).items():
+            moved = sharding.move_bucket(
+                number, target, batch_size, options['pause'],
+                options['wait']
+            )
+            if moved:
+                self.stdout.write(f'корзина {number} -> {target}: {moved}')
+            total += moved
+        self.stdout.write(self.style.SUCCESS(
+            f'Публикаций перенесено: {total}'
+        ))
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # Ленты подписчиков уже существующих подписок, как после
+    # rebuild_timelines: посты авторов, у которых подписчиков больше
+    # порога fan-out, подмешиваются при чтении и в ленты не пишутся.
+    quote = schema_editor.connection.ops.quote_name
+    entry, follow, post = (
+        apps.get_model('posts', name)._meta.db_table
+        for name in ('TimelineEntry', 'Follow', 'Post')
+    )
+    schema_editor.execute(
+        f'INSERT INTO {quote(entry)} (user_id, post_id, author_id, pub_date) '
+        f'SELECT f.user_id, p.id, p.author_id, p.pub_date '
+        f'FROM {quote(follow)} f '
+        f'JOIN {quote(post)} p ON p.author_id = f.author_id '
+        f'WHERE f.author_id IN ('
+        f'SELECT author_id FROM {quote(follow)} '
+        f'GROUP BY author_id HAVING COUNT(*) <= %s)',
+        [settings.TIMELINE_FANOUT_MAX_FOLLOWERS]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_auto_20220617_2322'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Публикация')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'ordering': ['-pub_date', '-post'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    # Счётчики по существующим данным, как после rebuild_counters.
+    quote = schema_editor.connection.ops.quote_name
+    stats, post, comment, follow = (
+        quote(apps.get_model('posts', name)._meta.db_table)
+        for name in ('AuthorStats', 'Post', 'Comment', 'Follow')
+    )
+    user = quote(apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table)
+    schema_editor.execute(
+        f'INSERT INTO {stats} '
+        f'(user_id, posts_count, followers_count, following_count) '
+        f'SELECT u.id, '
+        f'(SELECT COUNT(*) FROM {post} WHERE author_id = u.id), '
+        f'(SELECT COUNT(*) FROM {follow} WHERE author_id = u.id), '
+        f'(SELECT COUNT(*) FROM {follow} WHERE user_id = u.id) '
+        f'FROM {user} u'
+    )
+    schema_editor.execute(
+        f'UPDATE {post} SET comments_count = ('
+        f'SELECT COUNT(*) FROM {comment} WHERE post_id = {post}.id)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0013_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Публикаций')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики автора',
+                'verbose_name_plural': 'Счётчики авторов',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_posts(apps, schema_editor):
+    # Существующие публикации попадают в каталог со своими id, а счётчик
+    # каталога продолжает счётчик posts_post: иначе после включения шардов
+    # posts.sharding.place выдаст новым публикациям уже занятые id.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO posts_postdirectory (id, author_id) '
+            'SELECT id, author_id FROM posts_post'
+        )
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'posts_post'"
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return
+        cursor.execute(
+            "DELETE FROM sqlite_sequence WHERE name = 'posts_postdirectory'"
+        )
+        cursor.execute(
+            'INSERT INTO sqlite_sequence (name, seq) '
+            "VALUES ('posts_postdirectory', %s)",
+            [row[0]]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0018_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardBucket',
+            fields=[
+                ('bucket', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='Корзина')),
+                ('alias', models.CharField(max_length=100, verbose_name='База')),
+            ],
+            options={
+                'verbose_name': 'Корзина шардов',
+                'verbose_name_plural': 'Карта шардов',
+            },
+        ),
+        migrations.CreateModel(
+            name='PostDirectory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Публикация в каталоге',
+                'verbose_name_plural': 'Каталог публикаций',
+            },
+        ),
+        migrations.RunPython(index_posts, migrations.RunPython.noop),
+    ]
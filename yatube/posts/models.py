@@ -1,3 +1,5 @@
+from core.models import CreatedModel
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
@@ -31,6 +33,9 @@ class Group(models.Model):
 
 class Post(models.Model):
     """Модель публикации."""
+    # Публикации из архива (ArchivedPost) только читаются.
+    archived = False
+
     text = models.TextField(
         'Текст публикации',
         help_text='Введите текст поста'
@@ -39,6 +44,10 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -59,15 +68,41 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
         ordering = ['-pub_date']
+        # Ленты листаются по ключу (pub_date, id), см. posts.paginators.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and len(settings.POST_SHARDS) > 1:
+            # Импорт здесь: модуль шардирования сам импортирует модели.
+            from .sharding import place
+            place(self, kwargs)
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     """Модель комментария к публикации."""
@@ -96,10 +131,21 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and len(settings.POST_SHARDS) > 1:
+            from .sharding import place
+            place(self, kwargs)
+        super().save(*args, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -118,6 +164,275 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        unique_together = ('user', 'author')
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.author.username}'
+
+
+class AuthorStats(models.Model):
+    """
+    Счётчики автора. Поддерживаются сигналами (см. posts.counters),
+    пересчитываются командой rebuild_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Автор',
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Публикаций', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Публикация в материализованной ленте подписок пользователя.
+
+    Заполняется сигналами при создании поста и подписке (fan-out on write),
+    см. posts.timeline.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Читатель',
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Публикация',
+        related_name='timeline_entries',
+        # Пост может уехать в архив (posts.archive), запись ленты остаётся.
+        db_constraint=False
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date', '-post']
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} в ленте {self.user_id}'
+
+
+class ThumbnailTask(CreatedModel):
+    """Задача фоновому воркеру: сгенерировать миниатюры картинки поста."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Публикация',
+        related_name='thumbnail_task'
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Задача на миниатюры'
+        verbose_name_plural = 'Задачи на миниатюры'
+        ordering = ['created']
+
+    def __str__(self):
+        return f'Миниатюры для {self.post_id}'
+
+
+class TimelineBackfill(CreatedModel):
+    """
+    Отложенное дозаполнение лент: посты автора ещё не разложены в ленту
+    подписчика (или всех подписчиков, если он не указан). Очередь разбирает
+    rebuild_timelines --pending, а до тех пор посты автора подмешиваются
+    при чтении, см. posts.timeline.
+    """
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='timeline_backfills'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Читатель',
+        related_name='+'
+    )
+
+    class Meta:
+        verbose_name = 'Дозаполнение лент'
+        verbose_name_plural = 'Дозаполнения лент'
+        ordering = ['created']
+        unique_together = ('author', 'user')
+
+    def __str__(self):
+        return f'Посты {self.author_id} в ленту {self.user_id or "всех"}'
+
+
+class SearchTerm(models.Model):
+    """
+    Строка обратного индекса: слово и частота его в публикации.
+
+    Запасной индекс полнотекстового поиска для баз без FTS5,
+    см. posts.search.
+    """
+    term = models.CharField('Слово', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Публикация',
+        related_name='search_terms',
+        # Архивные публикации (posts.archive) тоже ищутся.
+        db_constraint=False
+    )
+    frequency = models.PositiveIntegerField('Частота')
+
+    class Meta:
+        verbose_name = 'Слово индекса'
+        verbose_name_plural = 'Слова индекса'
+        unique_together = ('term', 'post')
+
+    def __str__(self):
+        return f'{self.term} в {self.post_id}'
+
+
+class ShardBucket(models.Model):
+    """
+    Карта шардов: корзина авторов и база, где лежат их публикации и
+    комментарии к ним (см. posts.sharding). Корзины без записи — в
+    основной базе.
+    """
+    bucket = models.PositiveSmallIntegerField('Корзина', primary_key=True)
+    alias = models.CharField('База', max_length=100)
+
+    class Meta:
+        verbose_name = 'Корзина шардов'
+        verbose_name_plural = 'Карта шардов'
+
+    def __str__(self):
+        return f'{self.bucket} в {self.alias}'
+
+
+class PostDirectory(models.Model):
+    """
+    Каталог публикаций при шардировании: выдаёт id новым публикациям и
+    помнит автора каждой, а по автору находится шард.
+    """
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+
+    class Meta:
+        verbose_name = 'Публикация в каталоге'
+        verbose_name_plural = 'Каталог публикаций'
+
+    def __str__(self):
+        return f'{self.pk} от {self.author_id}'
+
+
+class ArchivedPost(models.Model):
+    """
+    Публикация в архиве (см. posts.archive): те же поля и тот же id, что
+    были у Post. Архив только читается.
+    """
+    archived = True
+
+    text = models.TextField('Текст публикации')
+    pub_date = models.DateTimeField('Дата публикации')
+    updated_at = models.DateTimeField('Дата изменения')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='archived_posts',
+        verbose_name='Группа'
+    )
+    image = models.ImageField('Картинка', upload_to='posts/', blank=True)
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Архивная публикация'
+        verbose_name_plural = 'Архивные публикации'
+        ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='archived_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='archived_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='archived_group_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.text[:15]
+
+
+class ArchivedComment(models.Model):
+    """Комментарий к архивной публикации."""
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        verbose_name='Комментируемая публикация',
+        related_name='comments'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор комментария',
+        related_name='archived_comments'
+    )
+    text = models.TextField('Текст комментария')
+    created = models.DateTimeField('Время публикации комментария')
+
+    class Meta:
+        verbose_name = 'Архивный комментарий'
+        verbose_name_plural = 'Архивные комментарии'
+        ordering = ['created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='archived_comment_created_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.text[:15]
@@ -0,0 +1,397 @@
+import binascii
+import heapq
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# key — значение первого поля ключа сортировки (для ленты — pub_date).
+Cursor = namedtuple(
+    'Cursor', ('number', 'key', 'pk', 'skip'), defaults=(0,)
+)
+WindowItem = namedtuple('WindowItem', ('number', 'url'))
+
+
+def pack_cursor(cursor, key):
+    """Упаковывает курсор с уже сериализованным key в токен для URL."""
+    raw = f'{cursor.number}|{key}|{cursor.pk}|{cursor.skip}'
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def unpack_cursor(token, parse_key):
+    """
+    Распаковывает токен, разбирая key функцией parse_key; для испорченного
+    токена возвращает None. Ссылки окна пропускают меньше
+    settings.PAGINATOR_WINDOW_SIZE страниц, так что курсор с большим skip —
+    подделка, которая заставила бы читать лишние строки.
+    """
+    try:
+        raw = urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        number, key, pk, skip = raw.split('|')
+        cursor = Cursor(int(number), parse_key(key), int(pk), int(skip))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if cursor.key is None or cursor.number < 1:
+        return None
+    if not 0 <= cursor.skip <= settings.PAGINATOR_WINDOW_SIZE:
+        return None
+    return cursor
+
+
+def encode_cursor(cursor):
+    """Упаковывает позицию в ленте в непрозрачный токен для URL."""
+    return pack_cursor(cursor, cursor.key.isoformat())
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для испорченного токена возвращает None."""
+    return unpack_cursor(token, parse_datetime)
+
+
+class CursorPaginator(Paginator):
+    """
+    Keyset-пагинатор ленты публикаций по ключу (pub_date, id).
+
+    Страница выбирается условием на ключ последней (или первой) публикации
+    соседней страницы, поэтому глубокие страницы стоят столько же, сколько
+    первая, и не «съезжают» при появлении новых постов. Курсор может
+    пропускать несколько страниц (skip) — так строятся ссылки окна
+    пагинации. Старые ссылки вида ?page=N обслуживаются через OFFSET от
+    ближайшего конца ленты, но не дальше settings.PAGINATOR_MAX_OFFSET_PAGE
+    страниц от него.
+    """
+
+    key_fields = ('pub_date', 'pk')
+    decode_cursor = staticmethod(decode_cursor)
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.max_offset_page = settings.PAGINATOR_MAX_OFFSET_PAGE
+        if count is not None:
+            # Известное заранее число объектов (например, из счётчиков)
+            # избавляет от SELECT COUNT(*).
+            self.count = count
+
+    def get_cursor_page(self, params):
+        """Возвращает страницу по параметрам ?after=, ?before= или ?page=."""
+        if params.get('after'):
+            cursor = self.decode_cursor(params['after'])
+            if cursor is not None:
+                return self._page_after(cursor)
+        if params.get('before'):
+            cursor = self.decode_cursor(params['before'])
+            if cursor is not None:
+                return self._page_before(cursor)
+        if params.get('page'):
+            return self._page_by_number(params['page'])
+        return self._page_after(None)
+
+    def select(self, descending, position, bottom, top):
+        """
+        Возвращает публикации ленты с позиции bottom по top (не включая),
+        считая от position — ключа (pub_date, pk) — в заданном порядке.
+        Без position отсчёт идёт от начала (или конца) ленты.
+        """
+        return self.fetch(self._ordered(descending, position)[bottom:top])
+
+    def count_after(self, descending, position, limit=None):
+        """
+        Сколько публикаций ленты идёт после position в этом порядке (не
+        больше limit: такой подсчёт читает не больше limit строк индекса).
+        """
+        queryset = self._ordered(descending, position)
+        if limit is not None:
+            # min(всего, limit) от порядка не зависит.
+            queryset = queryset.order_by()[:limit]
+        return queryset.count()
+
+    def _ordered(self, descending, position):
+        date_field, pk_field = self.key_fields
+        prefix = '-' if descending else ''
+        queryset = self.object_list.order_by(
+            prefix + date_field, prefix + pk_field
+        )
+        if position is not None:
+            lookup = 'lt' if descending else 'gt'
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{lookup}': pub_date})
+                | Q(**{date_field: pub_date, f'{pk_field}__{lookup}': pk})
+            )
+        return queryset
+
+    def fetch(self, queryset):
+        """Превращает срез object_list в список публикаций."""
+        return list(queryset)
+
+    def _page_after(self, cursor):
+        if cursor is None:
+            items = self.select(True, None, 0, self.per_page + 1)
+            number = 1
+        else:
+            bottom = cursor.skip * self.per_page
+            items = self.select(
+                True, cursor[1:3], bottom, bottom + self.per_page + 1
+            )
+            number = cursor.number + cursor.skip + 1
+        return self._build_page(
+            items[:self.per_page], number, len(items) > self.per_page
+        )
+
+    def _page_before(self, cursor):
+        bottom = cursor.skip * self.per_page
+        items = self.select(
+            False, cursor[1:3], bottom, bottom + self.per_page + 1
+        )
+        if len(items) <= self.per_page:
+            # Дошли до начала ленты: отдаём полную первую страницу.
+            return self._page_after(None)
+        items = items[:self.per_page]
+        items.reverse()
+        number = max(cursor.number - cursor.skip - 1, 2)
+        return self._build_page(items, number, True)
+
+    def _page_by_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        number = max(number, 1)
+        if number > self.max_offset_page:
+            return self._page_from_tail(number)
+        bottom = (number - 1) * self.per_page
+        items = self.select(True, None, bottom, bottom + self.per_page + 1)
+        if not items and number > 1:
+            # Страница за пределами ленты: как и Paginator.get_page,
+            # отдаём последнюю доступную.
+            return self._page_by_number(self.num_pages)
+        return self._build_page(
+            items[:self.per_page], number, len(items) > self.per_page
+        )
+
+    def _page_from_tail(self, number):
+        num_pages = self.num_pages
+        if num_pages - number >= self.max_offset_page:
+            # Середина глубокой ленты через OFFSET недоступна.
+            return self._page_by_number(self.max_offset_page)
+        number = min(number, num_pages)
+        top = self.count - (number - 1) * self.per_page
+        bottom = max(top - self.per_page, 0)
+        items = self.select(False, None, bottom, top)
+        items.reverse()
+        return self._build_page(items, number, number < num_pages)
+
+    def _build_page(self, items, number, has_more):
+        page = Page(items, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if items and has_more:
+            page.next_cursor = self._cursor_for(items[-1], number)
+        if items and number > 1:
+            page.previous_cursor = self._cursor_for(items[0], number)
+        return page
+
+    @staticmethod
+    def _cursor_for(post, number, skip=0):
+        return encode_cursor(Cursor(number, post.pub_date, post.pk, skip))
+
+    def get_window(self, page, size):
+        """
+        Возвращает окно ссылок: первая и последняя страницы, size страниц
+        по обе стороны от текущей и многоточия (элементы с number=None)
+        на месте пропусков. Размер окна не зависит от числа страниц.
+
+        Последняя страница показывается, только если число объектов уже
+        известно (передано из счётчиков); иначе страницы впереди считаются
+        запросом не дальше окна, без SELECT COUNT(*) по всей ленте.
+        """
+        number = page.number
+        if 'count' in self.__dict__:
+            num_pages = max(self.num_pages, number)
+        else:
+            num_pages = number + self._pages_ahead(page, size)
+        start, end = max(number - size, 1), min(number + size, num_pages)
+        window = []
+        if start > 1:
+            window.append(WindowItem(1, '?'))
+        if start > 2:
+            window.append(WindowItem(None, None))
+        for i in range(start, end + 1):
+            window.append(WindowItem(i, self._url_for(page, i)))
+        if 'count' not in self.__dict__:
+            # Последняя страница неизвестна: за окном только многоточие.
+            if end < num_pages:
+                window.append(WindowItem(None, None))
+            return window
+        if end < num_pages - 1:
+            window.append(WindowItem(None, None))
+        if end < num_pages:
+            window.append(WindowItem(num_pages, f'?page={num_pages}'))
+        return window
+
+    def _pages_ahead(self, page, size):
+        # Одна страница сверх окна говорит, что за ним есть ещё.
+        if not page.next_cursor:
+            return 0
+        position = self.decode_cursor(page.next_cursor)[1:3]
+        found = self.count_after(True, position, (size + 1) * self.per_page)
+        return math.ceil(found / self.per_page)
+
+    def _url_for(self, page, number):
+        if number == page.number:
+            return None
+        if number == 1:
+            return '?'
+        if number < page.number:
+            cursor = self._cursor_for(
+                page[0], page.number, page.number - number - 1
+            )
+            return f'?before={cursor}'
+        cursor = self._cursor_for(
+            page[-1], page.number, number - page.number - 1
+        )
+        return f'?after={cursor}'
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """
+    Лента, собранная из нескольких упорядоченных источников.
+
+    Каждый источник — CursorPaginator над своим набором публикаций; страница
+    получается k-way слиянием их срезов по ключу (pub_date, pk). Публикация,
+    которая есть в нескольких источниках (например, в двух шардах во время
+    переноса), показывается один раз.
+    """
+
+    def __init__(self, sources, per_page, **kwargs):
+        super().__init__(sources, per_page, **kwargs)
+        self.sources = sources
+
+    def select(self, descending, position, bottom, top):
+        streams = [
+            source.select(descending, position, 0, top)
+            for source in self.sources
+        ]
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=descending
+        )
+        unique = (
+            next(group)
+            for _, group in groupby(merged, key=lambda post: post.pk)
+        )
+        return list(islice(unique, bottom, top))
+
+    def count_after(self, descending, position, limit=None):
+        total = sum(
+            source.count_after(descending, position, limit)
+            for source in self.sources
+        )
+        return total if limit is None else min(total, limit)
+
+    @cached_property
+    def count(self):
+        return sum(source.count for source in self.sources)
+
+
+class TieredCursorPaginator(CursorPaginator):
+    """
+    Лента из двух ярусов: свежие публикации (hot) и архив (cold), где
+    всё старше свежих. locate() возвращает границу — ключ (pub_date, pk)
+    самой новой публикации архива (None, если архив пуст) — и вызывается,
+    только когда нужен. Архив читается, только когда страница заходит за
+    границу: первые страницы стоят столько же, сколько без архива.
+    """
+
+    def __init__(self, hot, cold, locate, per_page, **kwargs):
+        super().__init__(hot.object_list, per_page, **kwargs)
+        self.hot = hot
+        self.cold = cold
+        self.locate = locate
+
+    @cached_property
+    def boundary(self):
+        return self.locate()
+
+    def _in_cold(self, position):
+        return self.boundary is not None and tuple(position) <= self.boundary
+
+    def select(self, descending, position, bottom, top):
+        if descending:
+            if position is not None and self._in_cold(position):
+                return self.cold.select(descending, position, bottom, top)
+            first, second = self.hot, self.cold
+        else:
+            if position is not None and not self._in_cold(position):
+                return self.hot.select(descending, position, bottom, top)
+            first, second = self.cold, self.hot
+        items = first.select(descending, position, bottom, top)
+        if len(items) == top - bottom:
+            return items
+        if first is self.hot and self.boundary is None:
+            # Архив пуст: читать его незачем.
+            return items
+        # Первый ярус кончился: считаем, сколько в нём было после
+        # position, и продолжаем вторым с его начала.
+        if items:
+            passed = bottom + len(items)
+        else:
+            passed = first.count_after(descending, position)
+        return items + second.select(
+            descending, None, max(bottom - passed, 0), top - passed
+        )
+
+    def count_after(self, descending, position, limit=None):
+        found = self.hot.count_after(descending, position, limit)
+        if limit is None:
+            return found + self.cold.count_after(descending, position)
+        if found >= limit:
+            # Архив не нужен: окну хватило свежих публикаций.
+            return found
+        return found + self.cold.count_after(
+            descending, position, limit - found
+        )
+
+    @cached_property
+    def count(self):
+        return self.hot.count + self.cold.count
+
+
+def _paginator(queryset, per_page):
+    # Список querysets (по одному на шард) сливается в одну ленту.
+    if isinstance(queryset, list):
+        if len(queryset) > 1:
+            return MergedCursorPaginator(
+                [CursorPaginator(item, per_page) for item in queryset],
+                per_page
+            )
+        queryset, = queryset
+    return CursorPaginator(queryset, per_page)
+
+
+def paginate(request, queryset, count=None, archive=None):
+    """
+    Возвращает страницу ленты для текущего запроса. Вместо queryset можно
+    передать список querysets (по одному на шард) — они сольются в одну
+    ленту. archive — (querysets архива, locate), см. posts.archive.tier
+    и TieredCursorPaginator: лента продолжится архивом.
+    """
+    per_page = settings.NUM_OF_POSTS_ON_PAGE
+    paginator = _paginator(queryset, per_page)
+    if archive is not None:
+        archived, locate = archive
+        paginator = TieredCursorPaginator(
+            paginator, _paginator(archived, per_page), locate, per_page
+        )
+    if count is not None:
+        # Известное заранее число объектов (например, из счётчиков)
+        # избавляет от SELECT COUNT(*).
+        paginator.count = count
+    return paginator.get_cursor_page(request.GET)
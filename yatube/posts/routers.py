@@ -0,0 +1,59 @@
+from core import replicas
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+
+from . import sharding
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+User = get_user_model()
+
+POST_MODELS = (Post, ArchivedPost)
+COMMENT_MODELS = (Comment, ArchivedComment)
+SHARDED_MODELS = POST_MODELS + COMMENT_MODELS
+
+
+class ShardRouter:
+    """
+    Публикации и комментарии, в том числе архивные, — в шард автора
+    (posts.sharding). Остальные модели достаются следующему роутеру;
+    только связи объекта из шарда (автор, группа, счётчики) читаются
+    с основной базы, а не из шарда.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not sharding.enabled():
+            return None
+        instance = hints.get('instance')
+        if model in SHARDED_MODELS:
+            if isinstance(instance, SHARDED_MODELS) and instance._state.db:
+                return instance._state.db
+            if isinstance(instance, User) and model in POST_MODELS:
+                return sharding.shard_for_author(instance.pk)
+            return None
+        if instance is not None and sharding.is_shard(instance._state.db):
+            return replicas.current() or DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not sharding.enabled() or model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, POST_MODELS):
+            alias = sharding.shard_for_author(instance.author_id)
+        elif isinstance(instance, COMMENT_MODELS):
+            alias = sharding.shard_for_comment(instance)
+        elif isinstance(instance, User) and model in POST_MODELS:
+            alias = sharding.shard_for_author(instance.pk)
+        else:
+            return None
+        replicas.note_write()
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding.enabled():
+            return None
+        databases = {*settings.POST_SHARDS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,51 @@
+"""Области поколенческого кэша (core.cache) для страниц публикаций."""
+from django.core.cache import cache
+
+FEED = 'global'
+# Сдвигается после каждой пачки архивирования (posts.archive).
+ARCHIVE = 'archive'
+KINDS = ('global', 'group', 'author', 'post')
+# Автор и группа публикации для for_detail; сбрасывается при её правке.
+DETAIL_KEY = 'post-detail-scopes:{}'
+
+
+def group(slug):
+    return f'group:{slug}'
+
+
+def author(username):
+    return f'author:{username}'
+
+
+def post(post_id):
+    return f'post:{post_id}'
+
+
+def for_post(instance):
+    """Области, на страницах которых виден пост (и где он был до правки)."""
+    affected = {FEED, author(instance.author.username), post(instance.pk)}
+    if instance.group_id:
+        affected.add(group(instance.group.slug))
+    previous = getattr(instance, '_previous', None)
+    if previous and previous['group__slug']:
+        affected.add(group(previous['group__slug']))
+    return affected
+
+
+def for_detail(post_id):
+    """
+    Области страницы поста: сам пост (правка, комментарии, архивирование),
+    его автор (число публикаций) и группа. Автор и группа поста
+    кэшируются, так что обычно областям не нужен запрос к базе.
+    """
+    key = DETAIL_KEY.format(post_id)
+    related = cache.get(key)
+    if related is None:
+        # Импорт здесь: posts.archive сам импортирует этот модуль.
+        from .archive import related_scopes
+        related = related_scopes(post_id)
+        if related is None:
+            # Публикации нет (пока): страница — 404 и зависит только от id.
+            return [post(post_id)]
+        cache.set(key, related, None)
+    return [post(post_id), *related]
@@ -0,0 +1,351 @@
+"""
+Полнотекстовый поиск по публикациям.
+
+Если SQLite собран с FTS5, индекс — виртуальная таблица posts_post_fts
+(создаётся миграцией 0017) с ранжированием bm25. Иначе работает обратный
+индекс в таблице SearchTerm, который строится на Python. Индекс
+обновляется сигналами Post и пересобирается командой rebuild_search_index.
+Какой индекс использовать, задаёт settings.SEARCH_BACKEND: 'fts5',
+'python' или 'auto'. Индекс один на все шарды публикаций (posts.sharding)
+и лежит в основной базе.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import (Case, Count, F, FloatField, Q, Sum, Value,
+                              When)
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+from . import archive, sharding
+from .models import ArchivedPost, Post, SearchTerm
+from .paginators import Cursor, CursorPaginator, pack_cursor, unpack_cursor
+
+FTS_TABLE = 'posts_post_fts'
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+MAX_QUERY_TERMS = 10
+BATCH_SIZE = 500
+DOCUMENTS_KEY = 'search-documents'
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре."""
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if len(token) <= MAX_TERM_LENGTH
+    ]
+
+
+def _fold(term):
+    # Как unicode61 с remove_diacritics у FTS5: диакритика латиницы не
+    # важна, а «й» и «ё» остаются отдельными буквами.
+    if term.isascii():
+        return term
+    folded = []
+    for char in term:
+        base = unicodedata.normalize('NFKD', char)[0]
+        folded.append(base if base.isascii() else char)
+    return ''.join(folded)
+
+
+def query_terms(query):
+    """Различные слова запроса, не больше MAX_QUERY_TERMS."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+class Fts5Index:
+    """Индекс на виртуальной таблице FTS5; rowid — id публикации."""
+
+    @staticmethod
+    def _match(terms):
+        # Каждое слово в кавычках: спецсинтаксис FTS5 из запроса не
+        # действует, слова объединяются через AND.
+        return ' '.join(f'"{term}"' for term in terms)
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text]
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            for model in (Post, ArchivedPost):
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE}(rowid, text) '
+                    f'SELECT id, text FROM {model._meta.db_table}'
+                )
+                for posts in sharding.fan_out(model.objects.all())[1:]:
+                    cursor.executemany(
+                        f'INSERT INTO {FTS_TABLE}(rowid, text) '
+                        f'VALUES (%s, %s)',
+                        posts.values_list('pk', 'text').iterator()
+                    )
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self._match(terms)]
+            )
+            return cursor.fetchone()[0]
+
+    def ranked(self, terms, descending, position, bottom, top):
+        """[(id публикации, релевантность)] в порядке (релевантность, id)."""
+        # bm25 тем меньше, чем документ релевантнее.
+        score = f'-bm25({FTS_TABLE})'
+        sql = (
+            f'SELECT rowid, {score} FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s'
+        )
+        params = [self._match(terms)]
+        op = '<' if descending else '>'
+        if position is not None:
+            sql += (f' AND ({score} {op} %s'
+                    f' OR ({score} = %s AND rowid {op} %s))')
+            params += [position[0], position[0], position[1]]
+        order = 'DESC' if descending else 'ASC'
+        sql += f' ORDER BY 2 {order}, rowid {order} LIMIT %s OFFSET %s'
+        params += [top - bottom, bottom]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def filter(self, queryset, terms):
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [self._match(terms)]
+        ))
+
+
+class InvertedIndex:
+    """Обратный индекс в таблице SearchTerm; ранжирование по TF-IDF."""
+
+    def index(self, post):
+        terms = Counter(map(_fold, tokenize(post.text)))
+        SearchTerm.objects.filter(post_id=post.pk).delete()
+        SearchTerm.objects.bulk_create(
+            (
+                SearchTerm(term=term, post_id=post.pk, frequency=frequency)
+                for term, frequency in terms.items()
+            ),
+            batch_size=BATCH_SIZE
+        )
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def rebuild(self):
+        SearchTerm.objects.all().delete()
+        for model in (Post, ArchivedPost):
+            for posts in sharding.fan_out(model.objects.only('pk', 'text')):
+                for post in posts.iterator():
+                    self.index(post)
+        cache.set(
+            DOCUMENTS_KEY, self._count_documents(),
+            settings.SEARCH_DOCUMENTS_CACHE_SEC
+        )
+
+    @staticmethod
+    def _count_documents():
+        return sum(
+            posts.count()
+            for model in (Post, ArchivedPost)
+            for posts in sharding.fan_out(model.objects.all())
+        )
+
+    def _documents(self):
+        """
+        Число публикаций для весов IDF. Подсчёт идёт по всем шардам и
+        таблицам, а весам точность не нужна, так что число хранится в кэше
+        SEARCH_DOCUMENTS_CACHE_SEC секунд и обновляется пересборкой.
+        """
+        total = cache.get(DOCUMENTS_KEY)
+        if total is None:
+            total = self._count_documents()
+            cache.set(
+                DOCUMENTS_KEY, total, settings.SEARCH_DOCUMENTS_CACHE_SEC
+            )
+        return total
+
+    def _matches(self, terms):
+        terms = set(map(_fold, terms))
+        return (
+            SearchTerm.objects
+            .filter(term__in=terms)
+            .values('post_id')
+            .annotate(matched=Count('pk'))
+            .filter(matched=len(terms))
+        )
+
+    def count(self, terms):
+        return self._matches(terms).count()
+
+    def _weights(self, terms):
+        terms = [_fold(term) for term in terms]
+        total = self._documents()
+        frequencies = dict(
+            SearchTerm.objects
+            .filter(term__in=terms)
+            .values_list('term')
+            .annotate(documents=Count('pk'))
+            .order_by()
+        )
+        return {
+            term: math.log(1 + total / (1 + frequencies.get(term, 0)))
+            for term in terms
+        }
+
+    def ranked(self, terms, descending, position, bottom, top):
+        """[(id публикации, релевантность)] в порядке (релевантность, id)."""
+        weights = self._weights(terms)
+        rows = self._matches(terms).annotate(score=Sum(
+            Case(
+                *(
+                    When(term=term, then=F('frequency') * Value(weight))
+                    for term, weight in weights.items()
+                ),
+                output_field=FloatField()
+            ),
+            output_field=FloatField()
+        ))
+        if position is not None:
+            lookup = 'lt' if descending else 'gt'
+            score, pk = position
+            rows = rows.filter(
+                Q(**{f'score__{lookup}': score})
+                | Q(score=score, **{f'post_id__{lookup}': pk})
+            )
+        prefix = '-' if descending else ''
+        rows = rows.order_by(prefix + 'score', prefix + 'post_id')
+        return list(rows.values_list('post_id', 'score')[bottom:top])
+
+    def filter(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(pk__in=SearchTerm.objects.filter(
+                term=_fold(term)
+            ).values('post_id'))
+        return queryset
+
+
+@lru_cache(maxsize=None)
+def _fts5_table_exists(database):
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def _fts5_available():
+    # Таблицу создаёт миграция, так что ответ для базы не меняется;
+    # без кэша каждая запись поста читала бы sqlite_master.
+    return (
+        connection.vendor == 'sqlite'
+        and _fts5_table_exists(connection.settings_dict['NAME'])
+    )
+
+
+def get_index():
+    """Индекс, выбранный settings.SEARCH_BACKEND."""
+    backend = settings.SEARCH_BACKEND
+    if backend == 'auto':
+        backend = 'fts5' if _fts5_available() else 'python'
+    return Fts5Index() if backend == 'fts5' else InvertedIndex()
+
+
+def index_post(post):
+    get_index().index(post)
+
+
+def remove_post(post_id):
+    get_index().remove(post_id)
+
+
+def rebuild():
+    """Пересобирает индекс по всем публикациям."""
+    get_index().rebuild()
+
+
+def filter_posts(queryset, query):
+    """Публикации queryset, содержащие все слова запроса."""
+    terms = query_terms(query)
+    if not terms:
+        return queryset
+    return get_index().filter(queryset, terms)
+
+
+def _parse_score(raw):
+    score = float(raw)
+    return score if math.isfinite(score) else None
+
+
+def decode_search_cursor(token):
+    return unpack_cursor(token, _parse_score)
+
+
+class SearchPaginator(CursorPaginator):
+    """
+    Результаты поиска по убыванию релевантности; ключ курсора —
+    (релевантность, id), так что следующая страница не пересчитывает
+    предыдущие через OFFSET.
+    """
+
+    decode_cursor = staticmethod(decode_search_cursor)
+
+    def __init__(self, query, per_page, **kwargs):
+        super().__init__(
+            Post.objects.select_related('author', 'group'), per_page,
+            **kwargs
+        )
+        self.terms = query_terms(query)
+        self.index = get_index()
+
+    @cached_property
+    def count(self):
+        return self.index.count(self.terms) if self.terms else 0
+
+    def count_after(self, descending, position, limit=None):
+        if not self.terms:
+            return 0
+        if limit is None:
+            limit = self.count
+        return len(self.index.ranked(
+            self.terms, descending, position, 0, limit
+        ))
+
+    def select(self, descending, position, bottom, top):
+        if not self.terms:
+            return []
+        rows = self.index.ranked(
+            self.terms, descending, position, bottom, top
+        )
+        posts = archive.in_bulk([post_id for post_id, _ in rows])
+        found = []
+        for post_id, score in rows:
+            if post_id in posts:
+                posts[post_id].search_score = score
+                found.append(posts[post_id])
+        return found
+
+    @staticmethod
+    def _cursor_for(post, number, skip=0):
+        return pack_cursor(
+            Cursor(number, post.search_score, post.pk, skip),
+            repr(post.search_score)
+        )
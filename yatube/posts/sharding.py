@@ -0,0 +1,537 @@
+"""
+Шардирование публикаций и комментариев по автору.
+
+Публикации автора и комментарии к ним лежат в одной из баз
+settings.POST_SHARDS (первая — основная). Автор попадает в корзину
+crc32(id) % BUCKETS, корзина — в шард по карте ShardBucket; корзины без
+записи живут в основной базе, так что нешардированная база — частный
+случай. Карта хранится в основной базе, процесс помнит её
+POST_SHARD_MAP_TTL_SEC секунд.
+
+id новым публикациям выдаёт каталог PostDirectory: по нему post_detail
+находит автора, а значит, и единственный нужный шард. Комментарии каждого
+шарда получают id из своего диапазона (COMMENT_ID_RANGE), поэтому
+переносятся между шардами вместе с id. Пользователи и группы копируются во
+все шарды, чтобы select_related работал внутри шарда; счётчики, подписки,
+ленты, поисковый индекс и очередь миниатюр остаются в основной базе.
+
+Запросы направляет posts.routers.ShardRouter, ленты по всем шардам
+сливает MergedCursorPaginator (fan_out), корзины между шардами без
+остановки сайта переносит move_bucket (команда reshard).
+"""
+import time
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (ArchivedComment, ArchivedPost, Comment, Group, Post,
+                     PostDirectory, ShardBucket, ThumbnailTask,
+                     TimelineEntry)
+
+User = get_user_model()
+
+BUCKETS = 64
+BATCH_SIZE = 500
+COMMENT_ID_RANGE = 2 ** 40
+AUTHOR_KEY = 'post-author:{}'
+# Справочные таблицы, которые есть в каждом шарде.
+REFERENCE_MODELS = (User, Group)
+# Публикации и их комментарии: горячие и архивные (posts.archive).
+COMMENT_MODELS = {Post: Comment, ArchivedPost: ArchivedComment}
+
+_map = {'loaded': None, 'buckets': {}, 'directory': False}
+
+
+def enabled():
+    return len(settings.POST_SHARDS) > 1
+
+
+def aliases():
+    return list(settings.POST_SHARDS)
+
+
+def is_shard(alias):
+    """Дополнительный шард (не основная база)?"""
+    return alias != DEFAULT_DB_ALIAS and alias in settings.POST_SHARDS
+
+
+def bucket(author_id):
+    return zlib.crc32(str(author_id).encode()) % BUCKETS
+
+
+def shard_map():
+    """{корзина: шард} не старше POST_SHARD_MAP_TTL_SEC."""
+    now = time.monotonic()
+    if (
+        _map['loaded'] is None
+        or now - _map['loaded'] >= settings.POST_SHARD_MAP_TTL_SEC
+    ):
+        _map['buckets'] = dict(
+            ShardBucket.objects.using(DEFAULT_DB_ALIAS)
+            .values_list('bucket', 'alias')
+        )
+        _map['loaded'] = now
+    return _map['buckets']
+
+
+def reset():
+    """Забывает карту: следующий запрос прочитает её заново."""
+    _map['loaded'] = None
+    _map['directory'] = False
+
+
+def shard_for_author(author_id):
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    return shard_map().get(bucket(author_id), DEFAULT_DB_ALIAS)
+
+
+def authors_of(post_ids):
+    """
+    {id публикации: id автора} по каталогу. Автор публикации не меняется,
+    так что ответ кэшируется навсегда; публикаций, которых нет в каталоге
+    (залитых мимо Post.save), в ответе нет.
+    """
+    keys = {AUTHOR_KEY.format(pk): pk for pk in post_ids}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [pk for pk in post_ids if pk not in found]
+    if missing:
+        fetched = dict(
+            PostDirectory.objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk__in=missing)
+            .values_list('pk', 'author_id')
+        )
+        cache.set_many(
+            {AUTHOR_KEY.format(pk): author for pk, author in fetched.items()},
+            None
+        )
+        found.update(fetched)
+    return found
+
+
+def shard_for_post(post_id):
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    author_id = authors_of([post_id]).get(post_id)
+    if author_id is None:
+        return DEFAULT_DB_ALIAS
+    return shard_for_author(author_id)
+
+
+def shard_for_comment(comment):
+    """Шард комментария — шард его публикации."""
+    if type(comment).post.is_cached(comment):
+        return shard_for_author(comment.post.author_id)
+    return shard_for_post(comment.post_id)
+
+
+def place(instance, save_kwargs):
+    """
+    Готовит новую публикацию или комментарий к Model.save: публикация
+    получает id из каталога, и обе пишутся в шард по карте, даже если
+    база уже выбрана без объекта (Post.objects.create).
+    """
+    if isinstance(instance, Post):
+        alias = shard_for_author(instance.author_id)
+        if instance.pk is None:
+            if not _map['directory']:
+                catch_up_directory()
+                _map['directory'] = True
+            instance.pk = PostDirectory.objects.using(DEFAULT_DB_ALIAS).create(
+                author_id=instance.author_id
+            ).pk
+            # Строки с таким id нет ни в одном шарде: сразу INSERT.
+            save_kwargs['force_insert'] = True
+    else:
+        alias = shard_for_comment(instance)
+    if save_kwargs.get('using') is not None:
+        save_kwargs['using'] = alias
+
+
+def for_author(queryset, author_id):
+    """queryset публикаций (или комментариев) автора — в его шард."""
+    if not enabled():
+        return queryset
+    return queryset.using(shard_for_author(author_id))
+
+
+def for_post(queryset, post_id):
+    """queryset по одной публикации — в её шард."""
+    if not enabled():
+        return queryset
+    return queryset.using(shard_for_post(post_id))
+
+
+def fan_out(queryset):
+    """Список querysets: по одному на шард (без шардов — сам queryset)."""
+    if not enabled():
+        return [queryset]
+    return [queryset.using(alias) for alias in aliases()]
+
+
+def by_author(queryset, author_ids):
+    """
+    Публикации авторов author_ids: по queryset на каждый шард, где они
+    есть.
+    """
+    if not enabled():
+        return [queryset.filter(author_id__in=author_ids)]
+    grouped = defaultdict(list)
+    for author_id in author_ids:
+        grouped[shard_for_author(author_id)].append(author_id)
+    return [
+        queryset.using(alias).filter(author_id__in=ids)
+        for alias, ids in grouped.items()
+    ]
+
+
+def in_bulk(queryset, post_ids):
+    """queryset.in_bulk(post_ids) по всем шардам: запрос на шард."""
+    if not enabled():
+        return queryset.in_bulk(post_ids)
+    authors = authors_of(post_ids)
+    grouped = defaultdict(list)
+    for pk in post_ids:
+        alias = (
+            shard_for_author(authors[pk]) if pk in authors
+            else DEFAULT_DB_ALIAS
+        )
+        grouped[alias].append(pk)
+    found = {}
+    for alias, ids in grouped.items():
+        found.update(queryset.using(alias).in_bulk(ids))
+    return found
+
+
+def _quoted(alias, model, field_name):
+    quote = connections[alias].ops.quote_name
+    field = (
+        model._meta.pk if field_name == 'pk'
+        else model._meta.get_field(field_name)
+    )
+    return quote(model._meta.db_table), quote(field.column)
+
+
+def copy_rows(alias, model, objects):
+    """
+    Записывает объекты в базу alias как есть, с теми же id (INSERT OR
+    REPLACE, без сигналов и auto_now).
+    """
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    sql = 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields))
+    )
+    rows = [
+        [
+            field.get_db_prep_save(getattr(obj, field.attname), connection)
+            for field in fields
+        ]
+        for obj in objects
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def delete_rows(alias, model, values, field_name='pk'):
+    """
+    Удаляет строки, у которых field_name в values, без сигналов и
+    каскада Django.
+    """
+    if not values:
+        return
+    table, column = _quoted(alias, model, field_name)
+    placeholders = ', '.join(['%s'] * len(values))
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {column} IN ({placeholders})',
+            list(values)
+        )
+
+
+def _batches(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def replicate(model, objects):
+    """Копирует пользователей или группы из основной базы во все шарды."""
+    for alias in aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            copy_rows(alias, model, objects)
+
+
+def unreplicate(instance):
+    """Убирает удалённого пользователя или группу из шардов."""
+    for alias in aliases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        for post_model, comment_model in COMMENT_MODELS.items():
+            posts = post_model.objects.using(alias)
+            if isinstance(instance, Group):
+                posts.filter(group_id=instance.pk).update(group=None)
+                continue
+            # Через ORM: сигналы уберут публикации из лент и индекса.
+            posts.filter(author_id=instance.pk).delete()
+            comment_model.objects.using(alias).filter(
+                author_id=instance.pk
+            ).delete()
+        delete_rows(alias, type(instance), [instance.pk])
+
+
+def post_deleted(post):
+    """
+    Чистит за удалённой публикацией основную базу: каскад Django удалял
+    только строки той базы, где лежала публикация.
+    """
+    if not enabled():
+        return
+    PostDirectory.objects.using(DEFAULT_DB_ALIAS).filter(pk=post.pk).delete()
+    if post._state.db != DEFAULT_DB_ALIAS:
+        TimelineEntry.objects.filter(post_id=post.pk).delete()
+        ThumbnailTask.objects.filter(post_id=post.pk).delete()
+
+
+def plan(targets):
+    """{корзина: шард}: корзины поровну по шардам targets."""
+    return {
+        number: targets[number % len(targets)] for number in range(BUCKETS)
+    }
+
+
+def prepare(alias, batch_size=BATCH_SIZE):
+    """
+    Готовит шард: копирует в него пользователей и группы и отводит
+    комментариям диапазон id по номеру шарда в POST_SHARDS.
+    """
+    if alias != DEFAULT_DB_ALIAS:
+        for model in REFERENCE_MODELS:
+            objects = model.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+            for batch in _batches(objects.iterator(), batch_size):
+                copy_rows(alias, model, batch)
+    start = aliases().index(alias) * COMMENT_ID_RANGE
+    raise_sequence(alias, Comment._meta.db_table, start)
+
+
+def _sequence(cursor, table):
+    cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def raise_sequence(alias, table, value):
+    """Счётчик AUTOINCREMENT таблицы table базы alias — не меньше value."""
+    with connections[alias].cursor() as cursor:
+        current = _sequence(cursor, table)
+        if current is None:
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                [table, value]
+            )
+        elif current < value:
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = %s WHERE name = %s',
+                [value, table]
+            )
+
+
+def catch_up_directory():
+    """
+    Подтягивает счётчик id каталога к счётчику posts_post основной базы.
+    Публикации, созданные без шардов после миграции 0019, в каталог не
+    попали (до reshard их находят в основной базе), но их id каталог
+    выдавать уже не должен.
+    """
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        value = _sequence(cursor, Post._meta.db_table)
+    if value is not None:
+        raise_sequence(
+            DEFAULT_DB_ALIAS, PostDirectory._meta.db_table, value
+        )
+
+
+def index_directory(alias, batch_size=BATCH_SIZE):
+    """
+    Вносит в каталог публикации шарда, в том числе архивные, которых в нём
+    нет (залитые мимо Post.save, например, до включения шардирования).
+    Возвращает их число.
+    """
+    added = 0
+    for model in COMMENT_MODELS:
+        rows = (
+            model.objects.using(alias).order_by('pk')
+            .values_list('pk', 'author_id').iterator()
+        )
+        added += _index(rows, batch_size)
+    return added
+
+
+def _index(rows, batch_size):
+    added = 0
+    for batch in _batches(rows, batch_size):
+        known = set(
+            PostDirectory.objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk__in=[pk for pk, _ in batch])
+            .values_list('pk', flat=True)
+        )
+        PostDirectory.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            PostDirectory(pk=pk, author_id=author_id)
+            for pk, author_id in batch if pk not in known
+        )
+        added += len(batch) - len(known)
+    return added
+
+
+def _delete_posts(alias, post_ids, batch_size, model=Post):
+    for batch in _batches(post_ids, batch_size):
+        with transaction.atomic(using=alias):
+            delete_rows(alias, COMMENT_MODELS[model], batch, 'post')
+            delete_rows(alias, model, batch)
+
+
+def sweep(alias, batch_size=BATCH_SIZE):
+    """
+    Удаляет из шарда публикации авторов, чьи корзины по карте живут в
+    другом: остатки прерванного переноса. Возвращает их число.
+    """
+    reset()
+    swept = 0
+    for model in COMMENT_MODELS:
+        authors = (
+            model.objects.using(alias).order_by()
+            .values_list('author_id', flat=True).distinct()
+        )
+        strays = [
+            author_id for author_id in authors
+            if shard_for_author(author_id) != alias
+        ]
+        post_ids = list(
+            model.objects.using(alias).filter(author_id__in=strays)
+            .values_list('pk', flat=True)
+        )
+        _delete_posts(alias, post_ids, batch_size, model)
+        swept += len(post_ids)
+    return swept
+
+
+def _copy(source, target, posts, batch_size, pause):
+    """
+    Копирует публикации posts из source в target пачками по id вместе
+    с комментариями; возвращает множество скопированных id.
+    """
+    comment_model = COMMENT_MODELS[posts.model]
+    copied = set()
+    last = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last).order_by('pk')[:batch_size])
+        if not batch:
+            return copied
+        post_ids = [post.pk for post in batch]
+        comments = list(
+            comment_model.objects.using(source).filter(post_id__in=post_ids)
+        )
+        with transaction.atomic(using=target):
+            # Комментарии публикации переписываются целиком, чтобы
+            # удалённые в источнике не остались в цели.
+            delete_rows(target, comment_model, post_ids, 'post')
+            copy_rows(target, posts.model, batch)
+            copy_rows(target, comment_model, comments)
+        copied.update(post_ids)
+        last = post_ids[-1]
+        if pause:
+            time.sleep(pause)
+
+
+def _prune(source, target, authors, switched):
+    # Удалённое в источнике до переключения удаляется и из цели; всё,
+    # что создано позже, в цель уже писали сами вью.
+    kept_posts = set(
+        Post.objects.using(source).filter(author_id__in=authors)
+        .values_list('pk', flat=True)
+    )
+    stale_posts = [
+        pk for pk in
+        Post.objects.using(target)
+        .filter(author_id__in=authors, pub_date__lt=switched)
+        .values_list('pk', flat=True)
+        if pk not in kept_posts
+    ]
+    kept_comments = set(
+        Comment.objects.using(source).filter(post__author_id__in=authors)
+        .values_list('pk', flat=True)
+    )
+    stale_comments = [
+        pk for pk in
+        Comment.objects.using(target)
+        .filter(post__author_id__in=authors, created__lt=switched)
+        .values_list('pk', flat=True)
+        if pk not in kept_comments
+    ]
+    for batch in _batches(stale_comments, BATCH_SIZE):
+        delete_rows(target, Comment, batch)
+    _delete_posts(target, stale_posts, BATCH_SIZE)
+
+
+def move_bucket(number, target, batch_size=BATCH_SIZE, pause=0.0,
+                wait=None):
+    """
+    Переносит корзину number в шард target, не останавливая запись.
+
+    Публикации с комментариями копируются пачками, пока чтения и записи
+    идут в старый шард; затем карта переключается, и перенос ждёт wait
+    секунд (по умолчанию POST_SHARD_MAP_TTL_SEC), пока карту перечитают
+    все процессы. После этого догоняются изменения, сделанные в старом
+    шарде с начала копирования, и корзина удаляется из него. Архив
+    только читается, поэтому копируется целиком до переключения. Между
+    пачками — пауза pause секунд. Возвращает число перенесённых
+    публикаций.
+    """
+    reset()
+    source = shard_map().get(number, DEFAULT_DB_ALIAS)
+    if source == target:
+        return 0
+    authors = [
+        pk for pk in
+        User.objects.using(DEFAULT_DB_ALIAS)
+        .values_list('pk', flat=True).iterator()
+        if bucket(pk) == number
+    ]
+    posts = Post.objects.using(source).filter(author_id__in=authors)
+    archived = ArchivedPost.objects.using(source).filter(
+        author_id__in=authors
+    )
+    started = timezone.now()
+    copied = _copy(source, target, posts, batch_size, pause)
+    copied |= _copy(source, target, archived, batch_size, pause)
+
+    switched = timezone.now()
+    ShardBucket.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        bucket=number, defaults={'alias': target}
+    )
+    reset()
+    time.sleep(settings.POST_SHARD_MAP_TTL_SEC if wait is None else wait)
+
+    changed = posts.filter(
+        Q(updated_at__gte=started) | Q(comments__created__gte=started)
+    ).distinct()
+    copied |= _copy(source, target, changed, batch_size, pause)
+    _prune(source, target, authors, switched)
+    _delete_posts(
+        source, list(posts.values_list('pk', flat=True)), batch_size
+    )
+    _delete_posts(
+        source, list(archived.values_list('pk', flat=True)), batch_size,
+        ArchivedPost
+    )
+    return len(copied)
@@ -0,0 +1,130 @@
+from core.cache import bump
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (archive, counters, scopes, search, sharding, thumbnails,
+               timeline)
+from .models import ArchivedPost, Comment, Follow, Group, Post, User
+
+
+def follow_scopes(follow):
+    """Профили обеих сторон: кнопка подписки и счётчики."""
+    return (
+        scopes.author(follow.author.username),
+        scopes.author(follow.user.username),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, using, **kwargs):
+    """Запоминает прежние группу, картинку и текст: они могли измениться."""
+    if instance.pk and not instance._state.adding:
+        instance._previous = (
+            Post.objects
+            .using(using)
+            .filter(pk=instance.pk)
+            .values('group__slug', 'image', 'text')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    """Учитывает новый пост и раскладывает его по лентам подписчиков."""
+    if created:
+        counters.post_added(instance)
+        timeline.fan_out(instance)
+    previous = getattr(instance, '_previous', None)
+    if previous is None or previous['text'] != instance.text:
+        search.index_post(instance)
+    if instance.image and (
+        previous is None or previous['image'] != instance.image.name
+    ):
+        thumbnails.enqueue(instance)
+    # Правка могла сменить группу поста.
+    cache.delete(scopes.DETAIL_KEY.format(instance.pk))
+    bump(*scopes.for_post(instance))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.post_removed(instance)
+    search.remove_post(instance.pk)
+    sharding.post_deleted(instance)
+    bump(*scopes.for_post(instance))
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def archived_post_deleted(sender, instance, **kwargs):
+    """
+    Архивная публикация удаляется только вместе с автором: ленты и индекс
+    ссылаются на неё без внешнего ключа, так что чистим их сами.
+    """
+    counters.post_removed(instance)
+    search.remove_post(instance.pk)
+    timeline.post_removed(instance)
+    sharding.post_deleted(instance)
+    bump(*scopes.for_post(instance), archive.SCOPE)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump(scopes.FEED, scopes.group(instance.slug))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """Имя автора выводится на его страницах и в общих лентах."""
+    # Вход в систему сохраняет только last_login — страницы не меняются.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump(scopes.author(instance.username), scopes.FEED)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def reference_saved(sender, instance, using, **kwargs):
+    """Пользователи и группы нужны в каждом шарде публикаций."""
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS:
+        sharding.replicate(sender, [instance])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def reference_deleted(sender, instance, using, **kwargs):
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS:
+        sharding.unreplicate(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_added(instance)
+    bump(scopes.post(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_removed(instance)
+    bump(scopes.post(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    """Учитывает подписку и дозаполняет ленту нового подписчика."""
+    if created:
+        counters.follow_added(instance)
+        timeline.backfill(instance)
+    bump(*follow_scopes(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Учитывает отписку и вычищает ленту."""
+    counters.follow_removed(instance)
+    timeline.prune(instance)
+    bump(*follow_scopes(instance))
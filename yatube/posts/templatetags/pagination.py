@@ -0,0 +1,12 @@
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+
+@register.simple_tag
+def page_window(page_obj, size=None):
+    """Окно номеров страниц вокруг текущей для posts/includes/paginator."""
+    if size is None:
+        size = settings.PAGINATOR_WINDOW_SIZE
+    return page_obj.paginator.get_window(page_obj, size)
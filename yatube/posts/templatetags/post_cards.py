@@ -0,0 +1,61 @@
+from hashlib import md5
+
+from core import metrics
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from .. import thumbnails
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/post_card.html'
+
+
+def card_key(post, variant):
+    """
+    Ключ отрендеренной карточки: версия поста (updated_at) плюс всё, что
+    карточка берёт у автора и группы, и вариант разметки.
+    """
+    group = post.group
+    version = md5('|'.join((
+        post.updated_at.isoformat(),
+        post.author.username,
+        post.author.get_full_name(),
+        group.slug if group else '',
+        group.title if group else '',
+    )).encode()).hexdigest()
+    return f'post_card:{post.pk}:{variant}:{version}'
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """
+    Карточки постов страницы: одно обращение get_many к кэшу, промахи
+    рендерятся из posts/post_card.html и сохраняются одним set_many.
+    """
+    request = context.get('request')
+    resolver_match = getattr(request, 'resolver_match', None)
+    on_profile = bool(
+        resolver_match and resolver_match.view_name == 'posts:profile'
+    )
+    variant = f'{int(on_profile)}{int(bool(context.get("group_page")))}'
+    posts = list(posts)
+    keys = [card_key(post, variant) for post in posts]
+    cards = cache.get_many(keys)
+    missed_posts = [
+        post for post, key in zip(posts, keys) if key not in cards
+    ]
+    metrics.note('cache:card:hit', len(posts) - len(missed_posts))
+    metrics.note('cache:card:miss', len(missed_posts))
+    thumbnails.prefetch(missed_posts)
+    missed = {}
+    card_template = context.template.engine.get_template(CARD_TEMPLATE)
+    for post in missed_posts:
+        with context.push(post=post):
+            missed[card_key(post, variant)] = card_template.render(context)
+    if missed:
+        cache.set_many(missed, settings.POST_CARD_CACHE_TIMEOUT_SEC)
+        cards.update(missed)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,17 @@
+from django import template
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_thumbnail(post):
+    """
+    Готовая миниатюра картинки поста или None, если воркер её ещё не
+    сгенерировал: шаблон тогда показывает оригинал. Берётся из
+    thumbnails.prefetch, если страница подгрузила миниатюры заранее.
+    """
+    if hasattr(post, 'prefetched_thumbnail'):
+        return post.prefetched_thumbnail
+    return thumbnails.lookup(post.image)
@@ -0,0 +1,157 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import archive
+from ..models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                      Post, TimelineEntry)
+from ..paginators import paginate
+
+User = get_user_model()
+
+HOT = 7
+OLD = 8
+
+
+class ArchiveTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.author = User.objects.create(username='Im_author')
+        self.reader = User.objects.create(username='Im_reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        now = timezone.now()
+        for i in range(HOT + OLD):
+            post = Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}'
+            )
+            age = timedelta(days=400) if i < OLD else timedelta()
+            # Старые — первые OLD постов, порядок дат совпадает с id.
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - age - timedelta(minutes=HOT + OLD - i)
+            )
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.old_post = Post.objects.order_by('pub_date').first()
+        Comment.objects.create(
+            post=self.old_post, author=self.reader, text='Старый комментарий'
+        )
+        # Все id от новых к старым — порядок любой ленты.
+        self.expected = list(
+            Post.objects.order_by('-pub_date').values_list('pk', flat=True)
+        )
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_posts', *args, stdout=out)
+        return out.getvalue()
+
+    def walk(self, url, params=None):
+        """id публикаций со всех страниц ленты по ссылкам «дальше»."""
+        found = []
+        cursor = {}
+        while True:
+            response = self.client.get(url, {**(params or {}), **cursor})
+            page_obj = response.context['page_obj']
+            found += [post.pk for post in page_obj]
+            if page_obj.next_cursor is None:
+                return found
+            cursor = {'after': page_obj.next_cursor}
+
+    def test_moves_old_posts_with_comments(self):
+        self.assertIn(str(OLD), self.archive('--batch-size', '3'))
+        self.assertEqual(Post.objects.count(), HOT)
+        self.assertEqual(ArchivedPost.objects.count(), OLD)
+        self.assertFalse(Comment.objects.exists())
+        comment = ArchivedComment.objects.get()
+        self.assertEqual(comment.post_id, self.old_post.pk)
+        self.assertEqual(comment.text, 'Старый комментарий')
+        self.assertEqual(
+            ArchivedPost.objects.get(pk=self.old_post.pk).comments_count, 1
+        )
+
+    def test_resumable_with_limit(self):
+        """Прерванное архивирование продолжается с того же места."""
+        self.archive('--limit', '5', '--batch-size', '2')
+        self.assertEqual(ArchivedPost.objects.count(), 5)
+        self.assertEqual(
+            list(ArchivedPost.objects.order_by('pk')
+                 .values_list('pk', flat=True)),
+            sorted(self.expected[-5:])
+        )
+        self.archive()
+        self.assertEqual(ArchivedPost.objects.count(), OLD)
+        self.assertEqual(archive.run(), 0)
+
+    def test_feeds_continue_into_archive(self):
+        self.archive()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'Im_author'}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.walk(url), self.expected)
+                page_obj = self.client.get(url, {'page': 2}).context[
+                    'page_obj'
+                ]
+                self.assertEqual(
+                    [post.pk for post in page_obj],
+                    self.expected[settings.NUM_OF_POSTS_ON_PAGE:]
+                )
+                self.assertEqual(page_obj.paginator.count, HOT + OLD)
+
+    def test_first_page_skips_archive(self):
+        """Пока лента не дошла до архива, его таблица не читается."""
+        self.archive('--days', '0', '--limit', '3')
+        tier = archive.tier([ArchivedPost.objects.all()])
+        request = RequestFactory().get('/')
+        with CaptureQueriesContext(connection) as queries:
+            page_obj = paginate(request, Post.objects.all(), archive=tier)
+        self.assertEqual(len(page_obj), settings.NUM_OF_POSTS_ON_PAGE)
+        for query in queries:
+            self.assertNotIn(ArchivedPost._meta.db_table, query['sql'])
+
+    def test_post_detail_resolves_archived(self):
+        self.archive()
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.old_post.pk}
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['post'].archived)
+        self.assertEqual(len(response.context['comments']), 1)
+        self.assertNotContains(
+            response,
+            reverse('posts:add_comment', kwargs={'post_id': self.old_post.pk})
+        )
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.old_post.pk}),
+            {'text': 'Поздно'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_finds_archived(self):
+        self.archive()
+        found = self.walk(reverse('posts:search'), {'q': 'Пост'})
+        self.assertCountEqual(found, self.expected)
+
+    def test_author_deletion_removes_archive(self):
+        self.archive()
+        self.author.delete()
+        self.assertFalse(ArchivedPost.objects.exists())
+        self.assertFalse(ArchivedComment.objects.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
@@ -0,0 +1,53 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from .. import audit, dataset
+from ..transfer import rebuild_derived
+
+
+class PlanProblemsTests(SimpleTestCase):
+    def test_problems(self):
+        plan = [
+            'SCAN posts_post',
+            'SCAN posts_post USING INDEX post_pub_date_idx',
+            'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN posts_post_fts VIRTUAL TABLE INDEX 0:M1',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(
+            audit.problems(plan),
+            ['SCAN posts_post', 'USE TEMP B-TREE FOR ORDER BY']
+        )
+
+
+class AuditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        dataset.generate(30, 3, 200, 100, 5, seed=1)
+        rebuild_derived()
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(
+                cursor, 'posts_post'
+            ))
+
+    def test_feeds_use_indexes(self):
+        """С индексами ленты не сортируются во временном B-дереве."""
+        findings = [
+            finding for finding in audit.audit(repeat=1)
+            if finding.scenario in ('index', 'group_posts', 'profile')
+            and 'ORDER BY "posts_post"."pub_date" DESC' in finding.sql
+        ]
+        self.assertEqual(len(findings), 3)
+        for finding in findings:
+            with self.subTest(scenario=finding.scenario):
+                self.assertEqual(finding.problems, [])
+                self.assertIn(
+                    'USE TEMP B-TREE FOR ORDER BY', finding.problems_before
+                )
+
+    def test_indexes_are_restored(self):
+        with audit.without_indexes():
+            self.assertNotIn('post_pub_date_idx', self.index_names())
+        self.assertIn('post_pub_date_idx', self.index_names())
@@ -0,0 +1,45 @@
+from django.test import SimpleTestCase, TestCase
+
+from .. import benchmarks, dataset
+from ..transfer import rebuild_derived
+
+
+class BenchmarkHelpersTests(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(values, 0.5), 50)
+        self.assertEqual(benchmarks.percentile(values, 0.95), 95)
+        self.assertEqual(benchmarks.percentile([7], 0.95), 7)
+
+    def test_compare(self):
+        baseline = {'small': {
+            'index': {'p95_ms': 10, 'queries': 4},
+            'profile': {'p95_ms': 10, 'queries': 4},
+        }}
+        results = {
+            'small': {
+                'index': {'p95_ms': 11, 'queries': 4},
+                'profile': {'p95_ms': 20, 'queries': 5},
+            },
+            'medium': {'index': {'p95_ms': 100, 'queries': 9}},
+        }
+        self.assertEqual(
+            benchmarks.compare(results, baseline, threshold=0.2),
+            [
+                ('small', 'profile', 'p95_ms', 10, 20),
+                ('small', 'profile', 'queries', 4, 5),
+            ]
+        )
+
+
+class BenchmarkRunTests(TestCase):
+    def test_run_covers_all_views(self):
+        dataset.generate(30, 2, 100, 50, 5, seed=1)
+        rebuild_derived()
+        results = benchmarks.run(iterations=2)
+        self.assertEqual(set(results), {
+            'index', 'group_posts', 'profile', 'post_detail',
+            'follow_index', 'post_create', 'add_comment',
+        })
+        self.assertGreater(results['index']['bytes'], 0)
+        self.assertGreater(results['post_create']['queries'], 0)
@@ -0,0 +1,65 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+
+from .. import dataset
+from ..models import AuthorStats, Follow, Post, ThumbnailTask
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateDatasetTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, **options):
+        call_command(
+            'generate_dataset', '--users=50', '--groups=3', '--posts=300',
+            '--comments=100', '--follows-per-user=5', *options.get('args', ()),
+            stdout=StringIO()
+        )
+
+    def test_counts_and_derived_data(self):
+        self.generate()
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(
+            sum(AuthorStats.objects.values_list('posts_count', flat=True)),
+            300
+        )
+        self.assertGreater(Follow.objects.count(), 0)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+
+    def test_power_law_authors(self):
+        """Самый активный автор пишет намного больше среднего."""
+        self.generate()
+        per_author = list(
+            Post.objects.values('author').annotate(total=Count('pk'))
+            .order_by('-total').values_list('total', flat=True)
+        )
+        self.assertGreater(per_author[0], 5 * 300 / 50)
+
+    def test_deterministic(self):
+        def snapshot():
+            return list(
+                Post.objects.order_by('pk').values_list('text', 'pub_date')
+            )
+
+        dataset.generate(20, 2, 50, 10, 3, seed=7)
+        first = snapshot()
+        Post.objects.all().delete()
+        dataset.generate(20, 2, 50, 10, 3, seed=7)
+        second = snapshot()
+        self.assertEqual(first, second)
+
+    def test_images(self):
+        self.generate(args=['--image-share=1'])
+        self.assertFalse(Post.objects.filter(image='').exists())
+        self.assertEqual(ThumbnailTask.objects.count(), 300)
@@ -0,0 +1,147 @@
+import importlib
+from io import BytesIO
+from unittest import mock
+
+from core import metrics
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from PIL import Image
+
+from .. import images
+from ..forms import PostForm
+from .test_thumbnails import SMALL_GIF
+
+# Тег EXIF Orientation: 6 — повернуть на 90° по часовой стрелке.
+ORIENTATION = 0x0112
+
+
+def make_upload(name='photo.jpg', size=(40, 20), image_format='JPEG',
+                mode='RGB', orientation=None):
+    image = Image.new(mode, size)
+    output = BytesIO()
+    params = {}
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[ORIENTATION] = orientation
+        params['exif'] = exif.tobytes()
+    image.save(output, image_format, **params)
+    return SimpleUploadedFile(name, output.getvalue(), 'image/jpeg')
+
+
+@override_settings(
+    POST_IMAGE_MAX_SIDE=32,
+    POST_IMAGE_FORMAT='JPEG',
+    POST_IMAGE_QUALITY=80
+)
+class NormalizeTests(SimpleTestCase):
+    def test_size_is_capped(self):
+        """Большая сторона ужимается до POST_IMAGE_MAX_SIDE с пропорциями."""
+        result = images.normalize(make_upload(size=(64, 16)))
+        self.assertEqual(Image.open(result).size, (32, 8))
+
+    def test_exif_orientation_applied_and_stripped(self):
+        """Ориентация применяется к пикселям, EXIF не сохраняется."""
+        result = images.normalize(make_upload(size=(30, 10), orientation=6))
+        image = Image.open(result)
+        self.assertEqual(image.size, (10, 30))
+        self.assertNotIn(ORIENTATION, image.getexif())
+        self.assertNotIn('exif', image.info)
+
+    def test_reencoded_to_configured_format(self):
+        """PNG с прозрачностью перекодируется в JPEG с новым расширением."""
+        result = images.normalize(
+            make_upload('pic.png', image_format='PNG', mode='RGBA')
+        )
+        self.assertEqual(result.name, 'pic.jpg')
+        self.assertEqual(Image.open(result).format, 'JPEG')
+
+    def test_gif_passes_through(self):
+        """GIF не перекодируется, чтобы не потерять анимацию."""
+        upload = SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif')
+        self.assertIs(images.normalize(upload), upload)
+
+    def test_rejects_large_gif(self):
+        """GIF не ужимается, поэтому больше POST_IMAGE_MAX_SIDE — ошибка."""
+        with self.assertRaises(ValidationError):
+            images.normalize(make_upload(
+                'big.gif', size=(64, 16), image_format='GIF', mode='P'
+            ))
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_rejects_gif_with_too_many_frames(self):
+        """Лимит пикселей считается по всем кадрам анимации."""
+        frames = [Image.new('P', (20, 20), color) for color in range(3)]
+        output = BytesIO()
+        frames[0].save(
+            output, 'GIF', save_all=True, append_images=frames[1:]
+        )
+        upload = SimpleUploadedFile('anim.gif', output.getvalue(), 'image/gif')
+        with self.assertRaises(ValidationError):
+            images.normalize(upload)
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_BYTES=10)
+    def test_rejects_large_file(self):
+        with self.assertRaises(ValidationError):
+            images.normalize(make_upload())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_rejects_too_many_pixels(self):
+        with self.assertRaises(ValidationError):
+            images.normalize(make_upload(size=(20, 20)))
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_form_reports_error(self):
+        """Форма показывает ошибку у поля image."""
+        form = PostForm(
+            data={'text': 'Текст'},
+            files={'image': make_upload(size=(20, 20))}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_BYTES=100)
+    def test_large_upload_rejected_unread(self):
+        """Большой файл не дочитывается и отклоняется до Pillow."""
+        request = RequestFactory().post('/', {'image': make_upload()})
+        upload = request.FILES['image']
+        self.assertGreater(upload.size, 100)
+        self.assertEqual(upload.read(), b'')
+        form = PostForm(data={'text': 'Текст'}, files=request.FILES)
+        with mock.patch.object(Image, 'open') as image_open:
+            self.assertFalse(form.is_valid())
+        image_open.assert_not_called()
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'file_too_large')
+
+    def test_stage_timings_recorded(self):
+        """Этапы обработки попадают в гистограмму метрик."""
+        previous, metrics.registry = metrics.registry, metrics.Registry()
+        try:
+            images.normalize(make_upload())
+            histograms = metrics.registry.dump()['histograms']
+        finally:
+            metrics.registry = previous
+        self.assertEqual(
+            [labels['stage'] for _, labels, _ in histograms],
+            ['open', 'decode', 'orient', 'resize', 'encode']
+        )
+
+    def test_stage_timings_logged(self):
+        with self.assertLogs('posts.images', 'INFO') as logs:
+            images.normalize(make_upload())
+        stages = logs.records[0].image_stages
+        self.assertEqual(
+            list(stages), ['open', 'decode', 'orient', 'resize', 'encode']
+        )
+
+
+class SettingsTests(SimpleTestCase):
+    def test_unsupported_format_rejected_on_import(self):
+        """Неподдерживаемый POST_IMAGE_FORMAT — ошибка при импорте."""
+        try:
+            with override_settings(POST_IMAGE_FORMAT='BMP'):
+                with self.assertRaises(ImproperlyConfigured):
+                    importlib.reload(images)
+        finally:
+            importlib.reload(images)
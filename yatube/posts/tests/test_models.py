@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
 from ..models import Comment, Follow, Group, Post
@@ -197,3 +198,8 @@ class FollowModelTest(TestCase):
                     expected_verbose_name,
                     '[x] Значение verbose_name не соответствует ожидаемому.'
                 )
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на того же автора запрещена."""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user1, author=self.user2)
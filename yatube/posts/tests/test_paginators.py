@@ -0,0 +1,176 @@
+from time import sleep
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Post
+from ..paginators import (Cursor, CursorPaginator, decode_cursor,
+                          encode_cursor)
+
+User = get_user_model()
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Im_author')
+        cls.num_of_test_posts = 25
+        for i in range(cls.num_of_test_posts):
+            Post.objects.create(author=cls.author, text=f'Тестовый пост {i}')
+            sleep(0.001)  # for different pub_date
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_page(self, params, per_page=10):
+        return CursorPaginator(Post.objects.all(), per_page).get_cursor_page(
+            params
+        )
+
+    def test_walk_forward_by_cursor(self):
+        """Проход по курсорам выдаёт все посты по одному разу по порядку."""
+        seen = []
+        page = self.get_page({})
+        numbers = [page.number]
+        while True:
+            seen.extend(post.pk for post in page)
+            if not page.next_cursor:
+                break
+            page = self.get_page({'after': page.next_cursor})
+            numbers.append(page.number)
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(numbers, [1, 2, 3])
+
+    def test_walk_back_by_cursor(self):
+        """Курсор before возвращает на предыдущую страницу."""
+        first = self.get_page({})
+        second = self.get_page({'after': first.next_cursor})
+        third = self.get_page({'after': second.next_cursor})
+        back = self.get_page({'before': third.previous_cursor})
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(back.number, 2)
+        back = self.get_page({'before': back.previous_cursor})
+        self.assertEqual(list(back), list(first))
+        self.assertIsNone(back.previous_cursor)
+
+    def test_page_is_stable_with_new_posts(self):
+        """Новые посты не сдвигают страницу, открытую по курсору."""
+        first = self.get_page({})
+        second = self.get_page({'after': first.next_cursor})
+        Post.objects.create(author=self.author, text='Свежий пост')
+        again = self.get_page({'after': first.next_cursor})
+        self.assertEqual(list(again), list(second))
+
+    def test_legacy_page_number(self):
+        """Старые ссылки ?page=N отдают ту же страницу, что и Paginator."""
+        page = self.get_page({'page': '3'})
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page), self.num_of_test_posts - 20)
+        self.assertIsNone(page.next_cursor)
+        after_second = self.get_page(
+            {'after': self.get_page({'page': '2'}).next_cursor}
+        )
+        self.assertEqual(list(page), list(after_second))
+
+    def test_legacy_page_number_out_of_range(self):
+        """Для страницы за пределами ленты возвращается последняя."""
+        self.assertEqual(self.get_page({'page': '7'}).number, 3)
+        self.assertEqual(self.get_page({'page': 'abc'}).number, 1)
+
+    @override_settings(PAGINATOR_MAX_OFFSET_PAGE=2)
+    def test_legacy_page_number_is_bounded(self):
+        """Глубина OFFSET для ?page=N ограничена с обоих концов ленты."""
+        self.assertEqual(self.get_page({'page': '3'}, per_page=5).number, 2)
+        page = self.get_page({'page': '4'}, per_page=5)
+        self.assertEqual(page.number, 4)
+        self.assertEqual(
+            list(page), list(Post.objects.order_by('-pub_date')[15:20])
+        )
+        page = self.get_page({'page': '5'}, per_page=5)
+        self.assertEqual(len(page), 5)
+        self.assertIsNone(page.next_cursor)
+
+    def test_broken_cursor(self):
+        """Испорченный курсор ведёт на первую страницу."""
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = self.get_page({'after': 'not-a-cursor'})
+        self.assertEqual(page.number, 1)
+
+    @override_settings(PAGINATOR_WINDOW_SIZE=2)
+    def test_cursor_skip_is_limited(self):
+        """Курсор не может пропустить больше страниц, чем окно."""
+        post = Post.objects.order_by('-pub_date', '-pk').first()
+        for skip, valid in ((2, True), (3, False), (10 ** 9, False)):
+            with self.subTest(skip=skip):
+                token = encode_cursor(Cursor(1, post.pub_date, post.pk, skip))
+                self.assertEqual(decode_cursor(token) is not None, valid)
+
+    @override_settings(NUM_OF_POSTS_ON_PAGE=5, PAGINATOR_WINDOW_SIZE=1)
+    def test_window_without_total_count(self):
+        """Окно ссылок не считает всю ленту: COUNT только с LIMIT."""
+        first = self.get_page({}, per_page=5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:index'), {'after': first.next_cursor}
+            )
+        counts = [
+            query['sql'] for query in queries if 'COUNT(' in query['sql']
+        ]
+        self.assertTrue(counts)
+        for sql in counts:
+            self.assertIn('LIMIT', sql)
+        self.assertContains(response, '&hellip;')
+
+    def test_view_links(self):
+        """В ленте выводятся ссылки на соседние страницы по курсорам."""
+        response = self.client.get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertContains(response, f'?after={page.next_cursor}')
+        response = self.client.get(
+            reverse('posts:index') + f'?after={page.next_cursor}'
+        )
+        page = response.context['page_obj']
+        self.assertContains(response, f'?before={page.previous_cursor}')
+
+    def test_window_links_lead_to_pages(self):
+        """Ссылки окна ведут на страницы с указанными номерами."""
+        paginator = CursorPaginator(Post.objects.all(), 5)
+        page = paginator.get_cursor_page({'page': '4'})
+        window = paginator.get_window(page, 1)
+        self.assertEqual(
+            [item.number for item in window], [1, None, 3, 4, 5]
+        )
+        for item in window:
+            if not item.url or item.url == '?':
+                continue
+            with self.subTest(number=item.number):
+                response = self.client.get(reverse('posts:index') + item.url)
+                self.assertEqual(
+                    response.context['page_obj'].number, item.number
+                )
+
+    def test_window_size_is_flat(self):
+        """Размер разметки пагинатора не зависит от числа страниц."""
+        rendered = []
+        for count in (10 ** 3, 10 ** 6):
+            paginator = CursorPaginator(Post.objects.all(), 10)
+            page = paginator.get_cursor_page({'page': '2'})
+            paginator.count = count
+            rendered.append(render_to_string(
+                'posts/includes/paginator.html', {'page_obj': page}
+            ))
+        self.assertEqual(
+            rendered[0].count('<li'), rendered[1].count('<li')
+        )
+        self.assertLess(rendered[0].count('<li'), 10)
@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+from django.urls import resolve
+
+from ..models import Group, Post
+from ..templatetags.post_cards import card_key
+
+User = get_user_model()
+
+
+class PostCardsTagTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Im_author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-group-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def render(self, path='/', **extra):
+        request = RequestFactory().get(path)
+        request.resolver_match = resolve(path)
+        posts = Post.objects.select_related('author', 'group')
+        return Template(
+            '{% load post_cards %}{% post_cards posts as cards %}'
+            '{% for card in cards %}{{ card }}{% endfor %}'
+        ).render(Context({'request': request, 'posts': posts, **extra}))
+
+    def test_cards_are_cached(self):
+        """Повторный рендер берёт карточку из кэша."""
+        html = self.render()
+        self.assertIn(self.post.text, html)
+        key = card_key(Post.objects.get(pk=self.post.pk), '00')
+        self.assertEqual(cache.get(key), html)
+        cache.set(key, 'из кэша')
+        self.assertEqual(self.render(), 'из кэша')
+
+    def test_edit_changes_card_version(self):
+        """Правка поста меняет ключ карточки."""
+        self.render()
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный текст'
+        post.save()
+        self.assertIn('Исправленный текст', self.render())
+
+    def test_variants(self):
+        """Для группы и профиля кэшируются отдельные варианты карточки."""
+        group_link = f'/group/{self.group.slug}/'
+        self.assertIn(group_link, self.render())
+        self.assertNotIn(group_link, self.render(group_page=True))
+        profile_path = f'/profile/{self.author.username}/'
+        self.assertNotIn(
+            f'href="{profile_path}"', self.render(path=profile_path)
+        )
@@ -0,0 +1,113 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import search
+from ..models import Post
+from ..search import SearchPaginator
+
+User = get_user_model()
+
+
+class SearchMixin:
+    """Общие тесты для обоих индексов."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Im_author')
+        self.often = Post.objects.create(
+            author=self.author, text='Котики, котики и ещё раз котики'
+        )
+        self.once = Post.objects.create(
+            author=self.author, text='Пёс и котики гуляют'
+        )
+        self.other = Post.objects.create(author=self.author, text='Про собак')
+
+    def found(self, query, per_page=10):
+        page = SearchPaginator(query, per_page).get_cursor_page({})
+        return [post.pk for post in page]
+
+    def test_ranked_by_relevance(self):
+        """Пост, где слово встречается чаще, выше."""
+        self.assertEqual(self.found('КОТИКИ'), [self.often.pk, self.once.pk])
+
+    def test_all_terms_required(self):
+        self.assertEqual(self.found('котики пёс'), [self.once.pk])
+        self.assertEqual(self.found('котики собак'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Операторы и кавычки в запросе — просто слова."""
+        self.assertEqual(self.found('"котики" OR NOT*'), [])
+        self.assertEqual(self.found(''), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.text = 'Теперь про котиков и котики'
+        self.other.save()
+        self.assertIn(self.other.pk, self.found('котики'))
+        self.assertEqual(self.found('собак'), [])
+        self.once.delete()
+        self.assertNotIn(self.once.pk, self.found('котики'))
+
+    def test_cursor_pages(self):
+        """Курсор ведёт на следующую страницу без повторов и пропусков."""
+        for i in range(5):
+            Post.objects.create(author=self.author, text=f'котики {i}')
+        paginator = SearchPaginator('котики', 3)
+        first = paginator.get_cursor_page({})
+        second = paginator.get_cursor_page({'after': first.next_cursor})
+        third = paginator.get_cursor_page({'after': second.next_cursor})
+        pks = [post.pk for page in (first, second, third) for post in page]
+        self.assertEqual(len(pks), 7)
+        self.assertEqual(len(set(pks)), 7)
+        self.assertIsNone(third.next_cursor)
+        back = paginator.get_cursor_page({'before': third.previous_cursor})
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(paginator.count, 7)
+
+    def test_rebuild(self):
+        Post.objects.bulk_create([Post(author=self.author, text='котики')])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.found('котики')), 3)
+
+    def test_admin_search_uses_index(self):
+        queryset = search.filter_posts(Post.objects.all(), 'пёс котики')
+        self.assertEqual(list(queryset), [self.once])
+
+
+@override_settings(SEARCH_BACKEND='fts5')
+class Fts5SearchTests(SearchMixin, TestCase):
+    pass
+
+
+@override_settings(SEARCH_BACKEND='python')
+class InvertedIndexSearchTests(SearchMixin, TestCase):
+    def test_documents_counted_once(self):
+        """Число публикаций для весов не пересчитывается на каждый запрос."""
+        self.found('котики')
+        with CaptureQueriesContext(connection) as queries:
+            self.found('котики')
+        for query in queries:
+            self.assertNotIn('COUNT(*) AS "__count"', query['sql'])
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        author = User.objects.create(username='Im_author')
+        Post.objects.create(author=author, text='Искомый пост')
+
+    def test_search_page(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'искомый'})
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertEqual(len(response.context['page_obj']), 1)
+        self.assertContains(response, 'Искомый пост')
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('posts:search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 0)
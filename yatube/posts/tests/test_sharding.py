@@ -0,0 +1,294 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from time import sleep
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import sharding
+from ..models import (ArchivedComment, ArchivedPost, Comment, Group, Post,
+                      PostDirectory, ShardBucket)
+
+User = get_user_model()
+
+SHARDS = ('shard_a', 'shard_b')
+
+
+def shard_settings(path):
+    return {
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {'pragmas': {'foreign_keys': 0}},
+    }
+
+
+@override_settings(POST_SHARDS=['default', *SHARDS])
+class ShardingTests(TransactionTestCase):
+    # Шарды — временные файлы; схему один раз накатываем в шаблон.
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.template = os.path.join(cls.directory, 'template.sqlite3')
+        alias = SHARDS[0]
+        connections.databases[alias] = shard_settings(cls.template)
+        call_command('migrate', database=alias, verbosity=0)
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        cache.clear()
+        sharding.reset()
+        # Ленты и очередь миниатюр ссылаются на публикации из шардов.
+        connection.disable_constraint_checking()
+        for alias in SHARDS:
+            path = os.path.join(self.directory, f'{alias}.sqlite3')
+            shutil.copy(self.template, path)
+            connections.databases[alias] = shard_settings(path)
+            sharding.prepare(alias)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.author_a = self.create_author('author_a', 'shard_a')
+        self.author_b = self.create_author('author_b', 'shard_b')
+        self.client = Client()
+        self.client.force_login(self.author_a)
+
+    def tearDown(self) -> None:
+        # Через ORM, чтобы сигналы убрали посты и из поискового индекса.
+        for posts in sharding.fan_out(Post.objects.all()):
+            posts.delete()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        connection.enable_constraint_checking()
+        sharding.reset()
+
+    def create_author(self, username, alias):
+        taken = set(ShardBucket.objects.values_list('bucket', flat=True))
+        while True:
+            author = User.objects.create(username=username)
+            if sharding.bucket(author.pk) not in taken:
+                break
+            author.delete()
+        ShardBucket.objects.create(
+            bucket=sharding.bucket(author.pk), alias=alias
+        )
+        sharding.reset()
+        return author
+
+    def create_posts(self, author, count, group=None):
+        posts = []
+        for i in range(count):
+            posts.append(Post.objects.create(
+                author=author, text=f'Пост {author.username} {i}',
+                group=group
+            ))
+            sleep(0.001)  # for different pub_date
+        return posts
+
+    def test_rows_follow_author_shard(self):
+        """Пост и комментарии к нему — в шарде автора, id — из каталога."""
+        post = Post.objects.create(author=self.author_b, text='Текст')
+        self.assertTrue(Post.objects.using('shard_b').filter(pk=post.pk))
+        self.assertFalse(Post.objects.using('default').filter(pk=post.pk))
+        self.assertEqual(
+            PostDirectory.objects.get(pk=post.pk).author, self.author_b
+        )
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий'}
+        )
+        comment = Comment.objects.using('shard_b').get(post_id=post.pk)
+        self.assertGreaterEqual(comment.pk, 2 * sharding.COMMENT_ID_RANGE)
+        self.assertEqual(
+            Post.objects.using('shard_b').get(pk=post.pk).comments_count, 1
+        )
+
+    def test_users_and_groups_are_replicated(self):
+        for alias in SHARDS:
+            with self.subTest(alias=alias):
+                self.assertTrue(
+                    User.objects.using(alias).filter(pk=self.author_a.pk)
+                )
+                self.assertTrue(
+                    Group.objects.using(alias).filter(pk=self.group.pk)
+                )
+        self.group.delete()
+        self.assertFalse(Group.objects.using('shard_a').exists())
+
+    def test_feeds_merge_shards(self):
+        """Главная и группа сливают шарды по дате, профиль — один шард."""
+        posts = (
+            self.create_posts(self.author_a, 3, self.group)
+            + self.create_posts(self.author_b, 3, self.group)
+            + self.create_posts(self.author_a, 2, self.group)
+        )
+        expected = sorted(posts, key=lambda post: post.pub_date, reverse=True)
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    list(response.context['page_obj']), expected
+                )
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author_b'})
+        )
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertEqual(response.context['stats'].posts_count, 3)
+
+    def test_post_detail_reads_one_shard(self):
+        post, = self.create_posts(self.author_b, 1)
+        Comment.objects.create(post=post, author=self.author_a, text='Ок')
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(response.context['post'], post)
+        self.assertEqual(response.context['num_posts'], 1)
+        self.assertEqual(len(response.context['comments']), 1)
+
+    def test_directory_skips_unsharded_ids(self):
+        """Публикации, созданные без шардов, не отдают свои id новым."""
+        author = self.create_author('author_default', 'default')
+        probe = PostDirectory.objects.create(author=author).pk
+        PostDirectory.objects.filter(pk=probe).delete()
+        with override_settings(POST_SHARDS=['default']):
+            # Следующий id каталога уже занят публикацией без шардов.
+            old = Post.objects.create(
+                pk=probe + 1, author=author, text='До шардов'
+            )
+        sharding.reset()
+        post, = self.create_posts(author, 1)
+        self.assertGreater(post.pk, old.pk)
+        self.assertEqual(
+            set(Post.objects.filter(author=author)), {old, post}
+        )
+
+    def test_reshard_moves_buckets(self):
+        """reshard раскладывает корзины, данные и id сохраняются."""
+        ShardBucket.objects.all().delete()
+        sharding.reset()
+        posts = (
+            self.create_posts(self.author_a, 3)
+            + self.create_posts(self.author_b, 3)
+        )
+        comment = Comment.objects.create(
+            post=posts[0], author=self.author_b, text='Комментарий'
+        )
+        self.assertEqual(Post.objects.using('default').count(), 6)
+        call_command(
+            'reshard', '--shards', *SHARDS, '--wait', '0', stdout=StringIO()
+        )
+        self.assertFalse(Post.objects.using('default').exists())
+        for post in posts:
+            alias = sharding.shard_for_author(post.author_id)
+            with self.subTest(post=post.pk):
+                self.assertIn(alias, SHARDS)
+                self.assertTrue(Post.objects.using(alias).filter(pk=post.pk))
+        self.assertTrue(
+            Comment.objects.using(sharding.shard_for_post(posts[0].pk))
+            .filter(pk=comment.pk, text='Комментарий')
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(len(response.context['page_obj']), 6)
+
+    def test_move_bucket_catches_up_with_writes(self):
+        """Записи в старый шард за время переключения не теряются."""
+        edited, deleted = self.create_posts(self.author_a, 2)
+        bucket = sharding.bucket(self.author_a.pk)
+        created = []
+
+        def write_to_source(seconds):
+            # Процесс, который ещё не перечитал карту, пишет в shard_a.
+            sharding.shard_map()
+            stale = {bucket: 'shard_a'}
+            with mock.patch.dict(sharding._map['buckets'], stale):
+                posts = Post.objects.using('shard_a')
+                post = posts.get(pk=edited.pk)
+                post.text = 'Исправлено'
+                post.save()
+                posts.get(pk=deleted.pk).delete()
+                created.append(
+                    Post.objects.create(author=self.author_a, text='Новый')
+                )
+
+        with mock.patch('posts.sharding.time.sleep', write_to_source):
+            sharding.move_bucket(bucket, 'shard_b')
+        posts = Post.objects.using('shard_b').filter(author=self.author_a)
+        self.assertEqual(
+            dict(posts.values_list('pk', 'text')),
+            {edited.pk: 'Исправлено', created[0].pk: 'Новый'}
+        )
+        self.assertFalse(
+            Post.objects.using('shard_a').filter(author=self.author_a)
+        )
+        self.assertEqual(sharding.shard_for_author(self.author_a.pk),
+                         'shard_b')
+
+    def test_archive_stays_with_author(self):
+        """Архив лежит в шарде автора и переезжает вместе с корзиной."""
+        posts = self.create_posts(self.author_a, 3)
+        Comment.objects.create(post=posts[0], author=self.author_b, text='Ок')
+        call_command('archive_posts', '--days', '0', stdout=StringIO())
+        self.assertEqual(ArchivedPost.objects.using('shard_a').count(), 3)
+        sharding.move_bucket(sharding.bucket(self.author_a.pk), 'shard_b',
+                             wait=0)
+        self.assertFalse(ArchivedPost.objects.using('shard_a').exists())
+        self.assertEqual(ArchivedPost.objects.using('shard_b').count(), 3)
+        self.assertTrue(ArchivedComment.objects.using('shard_b').exists())
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': posts[0].pk})
+        )
+        self.assertEqual(len(response.context['comments']), 1)
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author_a'})
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [post.pk for post in reversed(posts)]
+        )
+
+    def test_export_and_import_span_shards(self):
+        """Выгрузка читает все шарды, загрузка пишет в шард автора."""
+        posts = (
+            self.create_posts(self.author_a, 2)
+            + self.create_posts(self.author_b, 2)
+        )
+        Comment.objects.create(post=posts[-1], author=self.author_a, text='Ок')
+        path = os.path.join(self.directory, 'dump.jsonl')
+        call_command('export_posts', path, stderr=StringIO())
+        with open(path, encoding='utf-8') as stream:
+            models = [json.loads(line)['model'] for line in stream]
+        self.assertEqual(models.count('post'), 4)
+        self.assertEqual(models.count('comment'), 1)
+        call_command('import_posts', path, stdout=StringIO())
+        for author, alias in ((self.author_a, 'shard_a'),
+                              (self.author_b, 'shard_b')):
+            with self.subTest(alias=alias):
+                imported = Post.objects.using(alias).filter(author=author)
+                self.assertEqual(imported.count(), 4)
+                self.assertEqual(
+                    PostDirectory.objects.filter(author=author).count(), 4
+                )
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertEqual(
+            Comment.objects.using('shard_b').filter(text='Ок').count(), 2
+        )
@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import thumbnails
+from ..models import Post, ThumbnailTask
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Im_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif')
+        )
+
+    def test_upload_enqueues_task(self):
+        """Пост с картинкой ставит задачу, без картинки — нет."""
+        self.assertTrue(ThumbnailTask.objects.filter(post=self.post))
+        Post.objects.create(author=self.author, text='Без картинки')
+        self.assertEqual(ThumbnailTask.objects.count(), 1)
+
+    def test_page_does_not_generate_thumbnail(self):
+        """До обработки очереди страница показывает оригинал."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertContains(response, self.post.image.url)
+        self.assertIsNone(thumbnails.lookup(self.post.image))
+
+    def test_worker_drains_queue(self):
+        """Команда process_thumbnails создаёт миниатюры и чистит очередь."""
+        call_command('process_thumbnails', stdout=StringIO())
+        self.assertFalse(ThumbnailTask.objects.exists())
+        thumbnail = thumbnails.lookup(self.post.image)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+
+    def test_page_looks_thumbnails_up_in_one_query(self):
+        """Миниатюры всей страницы ищутся одним запросом к KV-таблице."""
+        for i in range(3):
+            Post.objects.create(
+                author=self.author,
+                text=f'Ещё пост с картинкой {i}',
+                image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif')
+            )
+        call_command('process_thumbnails', stdout=StringIO())
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        kv_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kv_queries), 1)
+        for post in response.context['page_obj']:
+            with self.subTest(post=post.pk):
+                self.assertContains(response, post.prefetched_thumbnail.url)
@@ -0,0 +1,108 @@
+from io import StringIO
+from time import sleep
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Follow, Post, TimelineBackfill, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='Im_reader')
+        cls.author = User.objects.create(username='Im_author')
+        cls.star = User.objects.create(username='Im_star')
+        for i in range(3):
+            Post.objects.create(author=cls.author, text=f'Пост автора {i}')
+            Post.objects.create(author=cls.star, text=f'Пост звезды {i}')
+            sleep(0.001)  # for different pub_date
+
+    def setUp(self) -> None:
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка дозаполняет ленту, отписка вычищает её."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+
+    def test_new_post_fans_out(self):
+        """Новый пост сразу попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Свежий пост')
+        self.assertEqual(self.feed()[0], post)
+        post.delete()
+        self.assertNotIn(post, self.feed())
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_celebrity_posts_merged_on_read(self):
+        """Посты «знаменитостей» подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.reader, author=self.star)
+        post = Post.objects.create(author=self.star, text='Пост звезды')
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        self.assertEqual(
+            self.feed(),
+            list(Post.objects.filter(author=self.star)[:10])
+        )
+        self.assertEqual(self.feed()[0], post)
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_demoted_celebrity_posts_backfilled(self):
+        """
+        Автор опустился до порога — его посты раскладываются в ленты
+        очередью, а до того подмешиваются при чтении.
+        """
+        other = User.objects.create(username='Im_other')
+        Follow.objects.create(user=self.reader, author=self.star)
+        follow = Follow.objects.create(user=other, author=self.star)
+        post = Post.objects.create(author=self.star, text='Пост звезды')
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post.pk))
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post.pk))
+        self.assertEqual(self.feed()[0], post)
+        call_command('rebuild_timelines', '--pending', stdout=StringIO())
+        self.assertFalse(TimelineBackfill.objects.exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=self.reader, author=self.star
+            ).count(),
+            4
+        )
+        self.assertEqual(self.feed()[0], post)
+
+    @override_settings(TIMELINE_INLINE_BACKFILL_MAX_POSTS=2)
+    def test_prolific_author_backfill_deferred(self):
+        """Ленту подписчика плодовитого автора дозаполняет очередь."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        expected = list(Post.objects.filter(author=self.author))
+        self.assertEqual(self.feed(), expected)
+        call_command('rebuild_timelines', '--pending', stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
+        self.assertEqual(self.feed(), expected)
+
+    def test_rebuild_command_repairs_timelines(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.star)
+        expected = self.feed()
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), expected)
+        self.assertEqual(len(expected), 6)
@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import (ArchivedPost, AuthorStats, Comment, Follow, Group,
+                      Post)
+
+User = get_user_model()
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='Im_author')
+        self.reader = User.objects.create(username='Im_reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='test-slug', description='Описание'
+        )
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Старый пост'
+        )
+        self.pub_date = timezone.now() - timedelta(days=30)
+        Post.objects.filter(pk=self.post.pk).update(pub_date=self.pub_date)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def export(self):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('export_posts', path, stderr=StringIO())
+        return path
+
+    def test_export_format(self):
+        with open(self.export(), encoding='utf-8') as stream:
+            records = [json.loads(line) for line in stream]
+        self.assertEqual(
+            [record['model'] for record in records],
+            ['user', 'user', 'group', 'post', 'comment', 'follow']
+        )
+        post = records[3]
+        self.assertEqual(post['author'], 'Im_author')
+        self.assertEqual(post['group'], 'test-slug')
+
+    def test_roundtrip_into_empty_database(self):
+        """В пустую базу данные загружаются с прежними id и датами."""
+        path = self.export()
+        post_id = self.post.pk
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command('import_posts', path, '--batch-size=1', stdout=StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.pk, post_id)
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(post.author.username, 'Im_author')
+        self.assertEqual(post.group.slug, 'test-slug')
+        self.assertEqual(post.comments.get().author.username, 'Im_reader')
+        self.assertTrue(Follow.objects.filter(
+            user__username='Im_reader', author__username='Im_author'
+        ).exists())
+        # Сигналы не срабатывали, но производные данные пересобраны.
+        self.assertEqual(post.comments_count, 1)
+        stats = AuthorStats.objects.get(user=post.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 1))
+
+    def test_roundtrip_with_archive(self):
+        """Архивные публикации выгружаются и загружаются как обычные."""
+        call_command('archive_posts', '--days', '10', stdout=StringIO())
+        self.assertFalse(Post.objects.exists())
+        path = self.export()
+        post_id = self.post.pk
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertFalse(ArchivedPost.objects.exists())
+        call_command('import_posts', path, stdout=StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.pk, post_id)
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(post.comments.get().text, 'Комментарий')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_import_remaps_into_existing_data(self):
+        """Поверх существующих данных посты получают новые id."""
+        path = self.export()
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Post.objects.count(), 2)
+        imported = Post.objects.exclude(pk=self.post.pk).get()
+        self.assertEqual(imported.comments.count(), 1)
+        self.assertIn('строк/с', out.getvalue())
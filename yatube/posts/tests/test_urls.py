@@ -123,6 +123,7 @@ class PostURLTests(TestCase):
         }
         for url, template in url_templates.items():
             with self.subTest(url=url):
+                cache.clear()  # ответ из кэша шаблон не рендерит
                 response = self.author_client.get(url, follow=True)
                 self.assertTemplateUsed(
                     response, template,
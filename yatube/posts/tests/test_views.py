@@ -487,19 +487,182 @@ class PostViewsTests(TestCase):
 
     # cache testing:
     def test_cache(self):
-        """Загрузка из кэша доступна в течение заданого времени."""
-        Post.objects.create(
-            author=self.authors[0],
-            text='Тестовый пост для кэширования'
-        )
+        """Страница отдаётся из кэша, пока данные не изменились."""
         response_fill_cache = self.guest_client.get(reverse('posts:index'))
-        Post.objects.filter(text='Тестовый пост для кэширования').delete()
         response_cache = self.guest_client.get(reverse('posts:index'))
+        self.assertIsNone(response_cache.context)
         self.assertEqual(response_fill_cache.content, response_cache.content)
-        cache.clear()
-        response_no_cache = self.guest_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_fill_cache.content,
-                            response_no_cache.content)
+
+    def test_cache_invalidation(self):
+        """Изменение постов сразу сбрасывает кэш затронутых страниц."""
+        post = Post.objects.create(
+            author=self.authors[0],
+            text='Тестовый пост для кэширования',
+            group=self.groups[0]
+        )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.groups[0].slug}),
+            reverse('posts:profile', kwargs={'username': self.authors[0]}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), post.text)
+        Post.objects.filter(pk=post.pk).delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.guest_client.get(url), post.text)
+
+    def test_cache_scopes_are_independent(self):
+        """Изменения в одной группе не сбрасывают кэш другой."""
+        url = reverse('posts:group_list', kwargs={'slug': self.groups[1].slug})
+        self.guest_client.get(url)
+        Post.objects.create(
+            author=self.authors[0],
+            text='Пост в другой группе',
+            group=self.groups[0]
+        )
+        self.assertIsNone(self.guest_client.get(url).context)
+
+    def test_cache_anonymous_only(self):
+        """Кэш общий для анонимов, вошедшие идут мимо него."""
+        post = self.posts[0]
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.guest_client.get(url)
+        self.guest_client.cookies[settings.CSRF_COOKIE_NAME] = 'token'
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertIsNone(response.context)
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIsNotNone(self.author_client.get(url).context)
+        self.assertIsNotNone(self.author_client.get(url).context)
+        Comment.objects.create(post=post, author=self.authors[1], text='Ок')
+        self.assertContains(self.guest_client.get(url), 'Ок')
+        index = reverse('posts:index')
+        self.guest_client.get(index)
+        self.assertIsNotNone(self.guest_client.get(index, {'page': 2}).context)
+
+    def test_detail_cache_scopes(self):
+        """Страницу поста сбрасывают его автор и группа, а не вся лента."""
+        post = Post.objects.filter(author=self.authors[0]).first()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.guest_client.get(url)
+        self.guest_client.cookies[settings.CSRF_COOKIE_NAME] = 'token'
+        Post.objects.create(author=self.authors[1], text='Чужой пост')
+        self.assertIsNone(self.guest_client.get(url).context)
+        Post.objects.create(author=self.authors[0], text='Ещё пост')
+        response = self.guest_client.get(url)
+        self.assertEqual(
+            response.context['num_posts'],
+            Post.objects.filter(author=self.authors[0]).count()
+        )
+
+    def test_cache_author_rename(self):
+        """Смена имени автора сбрасывает кэш его профиля и постов."""
+        author = User.objects.get(pk=self.authors[0].pk)
+        post = Post.objects.filter(author=author).first()
+        urls = (
+            reverse('posts:profile', kwargs={'username': author}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            reverse('posts:index'),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        author.first_name = 'Переименованный'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIsNotNone(response.context)
+                self.assertContains(response, 'Переименованный')
+
+    def test_cache_personal_fragments(self):
+        """Вошедшие делят копию страницы, шапка и подписка — свои."""
+        reader = User.objects.create(username='Im_reader')
+        Follow.objects.create(user=reader, author=self.authors[0])
+        reader_client = Client()
+        reader_client.force_login(reader)
+        url = reverse('posts:profile', kwargs={'username': self.authors[0]})
+        response = reader_client.get(url)
+        self.assertTemplateUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Пользователь: Im_reader')
+        self.assertContains(response, 'Отписаться')
+        response = self.author_too_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Пользователь: Im_author_too')
+        self.assertContains(response, 'Подписаться')
+        response = self.author_client.get(url)
+        self.assertContains(response, 'Все ваши публикации')
+        self.assertNotContains(response, 'Подписаться')
+        index = reverse('posts:index')
+        self.author_client.get(index)
+        # Остаются только сессия и пользователь.
+        with self.assertNumQueries(2):
+            response = reader_client.get(index)
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertContains(response, 'Пользователь: Im_reader')
+
+    def test_cache_header_after_rename(self):
+        """Шапка вошедшего пользователя не переживает смену его имени."""
+        reader = User.objects.create(username='Im_reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        index = reverse('posts:index')
+        self.assertContains(
+            reader_client.get(index), 'Пользователь: Im_reader'
+        )
+        reader.username = 'Im_renamed'
+        reader.save()
+        self.assertContains(
+            reader_client.get(index), 'Пользователь: Im_renamed'
+        )
+
+    def test_cache_stats(self):
+        """Статистика кэша доступна персоналу и считает попадания."""
+        staff = User.objects.create(username='Im_staff', is_staff=True)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('posts:index'))
+        stats = staff_client.get(reverse('posts:cache_stats')).json()
+        self.assertEqual(stats['global'], {'hit': 1, 'miss': 1})
+        response = self.author_client.get(reverse('posts:cache_stats'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_conditional_get(self):
+        """Неизменившаяся страница — 304 без запросов к базе."""
+        post = Post.objects.filter(author=self.authors[0]).first()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.groups[0].slug}),
+            reverse('posts:profile', kwargs={'username': self.authors[0]}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Первый ответ ставит cookie CSRF, а она входит в ETag.
+                self.author_client.get(url)
+                etag = self.author_client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.author_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                response = self.author_too_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+        etags = [self.author_client.get(url)['ETag'] for url in urls]
+        Comment.objects.create(post=post, author=self.authors[1], text='Ок')
+        Post.objects.create(
+            author=self.authors[0], text='Новый пост', group=self.groups[0]
+        )
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
 
     # followings testing:
     def test_follow_index_context_types(self):
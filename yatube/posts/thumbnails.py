@@ -0,0 +1,180 @@
+"""
+Миниатюры картинок постов.
+
+Шаблоны не генерируют миниатюры сами: они лишь ищут готовую в key-value
+хранилище sorl-thumbnail (lookup), а создаёт их фоновый воркер — команда
+process_thumbnails, разбирающая очередь ThumbnailTask.
+"""
+from core import metrics
+from core.cache import bump
+from django.conf import settings as django_settings
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import scopes, sharding
+from .models import Post, ThumbnailTask
+
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+# Все миниатюры, которые используют шаблоны постов.
+GEOMETRIES = (
+    (CARD_GEOMETRY, CARD_OPTIONS),
+)
+
+
+def thumbnail_file(image, geometry, options):
+    """
+    Файл миниатюры с тем же именем, что дал бы get_thumbnail, но без
+    обращения к исходной картинке.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    # Те же значения по умолчанию, что в ThumbnailBackend.get_thumbnail.
+    if settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def lookup(image, geometry=CARD_GEOMETRY, options=None):
+    """Готовая миниатюра из key-value хранилища или None; не блокирует."""
+    if not image:
+        return None
+    if options is None:
+        options = CARD_OPTIONS
+    with metrics.timer('thumbnail_seconds'):
+        return default.kvstore.get(thumbnail_file(image, geometry, options))
+
+
+def lookup_many(images, geometry=CARD_GEOMETRY, options=None):
+    """
+    Готовые миниатюры для набора картинок: {имя картинки: ImageFile или
+    None}. Для cached_db-хранилища sorl это один get_many к кэшу и один
+    запрос к таблице thumbnail_kvstore на все промахи.
+    """
+    if options is None:
+        options = CARD_OPTIONS
+    files = {
+        image.name: thumbnail_file(image, geometry, options)
+        for image in images if image
+    }
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        return {name: kvstore.get(file) for name, file in files.items()}
+    keys = {name: add_prefix(file.key) for name, file in files.items()}
+    values = kvstore.cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in values]
+    if missing:
+        stored = dict(
+            KVStoreModel.objects
+            .filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        # Как и sorl, запоминаем в кэше и отсутствие миниатюры.
+        empty = cached_db_kvstore.EMPTY_VALUE
+        found = {key: stored.get(key, empty) for key in missing}
+        kvstore.cache.set_many(found, settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(found)
+    thumbnails = {}
+    for name, key in keys.items():
+        value = values.get(key)
+        thumbnails[name] = (
+            None if not value or value == cached_db_kvstore.EMPTY_VALUE
+            else deserialize_image_file(value)
+        )
+    return thumbnails
+
+
+def prefetch(posts):
+    """
+    Подгружает миниатюры для всех постов страницы разом и сохраняет их
+    в post.prefetched_thumbnail — шаблон карточки их уже не ищет.
+    """
+    with metrics.timer('thumbnail_seconds'):
+        found = lookup_many(post.image for post in posts)
+    for post in posts:
+        post.prefetched_thumbnail = found.get(post.image.name)
+
+
+def enqueue(post):
+    """Ставит картинку поста в очередь на генерацию миниатюр."""
+    ThumbnailTask.objects.update_or_create(
+        post=post, defaults={'attempts': 0, 'last_error': ''}
+    )
+
+
+def generate(image):
+    for geometry, options in GEOMETRIES:
+        get_thumbnail(image, geometry, **options)
+
+
+def _refresh_pages(post):
+    # Закэшированные карточки и страницы показывают оригинал вместо
+    # миниатюры: новая версия поста и поколения областей их сбрасывают.
+    Post.objects.using(post._state.db).filter(pk=post.pk).update(
+        updated_at=timezone.now()
+    )
+    bump(*scopes.for_post(post))
+
+
+def drain(batch_size):
+    """
+    Обрабатывает до batch_size задач из очереди.
+
+    Возвращает число обработанных задач; задачи, упавшие
+    THUMBNAIL_MAX_ATTEMPTS раз, больше не берутся.
+    """
+    tasks = list(
+        ThumbnailTask.objects
+        .filter(attempts__lt=django_settings.THUMBNAIL_MAX_ATTEMPTS)
+        .order_by('created')[:batch_size]
+    )
+    # Публикации могут лежать в шардах (posts.sharding), так что читаем
+    # их отдельно, а не через JOIN с очередью.
+    posts = sharding.in_bulk(
+        Post.objects.select_related('author', 'group'),
+        [task.post_id for task in tasks]
+    )
+    processed = 0
+    for task in tasks:
+        post = posts.get(task.post_id)
+        if post is None:
+            # Публикацию удалили, а задача осталась в основной базе.
+            ThumbnailTask.objects.filter(pk=task.pk).delete()
+            continue
+        try:
+            if post.image:
+                generate(post.image)
+        except Exception as error:
+            ThumbnailTask.objects.filter(pk=task.pk).update(
+                attempts=F('attempts') + 1, last_error=repr(error)
+            )
+        else:
+            # Картинку могли заменить, пока шла генерация: тогда задача
+            # остаётся в очереди для нового файла.
+            current = (
+                Post.objects.using(post._state.db)
+                .filter(pk=post.pk)
+                .values_list('image', flat=True)
+                .first()
+            )
+            if current == post.image.name:
+                ThumbnailTask.objects.filter(pk=task.pk).delete()
+            _refresh_pages(post)
+        processed += 1
+    return processed
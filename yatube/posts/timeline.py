@@ -0,0 +1,249 @@
+"""
+Материализованная лента подписок (fan-out on write).
+
+Новый пост сразу раскладывается в ленты подписчиков автора, подписка
+дозаполняет ленту постами автора, отписка — вычищает их. Посты авторов,
+у которых подписчиков больше settings.TIMELINE_FANOUT_MAX_FOLLOWERS, в ленты
+не раскладываются: они подмешиваются при чтении (fan-out on read).
+
+Запросы не раскладывают много постов разом: ленты подписчиков автора,
+опустившегося до порога, и ленту подписчика автора, у которого публикаций
+больше settings.TIMELINE_INLINE_BACKFILL_MAX_POSTS, дозаполняет позже
+rebuild_timelines --pending по очереди TimelineBackfill. Пока задача в
+очереди, посты автора тоже подмешиваются при чтении.
+"""
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import archive, sharding
+from .models import (ArchivedPost, AuthorStats, Follow, Post,
+                     TimelineBackfill, TimelineEntry)
+from .paginators import CursorPaginator, MergedCursorPaginator
+
+BATCH_SIZE = 500
+
+
+def _celebrities():
+    return AuthorStats.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    )
+
+
+def is_celebrity(author_id):
+    """Слишком ли много у автора подписчиков для fan-out on write."""
+    return _celebrities().filter(user_id=author_id).exists()
+
+
+def followed_celebrities(user):
+    """id авторов-«знаменитостей», на которых подписан пользователь."""
+    return list(
+        _celebrities()
+        .filter(user__following__user=user)
+        .values_list('user_id', flat=True)
+    )
+
+
+def read_merged(user):
+    """
+    id авторов, чьи посты подмешиваются в ленту пользователя при чтении:
+    «знаменитости» и авторы, чьи посты ещё ждут в очереди TimelineBackfill.
+    """
+    pending = TimelineBackfill.objects.filter(
+        Q(user=user) | Q(user=None, author__following__user=user)
+    ).values_list('author_id', flat=True)
+    return sorted(set(followed_celebrities(user)) | set(pending))
+
+
+def _entries(user_ids, posts):
+    return (
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date
+        )
+        for user_id in user_ids
+        for post in posts
+    )
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    follower_ids = (
+        Follow.objects
+        .filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        _entries(follower_ids, [post]),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def post_removed(post):
+    """Убирает из лент публикацию, удалённую мимо каскада (из архива)."""
+    TimelineEntry.objects.filter(post_id=post.pk).delete()
+
+
+def _author_posts(author_id):
+    return chain.from_iterable(
+        sharding.for_author(model.objects.all(), author_id)
+        .filter(author_id=author_id)
+        .only('pk', 'author_id', 'pub_date')
+        .iterator()
+        for model in (Post, ArchivedPost)
+    )
+
+
+def _copy_author_posts(user_id, author_id):
+    return len(TimelineEntry.objects.bulk_create(
+        _entries([user_id], _author_posts(author_id)),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    ))
+
+
+def author_demoted(author_id):
+    """
+    Раскладывает посты автора в ленты всех его подписчиков: пока автор был
+    «знаменитостью», fan_out их пропускал, а теперь их перестанут
+    подмешивать при чтении. Подписчики и посты читаются потоком, ленты
+    пишутся по одной. Возвращает число записанных строк ленты.
+    """
+    follower_ids = (
+        Follow.objects
+        .filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+        .iterator()
+    )
+    return sum(
+        _copy_author_posts(user_id, author_id) for user_id in follower_ids
+    )
+
+
+def backfill(follow):
+    """
+    Дозаполняет ленту подписчика постами автора после подписки; посты
+    плодовитого автора откладывает в очередь.
+    """
+    stats = (
+        AuthorStats.objects
+        .filter(user_id=follow.author_id)
+        .values('followers_count', 'posts_count')
+        .first()
+    ) or {'followers_count': 0, 'posts_count': 0}
+    if stats['followers_count'] > settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+        return
+    if stats['posts_count'] > settings.TIMELINE_INLINE_BACKFILL_MAX_POSTS:
+        TimelineBackfill.objects.get_or_create(
+            author_id=follow.author_id, user_id=follow.user_id
+        )
+        return
+    _copy_author_posts(follow.user_id, follow.author_id)
+
+
+def prune(follow):
+    """
+    Убирает посты автора из ленты бывшего подписчика. Если с этой отпиской
+    автор опустился до порога fan-out (счётчик уже уменьшен), ставит
+    в очередь дозаполнение лент оставшихся подписчиков.
+    """
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id
+    ).delete()
+    TimelineBackfill.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id
+    ).delete()
+    demoted = AuthorStats.objects.filter(
+        user_id=follow.author_id,
+        followers_count=settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    )
+    if demoted.exists():
+        TimelineBackfill.objects.get_or_create(
+            author_id=follow.author_id, user=None
+        )
+
+
+def drain(batch_size):
+    """
+    Разбирает до batch_size задач очереди TimelineBackfill. Задача
+    удаляется, когда сделана, так что прерванную повторит следующий запуск;
+    автору, снова ставшему «знаменитостью», ленты не нужны.
+    Возвращает (число задач, число записанных строк ленты).
+    """
+    tasks = list(TimelineBackfill.objects.all()[:batch_size])
+    written = 0
+    for task in tasks:
+        if not is_celebrity(task.author_id):
+            if task.user_id is None:
+                written += author_demoted(task.author_id)
+            else:
+                written += _copy_author_posts(task.user_id, task.author_id)
+        TimelineBackfill.objects.filter(pk=task.pk).delete()
+    return len(tasks), written
+
+
+def rebuild(user_ids=None):
+    """
+    Пересобирает ленты заданных (или всех) пользователей с нуля.
+
+    Возвращает число записанных строк ленты.
+    """
+    follows = Follow.objects.only('user_id', 'author_id')
+    entries = TimelineEntry.objects.all()
+    # Отложенные дозаполнения этих лент сделает сама пересборка.
+    tasks = TimelineBackfill.objects.exclude(user=None)
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+        tasks = tasks.filter(user_id__in=user_ids)
+    entries.delete()
+    tasks.delete()
+    celebrities = _celebrities().values('user_id')
+    return sum(
+        _copy_author_posts(follow.user_id, follow.author_id)
+        for follow in follows.exclude(author_id__in=celebrities).iterator()
+    )
+
+
+class TimelinePaginator(CursorPaginator):
+    """Пагинатор по строкам материализованной ленты пользователя."""
+    key_fields = ('pub_date', 'post_id')
+
+    def fetch(self, queryset):
+        post_ids = list(queryset.values_list('post_id', flat=True))
+        # Старые записи ленты могут указывать на публикации из архива.
+        posts = archive.in_bulk(post_ids)
+        return [posts[pk] for pk in post_ids if pk in posts]
+
+
+def feed_paginator(user):
+    """
+    Пагинатор ленты подписок: материализованная лента плюс, если нужно,
+    посты авторов-«знаменитостей», подмешанные при чтении.
+    """
+    per_page = settings.NUM_OF_POSTS_ON_PAGE
+    celebrities = read_merged(user)
+    entries = TimelineEntry.objects.filter(user=user)
+    if not celebrities:
+        return TimelinePaginator(entries, per_page)
+    return MergedCursorPaginator(
+        [
+            TimelinePaginator(
+                entries.exclude(author_id__in=celebrities), per_page
+            ),
+            *(
+                CursorPaginator(posts, per_page)
+                for posts in sharding.by_author(
+                    Post.objects.select_related('author', 'group'),
+                    celebrities
+                )
+            ),
+        ],
+        per_page
+    )
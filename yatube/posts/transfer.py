@@ -0,0 +1,338 @@
+"""
+Потоковые выгрузка и загрузка данных в формате JSONL.
+
+Каждая строка — одна запись с ключом "model": user, group, post, comment
+или follow. Связи выгружаются естественными ключами (username, slug), а id
+публикаций загружаются со сдвигом на текущий максимальный id — так
+комментарии находят свои посты без словаря соответствий в памяти.
+Архивные публикации и комментарии (posts.archive) выгружаются как обычные
+и загружаются в горячие таблицы; в архив их снова перенесёт archive_posts.
+С шардами (posts.sharding) публикации и комментарии читаются из всех
+шардов, а загружаются в шард автора и вносятся в каталог.
+Записи читаются и пишутся генераторами, а загружаются пачками через
+bulk_create, поэтому память не зависит от размера дампа.
+"""
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby, islice
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from . import counters, search, sharding, timeline
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, PostDirectory, ThumbnailTask)
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+class Encoder(DjangoJSONEncoder):
+    """Как DjangoJSONEncoder, но даты — с микросекундами."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def batched(iterable, size):
+    """Разбивает поток на списки не длиннее size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """
+    Отключает auto_now_add у полей, чтобы bulk_create сохранил даты
+    из данных, а не текущее время.
+    """
+    previous = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, previous):
+            field.auto_now_add = value
+
+
+def rebuild_derived():
+    """
+    Пересобирает то, что обычно поддерживают сигналы: bulk_create их не
+    шлёт. Загрузка задевает любые группы и профили, так что закэшированные
+    страницы проще сбросить целиком.
+    """
+    counters.rebuild()
+    timeline.rebuild()
+    search.rebuild()
+    cache.clear()
+
+
+def reset_sequences(*models):
+    """
+    Сдвигает последовательности id после вставки с явными id (нужно
+    PostgreSQL; SQLite подстраивается сам, для него список команд пуст).
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _rows(queryset, model, fields, rename=None, batch_size=BATCH_SIZE):
+    rename = rename or {}
+    for row in queryset.values(*fields).iterator(chunk_size=batch_size):
+        record = {'model': model}
+        for field in fields:
+            record[rename.get(field, field)] = row[field]
+        yield record
+
+
+def export_records(batch_size=BATCH_SIZE):
+    """Все записи для выгрузки в порядке, нужном для загрузки."""
+    yield from _rows(
+        User.objects.order_by('pk'), 'user',
+        ('username', 'email', 'first_name', 'last_name', 'password',
+         'date_joined'),
+        batch_size=batch_size
+    )
+    yield from _rows(
+        Group.objects.order_by('pk'), 'group',
+        ('title', 'slug', 'description'),
+        batch_size=batch_size
+    )
+    for model in (Post, ArchivedPost):
+        for posts in sharding.fan_out(model.objects.order_by('pk')):
+            yield from _rows(
+                posts, 'post',
+                ('id', 'text', 'pub_date', 'author__username', 'group__slug',
+                 'image'),
+                rename={'author__username': 'author', 'group__slug': 'group'},
+                batch_size=batch_size
+            )
+    for model in (Comment, ArchivedComment):
+        for comments in sharding.fan_out(model.objects.order_by('pk')):
+            yield from _rows(
+                comments, 'comment',
+                ('post_id', 'author__username', 'text', 'created'),
+                rename={'post_id': 'post', 'author__username': 'author'},
+                batch_size=batch_size
+            )
+    yield from _rows(
+        Follow.objects.order_by('pk'), 'follow',
+        ('user__username', 'author__username'),
+        rename={'user__username': 'user', 'author__username': 'author'},
+        batch_size=batch_size
+    )
+
+
+def dump(records, stream):
+    """Пишет записи в stream по одной JSON-строке; возвращает их число."""
+    total = 0
+    for record in records:
+        stream.write(json.dumps(record, cls=Encoder, ensure_ascii=False))
+        stream.write('\n')
+        total += 1
+    return total
+
+
+def load(stream):
+    """Записи из JSONL-потока; пустые строки пропускаются."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _user_ids(usernames):
+    return dict(
+        User.objects
+        .filter(username__in=set(usernames))
+        .values_list('username', 'pk')
+    )
+
+
+def _by_shard(objects, author_of):
+    """Раскладывает объекты по шардам их авторов: [(шард, объекты)]."""
+    grouped = defaultdict(list)
+    for obj in objects:
+        grouped[sharding.shard_for_author(author_of(obj))].append(obj)
+    return grouped.items()
+
+
+def _top_post_id():
+    """Наибольший занятый id публикации во всех шардах и в каталоге."""
+    querysets = [PostDirectory.objects.using(DEFAULT_DB_ALIAS)]
+    # Id архивных публикаций тоже заняты.
+    for model in (Post, ArchivedPost):
+        querysets += sharding.fan_out(model.objects.all())
+    return max(
+        queryset.aggregate(top=Max('pk'))['top'] or 0
+        for queryset in querysets
+    )
+
+
+class Importer:
+    """
+    Загружает поток записей пачками по batch_size, каждую пачку — в своей
+    транзакции. В stats копится число загруженных и пропущенных строк
+    и время по каждой модели.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, on_batch=None):
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.post_offset = _top_post_id()
+        self.stats = defaultdict(
+            lambda: {'rows': 0, 'skipped': 0, 'seconds': 0.0}
+        )
+
+    def run(self, records):
+        handlers = {
+            'user': self._users,
+            'group': self._groups,
+            'post': self._posts,
+            'comment': self._comments,
+            'follow': self._follows,
+        }
+        with explicit_dates(
+            Post._meta.get_field('pub_date'),
+            Comment._meta.get_field('created')
+        ):
+            for model, group in groupby(records, key=lambda r: r['model']):
+                handler = handlers[model]
+                for batch in batched(group, self.batch_size):
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        created = handler(batch)
+                    stats = self.stats[model]
+                    stats['seconds'] += time.perf_counter() - started
+                    stats['rows'] += created
+                    stats['skipped'] += len(batch) - created
+                    if self.on_batch:
+                        self.on_batch(model, stats)
+        reset_sequences(User, Group, Post, Comment, Follow)
+        return self.stats
+
+    def _replicate(self, model, **lookup):
+        # bulk_create не шлёт сигналов, копируем в шарды сами.
+        if sharding.enabled():
+            sharding.replicate(model, model.objects.filter(**lookup))
+
+    def _users(self, batch):
+        created = len(User.objects.bulk_create(
+            (
+                User(
+                    username=row['username'],
+                    email=row['email'],
+                    first_name=row['first_name'],
+                    last_name=row['last_name'],
+                    password=row['password'],
+                    date_joined=parse_datetime(row['date_joined'])
+                )
+                for row in batch
+            ),
+            ignore_conflicts=True
+        ))
+        self._replicate(
+            User, username__in=[row['username'] for row in batch]
+        )
+        return created
+
+    def _groups(self, batch):
+        created = len(Group.objects.bulk_create(
+            (
+                Group(
+                    title=row['title'],
+                    slug=row['slug'],
+                    description=row['description']
+                )
+                for row in batch
+            ),
+            ignore_conflicts=True
+        ))
+        self._replicate(Group, slug__in=[row['slug'] for row in batch])
+        return created
+
+    def _posts(self, batch):
+        authors = _user_ids(row['author'] for row in batch)
+        groups = dict(
+            Group.objects
+            .filter(slug__in={row['group'] for row in batch if row['group']})
+            .values_list('slug', 'pk')
+        )
+        posts = [
+            Post(
+                id=row['id'] + self.post_offset,
+                text=row['text'],
+                pub_date=parse_datetime(row['pub_date']),
+                author_id=authors[row['author']],
+                group_id=groups.get(row['group']),
+                image=row['image']
+            )
+            for row in batch if row['author'] in authors
+        ]
+        for alias, shard_posts in _by_shard(posts, lambda p: p.author_id):
+            Post.objects.using(alias).bulk_create(shard_posts)
+        if sharding.enabled():
+            PostDirectory.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                PostDirectory(pk=post.pk, author_id=post.author_id)
+                for post in posts
+            )
+        ThumbnailTask.objects.bulk_create(
+            ThumbnailTask(post=post) for post in posts if post.image
+        )
+        return len(posts)
+
+    def _comments(self, batch):
+        authors = _user_ids(row['author'] for row in batch)
+        post_authors = {}
+        for posts in sharding.fan_out(Post.objects.filter(
+            pk__in={row['post'] + self.post_offset for row in batch}
+        )):
+            post_authors.update(posts.values_list('pk', 'author_id'))
+        comments = [
+            Comment(
+                post_id=row['post'] + self.post_offset,
+                author_id=authors[row['author']],
+                text=row['text'],
+                created=parse_datetime(row['created'])
+            )
+            for row in batch
+            if row['author'] in authors
+            and row['post'] + self.post_offset in post_authors
+        ]
+        for alias, shard_comments in _by_shard(
+            comments, lambda c: post_authors[c.post_id]
+        ):
+            Comment.objects.using(alias).bulk_create(shard_comments)
+        return len(comments)
+
+    def _follows(self, batch):
+        users = _user_ids(
+            name for row in batch for name in (row['user'], row['author'])
+        )
+        return len(Follow.objects.bulk_create(
+            (
+                Follow(
+                    user_id=users[row['user']], author_id=users[row['author']]
+                )
+                for row in batch
+                if row['user'] in users and row['author'] in users
+            ),
+            ignore_conflicts=True
+        ))
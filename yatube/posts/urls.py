@@ -27,4 +27,6 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('search/', views.search, name='search'),
+    path('stats/cache/', views.cache_stats, name='cache_stats'),
 ]
@@ -1,36 +1,56 @@
+from core.cache import cache_per_generation, etag_per_generation, get_stats
+from core.queries import query_budget
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
 
+from . import archive, scopes, sharding
+from .counters import author_stats
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import ArchivedPost, Follow, Group, Post, User
+from .paginators import paginate
+from .search import SearchPaginator
+from .timeline import feed_paginator
 
 
-@cache_page(settings.INDEX_CACHE_TIMEOUT_SEC, key_prefix='index_page')
+@query_budget(10)
+@etag_per_generation(lambda: [scopes.FEED])
+@cache_per_generation(lambda: [scopes.FEED], personalized=True)
 def index(request):
     """Возвращает http-ответ с N последними публикациями."""
-    paginated_posts = Paginator(
-        Post.objects
-        .select_related('author', 'group'),
-        settings.NUM_OF_POSTS_ON_PAGE
+    page_obj = paginate(
+        request,
+        sharding.fan_out(Post.objects.select_related('author', 'group')),
+        archive=archive.tier(sharding.fan_out(
+            ArchivedPost.objects.select_related('author', 'group')
+        ))
     )
-    page_obj = paginated_posts.get_page(request.GET.get('page'))
     return render(request, 'posts/index.html',
                   {'title': 'Добро пожаловать в yaTube',
                    'page_obj': page_obj})
 
 
+@query_budget(10)
+@etag_per_generation(lambda username: [scopes.author(username)])
+@cache_per_generation(
+    lambda username: [scopes.author(username)], personalized=True
+)
 def profile(request, username):
     """Профиль пользователя с его публикациями."""
-    author = User.objects.get(username=username)
-    paginated_posts = Paginator(
-        author.posts.select_related('group').all(),
-        settings.NUM_OF_POSTS_ON_PAGE
+    author = User.objects.select_related('stats').get(username=username)
+    stats = author_stats(author)
+    page_obj = paginate(
+        request,
+        author.posts.select_related('group'),
+        count=stats.posts_count,
+        archive=archive.tier(
+            [author.archived_posts.select_related('group')]
+        )
     )
-    page_obj = paginated_posts.get_page(request.GET.get('page'))
     if request.user.is_anonymous:
         following = False
     else:
@@ -39,20 +59,19 @@ def profile(request, username):
     context = {
         'page_obj': page_obj,
         'author': author,
+        'stats': stats,
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(10)
+@etag_per_generation(lambda post_id: scopes.for_detail(post_id))
+@cache_per_generation(lambda post_id: scopes.for_detail(post_id))
 def post_detail(request, post_id):
     """Подробная информация о публикации."""
-    post_query = (
-        Post.objects
-        .filter(id=post_id)
-        .select_related('group', 'author')
-    )
-    post = get_object_or_404(post_query)
-    num_posts = Post.objects.filter(author_id=post.author_id).count()
+    post = archive.get_post_or_404(post_id, 'group', 'author__stats')
+    num_posts = author_stats(post.author).posts_count
     comments = post.comments.select_related('author')
     context = {
         'post': post,
@@ -63,22 +82,30 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(10)
+@etag_per_generation(lambda slug: [scopes.group(slug)])
+@cache_per_generation(
+    lambda slug: [scopes.group(slug)], personalized=True
+)
 def group_posts(request, slug):
     """
     Возвращает http-ответ с N последними публикациями определённой группы.
     """
     group = get_object_or_404(Group, slug=slug)
-    paginated_posts = Paginator(
-        group.posts.select_related('author'),
-        settings.NUM_OF_POSTS_ON_PAGE
+    page_obj = paginate(
+        request,
+        sharding.fan_out(group.posts.select_related('author')),
+        archive=archive.tier(
+            sharding.fan_out(group.archived_posts.select_related('author'))
+        )
     )
-    page_obj = paginated_posts.get_page(request.GET.get('page'))
     return render(request, 'posts/group_list.html',
                   {'group': group,
                    'page_obj': page_obj,
                    'group_page': True})
 
 
+@query_budget(25)
 @login_required
 def post_create(request):
     """Функция обеспечивает создания публикации."""
@@ -93,10 +120,13 @@ def post_create(request):
     return redirect('posts:profile', username=request.user.username)
 
 
+@query_budget(25)
 @login_required
 def post_edit(request, post_id):
     """Функция обеспечивает редактирование публикации."""
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        sharding.for_post(Post.objects.all(), post_id), pk=post_id
+    )
     if request.user.id != post.author_id:
         return redirect('posts:post_detail', post_id=post_id)
     if request.method == 'POST':
@@ -117,17 +147,22 @@ def post_edit(request, post_id):
 @login_required
 def post_delete(request, post_id):
     """Удаление публикации."""
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        sharding.for_post(Post.objects.all(), post_id), pk=post_id
+    )
     if request.user.id != post.author_id:
         return redirect('posts:post_detail', post_id=post_id)
     post.delete()
     return redirect('posts:index')
 
 
+@query_budget(10)
 @login_required
 def add_comment(request, post_id):
     """Функция добавления комментария к публикации."""
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        sharding.for_post(Post.objects.all(), post_id), pk=post_id
+    )
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -137,21 +172,29 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(10)
 @login_required
 def follow_index(request):
-    my_subscriptions = Follow.objects.filter(user=request.user.id)
-    follow_posts = (Post.objects
-                    .filter(author__in=my_subscriptions.values('author'))
-                    .select_related('author', 'group')
-                    )
-    paginated_posts = Paginator(
-        follow_posts,
-        settings.NUM_OF_POSTS_ON_PAGE
-    )
-    page_obj = paginated_posts.get_page(request.GET.get('page'))
+    """Лента публикаций авторов, на которых подписан пользователь."""
+    page_obj = feed_paginator(request.user).get_cursor_page(request.GET)
     return render(request, 'posts/follow.html', {'page_obj': page_obj})
 
 
+@query_budget(10)
+def search(request):
+    """Поиск публикаций по словам, по убыванию релевантности."""
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, settings.NUM_OF_POSTS_ON_PAGE)
+    page_obj = paginator.get_cursor_page(request.GET)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'extra_query': '&' + urlencode({'q': query})
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(20)
 @login_required
 def profile_follow(request, username):
     """Подписаться на автора."""
@@ -163,6 +206,7 @@ def profile_follow(request, username):
     return redirect('posts:profile', username=username)
 
 
+@query_budget(20)
 @login_required
 def profile_unfollow(request, username):
     """Отписаться от автора."""
@@ -174,3 +218,10 @@ def profile_unfollow(request, username):
         )
         following.delete()
     return redirect('posts:profile', username=username)
+
+
+@query_budget(5)
+@staff_member_required
+def cache_stats(request):
+    """Попадания и промахи кэша страниц по видам областей."""
+    return JsonResponse(get_stats(scopes.KINDS))
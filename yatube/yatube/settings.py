@@ -44,6 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.metrics.MetricsMiddleware',
+    'core.middleware.query_budget.QueryBudgetMiddleware',
+    'core.middleware.profiler.SamplingProfilerMiddleware',
+    'core.middleware.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +62,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,20 +81,100 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
 # Database
+# core.db_backends.sqlite3: PRAGMA при подключении, BEGIN IMMEDIATE и
+# повторы при блокировке; соединение живёт между запросами воркера
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db_backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 256 * 2**20,
+                'cache_size': -20000,
+                'busy_timeout': 5000,
+                'temp_store': 'MEMORY',
+            },
+            'transaction_mode': 'IMMEDIATE',
+            'lock_retries': 5,
+            'lock_retry_delay': 0.05,
+        },
     }
 }
+# Шарды публикаций и комментариев (posts.sharding): первый — основная
+# база, остальные — отдельные файлы, по которым команда reshard раскладывает
+# корзины авторов. Число дополнительных шардов — YATUBE_POST_SHARDS
+POST_SHARDS = ['default'] + [
+    f'shard{number}'
+    for number in range(1, int(os.environ.get('YATUBE_POST_SHARDS', 0)) + 1)
+]
+for alias in POST_SHARDS[1:]:
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, f'db-{alias}.sqlite3'),
+    }
+if len(POST_SHARDS) > 1:
+    # Ленты, поиск и очередь миниатюр ссылаются на публикации из других
+    # файлов, а внешние ключи между файлами SQLite не проверить.
+    for alias in POST_SHARDS:
+        options = DATABASES[alias]['OPTIONS']
+        DATABASES[alias]['OPTIONS'] = {
+            **options,
+            'pragmas': {**options['pragmas'], 'foreign_keys': 0},
+        }
+# Сколько секунд процесс помнит карту шардов; команда reshard ждёт столько
+# же после переключения корзины
+POST_SHARD_MAP_TTL_SEC = 5
+# Публикации старше стольких дней команда archive_posts переносит в архив
+# (posts.archive)
+POST_ARCHIVE_AFTER_DAYS = 365
+# Реплики для чтения (core.replicas): копии основной базы, которые
+# обновляет команда refresh_replicas; в тестах они смотрят на основную
+DATABASE_REPLICAS = [
+    f'replica{number}'
+    for number in range(1, int(os.environ.get('YATUBE_REPLICAS', 1)) + 1)
+]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db-{alias}.sqlite3'),
+        # Файл подменяется целиком: соединение открывается на запрос.
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pragmas': {'journal_mode': 'DELETE', 'query_only': 1},
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = [
+    'posts.routers.ShardRouter',
+    'core.db_routers.ReplicaRouter',
+]
+# Вью, которые только читают и могут работать с отставшей репликой
+REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+)
+# После записи пользователь столько секунд читает с основной базы
+REPLICA_STICKY_SECONDS = 30
+REPLICA_STICKY_COOKIE = 'read_primary'
 
 # Cache
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.LocMemCache',
     }
 }
-INDEX_CACHE_TIMEOUT_SEC = 20
+# Страницы лент сбрасываются сигналами (core.cache), поэтому TTL большой
+FEED_CACHE_TIMEOUT_SEC = 60 * 60 * 6
+# Карточки постов версионируются по updated_at и живут долго
+POST_CARD_CACHE_TIMEOUT_SEC = 60 * 60 * 24
+# Сколько раз воркер миниатюр пробует обработать картинку
+THUMBNAIL_MAX_ATTEMPTS = 3
 
 
 # Password validation
@@ -138,6 +222,75 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # USER DEFINITIONS
 NUM_OF_POSTS_ON_PAGE = 10
+# Старые ссылки ?page=N обслуживаются через OFFSET не глубже этой страницы
+PAGINATOR_MAX_OFFSET_PAGE = 50
+# Сколько номеров страниц выводить по обе стороны от текущей
+PAGINATOR_WINDOW_SIZE = 2
+# Посты авторов с большим числом подписчиков подмешиваются в ленту при чтении
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+# Ленту подписчика автора с большим числом публикаций дозаполняет очередь
+TIMELINE_INLINE_BACKFILL_MAX_POSTS = 200
+# Загружаемые картинки постов: лимиты и параметры перекодирования
+POST_IMAGE_MAX_UPLOAD_BYTES = 20 * 2 ** 20
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_SIDE = 1920
+POST_IMAGE_FORMAT = 'JPEG'
+POST_IMAGE_QUALITY = 85
+# Файл больше POST_IMAGE_MAX_UPLOAD_BYTES не дочитывается в память
+FILE_UPLOAD_HANDLERS = [
+    'posts.images.UploadLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Полнотекстовый поиск: 'fts5', 'python' или 'auto' (FTS5, если он есть)
+SEARCH_BACKEND = 'auto'
+# Сколько секунд обратный индекс помнит число публикаций для весов IDF
+SEARCH_DOCUMENTS_CACHE_SEC = 600
+# Бюджет SQL-запросов на ответ (см. core.queries); строгий режим бросает
+# исключение, иначе нарушение пишется в лог
+QUERY_BUDGET_DEFAULT = 30
+QUERY_BUDGETS = {}
+QUERY_BUDGET_MAX_REPEATS = 5
+QUERY_BUDGET_STRICT = DEBUG
+QUERY_BUDGET_IGNORE_NAMESPACES = ('admin', 'djdt')
+# Выборочное профилирование (см. core.profiling): доля запросов, вью,
+# которые профилируются всегда, и заголовок с токеном для ручного запуска
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_VIEWS = ()
+PROFILER_HEADER = 'X-Profile'
+PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN', '')
+PROFILER_DIR = os.path.join(BASE_DIR, 'profiles')
+# Метрики Prometheus (см. core.metrics): каталог, общий для всех процессов,
+# и как часто процесс сбрасывает туда свои данные
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL_SEC = 5
+# Разбивка времени ответа (db, template, cache, thumbnail, total)
+# в заголовке Server-Timing
+SERVER_TIMING = True
+# Журнал запросов core.access: строка JSON на ответ с той же разбивкой;
+# пишется в файл, если задана переменная окружения
+ACCESS_LOG_FILE = os.environ.get('YATUBE_ACCESS_LOG')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'access': {
+            'class': 'logging.FileHandler',
+            'filename': ACCESS_LOG_FILE,
+            'formatter': 'message',
+        } if ACCESS_LOG_FILE else {'class': 'logging.NullHandler'},
+    },
+    'loggers': {
+        'core.access': {
+            'handlers': ['access'],
+            'level': 'INFO' if ACCESS_LOG_FILE else 'WARNING',
+            'propagate': False,
+        },
+    },
+}
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'